@@ -10,7 +10,18 @@ from .physics import (
 )
 from .view import plotEdge2D, plotFace2D, FieldsViewer
 from . import sources
+from . import outputs
 from . import run
+from . import sweep
+from . import pipeline
+from . import futures
+from . import reduced
+from . import transform
+from . import cache
+from . import solvers
+from . import profiling
+from . import estimate
+from . import sensitivity
 from .utils import (
     load_properties, edge3DthetaSlice, face3DthetaSlice, ccv3DthetaSlice
 )
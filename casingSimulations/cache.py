@@ -0,0 +1,629 @@
+from collections import OrderedDict
+import os
+
+import numpy as np
+import scipy.sparse as sp
+
+from .utils import content_hash
+
+
+##############################################################################
+#                                                                            #
+#                                 Defaults                                   #
+#                                                                            #
+##############################################################################
+
+# memory budget for the process-level factorization cache (bytes)
+FACTORIZATION_CACHE_MAX_BYTES = 4e9
+
+# ratio of the number of non-zeros in the factors to the number of non-zeros
+# in the system matrix. Used to estimate the memory of a factorization when
+# the solver does not expose its factors
+FILL_FACTOR = 30.
+
+# directory and size cap (bytes) for the on-disk result cache. The directory
+# can be set with the CASINGSIMULATIONS_CACHE environment variable
+RESULT_CACHE_DIRECTORY = os.environ.get(
+    'CASINGSIMULATIONS_CACHE',
+    os.path.sep.join([os.path.expanduser('~'), '.casingSimulations', 'results'])
+)
+RESULT_CACHE_MAX_BYTES = 20e9
+
+# memory budget for the process-level mesh registry (bytes), and the
+# directory in which the operators of the meshes are persisted. The budget is
+# small so that every process (including sweep, pipeline and job workers)
+# retains little once its simulations are done, raise
+# mesh_cache.max_bytes to keep large 3D meshes between simulations.
+# Persistence is off unless the CASINGSIMULATIONS_MESH_CACHE environment
+# variable is set
+MESH_CACHE_MAX_BYTES = 256e6
+MESH_CACHE_DIRECTORY = os.environ.get('CASINGSIMULATIONS_MESH_CACHE')
+
+# memory budget for the process-level cache of inner product matrices. The
+# cache is only used by simulations with cache_operators=True
+OPERATOR_CACHE_MAX_BYTES = 2e9
+
+# inner product matrices of SimPEG problems that depend on a single physical
+# property, stored on the problem under these names
+PROPERTY_OPERATORS = OrderedDict([
+    ('sigma', ['_MeSigma', '_MeSigmaI', '_MfRho', '_MfRhoI']),
+    ('mu', ['_MeMu', '_MeMuI', '_MfMui', '_MfMuiI']),
+])
+
+
+##############################################################################
+#                                                                            #
+#                                  Caches                                    #
+#                                                                            #
+##############################################################################
+
+class LRUCache(object):
+    """
+    Least recently used cache with a memory budget. Each entry is stored
+    along with its size in bytes and the least recently used entries are
+    evicted once the total exceeds :code:`max_bytes`.
+
+    :param float max_bytes: memory budget for the cache (bytes)
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def nbytes(self):
+        """
+        total size of the entries in the cache (bytes)
+
+        :rtype: float
+        """
+        return sum(nbytes for _, nbytes in self._entries.values())
+
+    def get(self, key, default=None):
+        """
+        Get an entry from the cache and mark it as the most recently used
+
+        :param str key: key of the entry
+        :param default: returned if the key is not in the cache
+        """
+        if key not in self._entries:
+            self.misses += 1
+            return default
+        self.hits += 1
+        entry = self._entries.pop(key)
+        self._entries[key] = entry
+        return entry[0]
+
+    def put(self, key, value, nbytes):
+        """
+        Add an entry to the cache, evicting the least recently used entries
+        if the memory budget is exceeded.
+
+        :param str key: key of the entry
+        :param value: value to store
+        :param float nbytes: size of the value (bytes)
+        :rtype: bool
+        :return: True if the value was stored. Values larger than the budget
+                 are not stored.
+        """
+        if key in self._entries:
+            old_value, _ = self._entries.pop(key)
+            if old_value is not value:
+                self._evict(key, old_value)
+
+        if nbytes > self.max_bytes:
+            return False
+
+        self._entries[key] = (value, nbytes)
+        self.evict()
+        return True
+
+    def pop(self, key):
+        """
+        Remove an entry from the cache and evict it
+
+        :param str key: key of the entry
+        """
+        if key in self._entries:
+            value, _ = self._entries.pop(key)
+            self._evict(key, value)
+
+    def evict(self, max_bytes=None):
+        """
+        Evict the least recently used entries until the cache fits in the
+        memory budget.
+
+        :param float max_bytes: memory budget, defaults to :code:`max_bytes`
+        """
+        if max_bytes is None:
+            max_bytes = self.max_bytes
+        while len(self._entries) > 0 and self.nbytes > max_bytes:
+            key, (value, _) = self._entries.popitem(last=False)
+            self._evict(key, value)
+
+    def clear(self):
+        """
+        Evict all entries
+        """
+        self.evict(max_bytes=-1)
+
+    def _evict(self, key, value):
+        """
+        called when an entry is removed from the cache
+        """
+        pass
+
+
+class FactorizationCache(LRUCache):
+    """
+    Process-level cache of factorized solvers. Evicted solvers are cleaned so
+    the memory held by the factors is released.
+    """
+
+    def _evict(self, key, value):
+        if hasattr(value, 'clean'):
+            value.clean()
+
+
+class ResultCache(object):
+    """
+    Content-addressed, on-disk cache of simulation results. Each result is
+    stored as a :code:`.npy` file named by the hash of the simulation that
+    produced it. The modification time of a file is updated each time it is
+    used and the least recently used results are deleted once the total size
+    exceeds :code:`max_bytes`.
+
+    :param str directory: directory in which results are stored
+    :param float max_bytes: size cap for the cache (bytes)
+    """
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+
+    def filename(self, key):
+        """
+        file in which the result with a given key is stored
+
+        :param str key: hash of the simulation
+        :rtype: str
+        """
+        return os.path.sep.join([self.directory, '{}.npy'.format(key)])
+
+    @property
+    def entries(self):
+        """
+        files in the cache, least recently used first
+
+        :rtype: list
+        """
+        if not os.path.isdir(self.directory):
+            return []
+        files = [
+            os.path.sep.join([self.directory, f])
+            for f in os.listdir(self.directory) if f.endswith('.npy')
+        ]
+        return sorted(files, key=os.path.getmtime)
+
+    @property
+    def nbytes(self):
+        """
+        total size of the results in the cache (bytes)
+
+        :rtype: float
+        """
+        return float(sum(os.path.getsize(f) for f in self.entries))
+
+    def __contains__(self, key):
+        return os.path.isfile(self.filename(key))
+
+    def get(self, key):
+        """
+        Load a result from the cache and mark it as the most recently used
+
+        :param str key: hash of the simulation
+        :rtype: numpy.ndarray
+        :return: the stored result, None if it is not in the cache
+        """
+        f = self.filename(key)
+        if not os.path.isfile(f):
+            return None
+        os.utime(f, None)
+        return np.load(f)
+
+    def put(self, key, value):
+        """
+        Store a result in the cache, deleting the least recently used results
+        if the size cap is exceeded
+
+        :param str key: hash of the simulation
+        :param numpy.ndarray value: result to store
+        :rtype: bool
+        :return: True if the result was stored. Results larger than the size
+                 cap are not stored.
+        """
+        if value.nbytes > self.max_bytes:
+            return False
+
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+
+        # write to a temporary file first so that concurrent runs never see
+        # a partially written result
+        f = self.filename(key)
+        tmp = '{}.{}.tmp'.format(f, os.getpid())
+        with open(tmp, 'wb') as outfile:
+            np.save(outfile, value)
+        os.rename(tmp, f)
+
+        self.evict()
+        return True
+
+    def evict(self, max_bytes=None):
+        """
+        Delete the least recently used results until the cache fits under
+        the size cap
+
+        :param float max_bytes: size cap, defaults to :code:`max_bytes`
+        """
+        if max_bytes is None:
+            max_bytes = self.max_bytes
+
+        entries = self.entries
+        nbytes = sum(os.path.getsize(f) for f in entries)
+        for f in entries:
+            if nbytes <= max_bytes:
+                break
+            nbytes -= os.path.getsize(f)
+            os.remove(f)
+
+    def clear(self):
+        """
+        Delete all results in the cache
+        """
+        self.evict(max_bytes=-1)
+
+
+class MeshCache(LRUCache):
+    """
+    Process-level registry of meshes keyed by the mesh hash of their mesh
+    generator (see :code:`BaseMeshGenerator.mesh_hash`). Mesh generators
+    with the same cell spacings and origin share one mesh instance, along
+    with the face areas, volumes, grids and differential and averaging
+    operators that the mesh computes lazily and stores on itself.
+
+    The size of a mesh grows as its operators are computed, so it is
+    measured each time the memory budget is checked. If a directory is
+    given, the operators computed on a mesh are saved there (see
+    :code:`persist`) and loaded onto the mesh when it is built again, e.g.
+    in another python session.
+
+    Meshes can also be pinned (see :code:`pin`), which keeps them in the
+    registry whatever their size until they are unpinned, e.g. while the
+    workers of a sweep or pipeline share them.
+
+    :param float max_bytes: memory budget for the registry (bytes)
+    :param str directory: directory in which operators are persisted, None
+                          to keep them in memory only
+    """
+
+    def __init__(self, max_bytes, directory=None):
+        super(MeshCache, self).__init__(max_bytes)
+        self.directory = directory
+        self._attributes = {}
+        self._pinned = {}
+
+    def __contains__(self, key):
+        return key in self._entries or key in self._pinned
+
+    @property
+    def nbytes(self):
+        """
+        total size of the meshes and the operators they have computed
+        (bytes)
+
+        :rtype: float
+        """
+        return sum(mesh_nbytes(mesh) for mesh, _ in self._entries.values())
+
+    def mesh(self, meshGenerator):
+        """
+        Mesh of a mesh generator: the registered mesh with the same hash if
+        there is one, otherwise the mesh is built (and its persisted
+        operators loaded) and registered.
+
+        :param casingSimulations.mesh.BaseMeshGenerator meshGenerator: mesh
+            generator
+        :rtype: discretize.BaseMesh
+        """
+        key = meshGenerator.mesh_hash
+        mesh = self._pinned.get(key)
+        if mesh is None:
+            mesh = self.get(key)
+        if mesh is None:
+            mesh = meshGenerator._build_mesh()
+            # attributes set by the constructor, which are not persisted
+            self._attributes[key] = set(vars(mesh).keys())
+            self.load(key, mesh)
+            self.put(key, mesh, mesh_nbytes(mesh))
+        return mesh
+
+    def pin(self, meshGenerators):
+        """
+        Build the meshes of mesh generators and keep them in the registry,
+        outside of the memory budget, until they are unpinned
+
+        :param list meshGenerators: mesh generators
+        :rtype: list
+        :return: hashes of the meshes that were pinned, to pass to
+                 :code:`unpin`
+        """
+        keys = []
+        for meshGenerator in meshGenerators:
+            key = meshGenerator.mesh_hash
+            if key not in self._pinned:
+                self._pinned[key] = self.mesh(meshGenerator)
+                keys.append(key)
+        return keys
+
+    def unpin(self, keys):
+        """
+        Release pinned meshes. Those that are not within the memory budget
+        of the registry are dropped, their operators are persisted first.
+
+        :param list keys: hashes of the meshes returned by :code:`pin`
+        """
+        for key in keys:
+            mesh = self._pinned.pop(key, None)
+            if mesh is not None and key not in self._entries:
+                self._evict(key, mesh)
+
+    def _operators(self, key, mesh):
+        """
+        operators (arrays and sparse matrices) computed on a mesh since it
+        was built
+        """
+        built = self._attributes.get(key, set())
+        return dict(
+            (name, value) for name, value in vars(mesh).items()
+            if name not in built and (
+                isinstance(value, np.ndarray) or sp.issparse(value)
+            )
+        )
+
+    def _directory(self, key):
+        return os.path.sep.join([self.directory, key])
+
+    def load(self, key, mesh):
+        """
+        Load the persisted operators of a mesh onto it
+
+        :param str key: mesh hash
+        :param discretize.BaseMesh mesh: mesh
+        :rtype: list
+        :return: names of the operators that were loaded
+        """
+        if self.directory is None or not os.path.isdir(self._directory(key)):
+            return []
+
+        loaded = []
+        for f in sorted(os.listdir(self._directory(key))):
+            name, ext = os.path.splitext(f)
+            if '.' in name:  # temporary file of a concurrent run
+                continue
+            filename = os.path.sep.join([self._directory(key), f])
+            if ext == '.npy':
+                setattr(mesh, name, np.load(filename))
+            elif ext == '.npz':
+                setattr(mesh, name, sp.load_npz(filename))
+            else:
+                continue
+            loaded.append(name)
+        return loaded
+
+    def persist(self, key=None):
+        """
+        Save the operators computed on registered meshes that are not on
+        disk yet. Does nothing if there is no directory.
+
+        :param str key: mesh hash, defaults to all of the registered meshes
+        :rtype: list
+        :return: names of the operators that were saved
+        """
+        meshes = dict(self._pinned)
+        meshes.update(
+            (key, mesh) for key, (mesh, _) in self._entries.items()
+        )
+        keys = list(meshes.keys()) if key is None else [key]
+        saved = []
+        for key in keys:
+            if key in meshes:
+                saved += self._persist(key, meshes[key])
+        return saved
+
+    def _persist(self, key, mesh):
+        if self.directory is None:
+            return []
+
+        saved = []
+        directory = self._directory(key)
+        for name, value in self._operators(key, mesh).items():
+            ext = '.npz' if sp.issparse(value) else '.npy'
+            f = os.path.sep.join([directory, name + ext])
+            if os.path.isfile(f):
+                continue
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+            # write to a temporary file first so that concurrent runs never
+            # load a partially written operator
+            tmp = '{}.{}.tmp{}'.format(f, os.getpid(), ext)
+            if sp.issparse(value):
+                sp.save_npz(tmp, value.tocsr())
+            else:
+                np.save(tmp, value)
+            os.rename(tmp, f)
+            saved.append(name)
+        return saved
+
+    def _evict(self, key, value):
+        # pinned meshes stay registered until they are unpinned
+        if key in self._pinned:
+            return
+        # evicted meshes keep their operators on disk
+        self._persist(key, value)
+        self._attributes.pop(key, None)
+
+
+class OperatorCache(LRUCache):
+    """
+    Process-level cache of the inner product matrices of SimPEG problems,
+    keyed by the mesh hash and the content hash of the physical property
+    each depends on (see :code:`PROPERTY_OPERATORS`). In a sweep over mu
+    with a fixed sigma (or the reverse), the matrices of the property that
+    does not change are restored onto the problem rather than assembled
+    again.
+    """
+
+    @staticmethod
+    def _property_hash(prb, name):
+        try:
+            value = getattr(prb, name)
+        except AttributeError:
+            return None
+        if value is None:
+            return None
+        return content_hash(np.asarray(value))
+
+    def _keys(self, prb, mesh_hash):
+        keys = []
+        for prop, operators in PROPERTY_OPERATORS.items():
+            property_hash = self._property_hash(prb, prop)
+            if property_hash is None:
+                continue
+            for name in operators:
+                keys.append(
+                    (name, content_hash(mesh_hash, name, property_hash))
+                )
+        return keys
+
+    def store(self, prb, mesh_hash):
+        """
+        Add the inner product matrices that the problem has computed for its
+        current model to the cache
+
+        :param SimPEG.Problem.BaseProblem prb: problem with a model
+        :param str mesh_hash: hash of the mesh of the problem
+        :rtype: list
+        :return: names of the matrices that were added
+        """
+        stored = []
+        for name, key in self._keys(prb, mesh_hash):
+            value = getattr(prb, name, None)
+            if value is None or key in self:
+                continue
+            if self.put(key, value, sparse_nbytes(value)):
+                stored.append(name)
+        return stored
+
+    def restore(self, prb, mesh_hash):
+        """
+        Set the cached inner product matrices for the current model on the
+        problem, so that they are not assembled again
+
+        :param SimPEG.Problem.BaseProblem prb: problem with a model
+        :param str mesh_hash: hash of the mesh of the problem
+        :rtype: list
+        :return: names of the matrices that were restored
+        """
+        restored = []
+        for name, key in self._keys(prb, mesh_hash):
+            if getattr(prb, name, None) is not None:
+                continue
+            value = self.get(key)
+            if value is not None:
+                setattr(prb, name, value)
+                restored.append(name)
+        return restored
+
+
+def sparse_nbytes(A):
+    """
+    Memory used by a sparse matrix (or an array)
+
+    :param scipy.sparse.spmatrix A: matrix
+    :rtype: float
+    """
+    if isinstance(A, np.ndarray):
+        return float(A.nbytes)
+    if A.format not in ['csr', 'csc', 'coo', 'dia', 'bsr']:
+        A = A.tocsr()
+    nbytes = A.data.nbytes
+    for name in ['indices', 'indptr', 'offsets', 'row', 'col']:
+        index = getattr(A, name, None)
+        if isinstance(index, np.ndarray):
+            nbytes += index.nbytes
+    return float(nbytes)
+
+
+def mesh_nbytes(mesh):
+    """
+    Memory held by a mesh: its arrays (including the cell widths, which
+    discretize keeps in a list) and the sparse operators it has computed
+
+    :param discretize.BaseMesh mesh: mesh
+    :rtype: float
+    """
+    nbytes = 0.
+    for value in vars(mesh).values():
+        values = value if isinstance(value, (list, tuple)) else [value]
+        nbytes += sum(
+            sparse_nbytes(v) for v in values
+            if isinstance(v, np.ndarray) or sp.issparse(v)
+        )
+    return nbytes
+
+
+def factorization_nbytes(Ainv, A):
+    """
+    Memory used by a factorization. If the solver reports its memory (the
+    solvers in :code:`casingSimulations.solvers`) or exposes its factors,
+    these are used, otherwise the size is estimated from the number of
+    non-zeros in the system matrix and :code:`FILL_FACTOR`.
+
+    :param Ainv: factorized solver
+    :param scipy.sparse.spmatrix A: system matrix
+    :rtype: float
+    """
+    if hasattr(Ainv, 'nbytes'):
+        return float(Ainv.nbytes)
+
+    itemsize = np.dtype(A.dtype).itemsize + np.dtype(np.int32).itemsize
+
+    lu = getattr(Ainv, 'solver', None)
+    if hasattr(lu, 'L') and hasattr(lu, 'U'):
+        return float((lu.L.nnz + lu.U.nnz) * itemsize)
+
+    return float(A.nnz * FILL_FACTOR * itemsize)
+
+
+factorization_cache = FactorizationCache(
+    max_bytes=FACTORIZATION_CACHE_MAX_BYTES
+)
+
+result_cache = ResultCache(
+    directory=RESULT_CACHE_DIRECTORY, max_bytes=RESULT_CACHE_MAX_BYTES
+)
+
+mesh_cache = MeshCache(
+    max_bytes=MESH_CACHE_MAX_BYTES, directory=MESH_CACHE_DIRECTORY
+)
+
+operator_cache = OperatorCache(max_bytes=OPERATOR_CACHE_MAX_BYTES)
@@ -0,0 +1,176 @@
+import numpy as np
+import scipy.sparse as sp
+
+
+##############################################################################
+#                                                                            #
+#                                 Defaults                                   #
+#                                                                            #
+##############################################################################
+
+# power laws, coefficient * n ** exponent, in the size n of the linear system
+# for the memory of one factorization (bytes), the time of one factorization
+# (s) and the time of one solve (s). These are rough values for Pardiso on a
+# single node, use CostModel.calibrate to fit them to the profiles of runs on
+# your own machine.
+DEFAULT_COST_MODEL = {
+    'factorization_memory': (2e3, 1.1),
+    'factorization_time': (1e-7, 1.5),
+    'solve_time': (1e-8, 1.2),
+}
+
+
+##############################################################################
+#                                                                            #
+#                                Operators                                   #
+#                                                                            #
+##############################################################################
+
+def operator_nnz(mesh, location):
+    """
+    Number of non-zeros in the system matrix of a formulation, computed from
+    the sparsity pattern of the differential operators of the mesh (no
+    physical properties are needed). Diagonal mass matrices are assumed.
+
+    :param discretize.BaseMesh mesh: mesh
+    :param str location: where the unknowns live, 'E' (edges, e and h
+                         formulations), 'F' (faces, b and j formulations) or
+                         'CC' (cell centers, DC)
+    :rtype: int
+    """
+    if location == 'E':
+        C = abs(mesh.edgeCurl)
+        pattern = C.T * C
+    elif location == 'F':
+        C = abs(mesh.edgeCurl)
+        pattern = C * C.T
+    elif location == 'CC':
+        D = abs(mesh.faceDiv)
+        pattern = D * D.T
+    else:
+        raise ValueError(
+            "location must be 'E', 'F' or 'CC', not {}".format(location)
+        )
+    pattern = pattern + sp.identity(pattern.shape[0])
+    return int(pattern.nnz)
+
+
+##############################################################################
+#                                                                            #
+#                                Cost Model                                  #
+#                                                                            #
+##############################################################################
+
+class CostModel(object):
+    """
+    Power-law model of the memory and time used by the factorizations and
+    solves as a function of the size of the linear system.
+
+    :param dict coefficients: {quantity: (coefficient, exponent)} for
+                              'factorization_memory', 'factorization_time'
+                              and 'solve_time', defaults to
+                              :code:`DEFAULT_COST_MODEL`
+    """
+
+    quantities = ['factorization_memory', 'factorization_time', 'solve_time']
+
+    def __init__(self, coefficients=None):
+        self.coefficients = dict(DEFAULT_COST_MODEL)
+        if coefficients is not None:
+            self.coefficients.update(coefficients)
+
+    def __call__(self, quantity, n):
+        """
+        evaluate the model
+
+        :param str quantity: 'factorization_memory', 'factorization_time' or
+                             'solve_time'
+        :param int n: size of the linear system
+        :rtype: float
+        """
+        coefficient, exponent = self.coefficients[quantity]
+        return float(coefficient * n ** exponent)
+
+    @staticmethod
+    def samples(profiles):
+        """
+        samples of each quantity from run profiles (see
+        :code:`casingSimulations.profiling`). The factorization memory is
+        taken from the increase of the peak RSS during the factorizations,
+        divided by the number of factorizations held at once (e.g. all of
+        the frequencies with cached FDEM factorizations).
+
+        :param list profiles: profiles with a system_size
+        :rtype: dict
+        :return: {quantity: [(n, value)]}
+        """
+        samples = dict((quantity, []) for quantity in CostModel.quantities)
+        for profile in profiles:
+            n = profile.get('system_size')
+            phases = profile.get('phases', {})
+            if n is None:
+                continue
+
+            factorization = phases.get('factorization')
+            if factorization is not None and factorization['calls'] > 0:
+                samples['factorization_time'].append(
+                    (n, factorization['wall'] / factorization['calls'])
+                )
+                if factorization.get('rss_increase'):
+                    held = min(
+                        profile.get('concurrent_factorizations') or 1,
+                        factorization['calls']
+                    )
+                    samples['factorization_memory'].append(
+                        (n, factorization['rss_increase'] / held)
+                    )
+
+            solve = phases.get('solve')
+            if solve is not None and solve['calls'] > 0:
+                samples['solve_time'].append(
+                    (n, solve['wall'] / solve['calls'])
+                )
+        return samples
+
+    def calibrate(self, profiles):
+        """
+        Fit the coefficients to the profiles of previous runs with a least
+        squares fit in log-log space. A quantity with samples at a single
+        system size only has its coefficient updated, one without samples
+        keeps its current values.
+
+        :param list profiles: profiles with a system_size
+        :rtype: CostModel
+        """
+        for quantity, samples in self.samples(profiles).items():
+            samples = [(n, value) for n, value in samples if value > 0]
+            if len(samples) == 0:
+                continue
+
+            n, value = [np.log(np.array(x, dtype=float)) for x in zip(*samples)]
+            if len(np.unique(n)) > 1:
+                exponent, log_coefficient = np.polyfit(n, value, 1)
+            else:
+                exponent = self.coefficients[quantity][1]
+                log_coefficient = np.mean(value - exponent * n)
+            self.coefficients[quantity] = (
+                float(np.exp(log_coefficient)), float(exponent)
+            )
+        return self
+
+
+def estimate_summary(estimate):
+    """
+    human readable summary of a simulation estimate
+
+    :param dict estimate: output of :code:`sim.estimate()`
+    :rtype: str
+    """
+    lines = []
+    for key, value in estimate.items():
+        if key.endswith('memory'):
+            value = '{:.2f} GB'.format(value / 1024.**3)
+        elif key.endswith('time'):
+            value = '{:.1f} s'.format(value)
+        lines.append('{:<24} {}'.format(key, value))
+    return '\n'.join(lines)
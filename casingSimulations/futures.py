@@ -0,0 +1,472 @@
+import multiprocessing
+import threading
+import time
+import traceback
+import warnings
+
+try:
+    from queue import Empty
+except ImportError:  # python 2
+    from Queue import Empty
+
+import properties
+
+
+class SubmissionError(Exception):
+    """
+    A submitted simulation failed. The message holds the traceback from the
+    process that ran it.
+    """
+
+
+class CancelledError(Exception):
+    """
+    A submitted simulation was cancelled
+    """
+
+
+def _run_submitted(serialized, messages, num_threads, kwargs):
+    """
+    Run a serialized simulation and report its progress. This is the target
+    of the process that runs a submitted simulation.
+
+    :param dict serialized: serialized simulation
+    :param multiprocessing.Queue messages: queue for (event, value) messages
+    :param int num_threads: threads to use if the simulation does not set
+                            num_threads
+    :param dict kwargs: keyword arguments for :code:`run`
+    """
+    try:
+        simulation = properties.HasProperties.deserialize(
+            serialized, trusted=True
+        )
+        if simulation.num_threads is None:
+            simulation.num_threads = num_threads
+        simulation._phase_callback = (
+            lambda name, event: messages.put((event, name))
+        )
+        simulation.run(save=True, **kwargs)
+        messages.put(('done', simulation.profile))
+    except Exception:
+        messages.put(('failed', traceback.format_exc()))
+
+
+class SimulationFuture(object):
+    """
+    Handle on a simulation submitted with :code:`sim.submit()`. The
+    simulation runs in its own process, so neither the GIL nor the solver
+    block the python session that submitted it.
+
+    The state is one of 'pending' (waiting for a free worker), 'running',
+    'done', 'failed' or 'cancelled'.
+
+    :param BaseSimulation simulation: submitted simulation
+    :param SimulationExecutor executor: executor that runs it
+    :param dict kwargs: keyword arguments for :code:`run`
+    """
+
+    def __init__(self, simulation, executor, kwargs=None):
+        self.simulation = simulation
+        self.executor = executor
+        self.kwargs = kwargs or {}
+        self.state = 'pending'
+        self.phase = None
+        self.error = None
+        self.memory = 0.
+        self._solves = 0
+        self._n_solves = None
+        self._started = None
+        self._finished = None
+        self._process = None
+        self._messages = None
+        self._profile = None
+        self._fields = None
+        self._callbacks = []
+        self._event = threading.Event()
+
+    def __repr__(self):
+        return '<SimulationFuture {} {} ({})>'.format(
+            type(self.simulation).__name__, self.simulation.directory,
+            self.state
+        )
+
+    # ----------------- State ----------------- #
+
+    def running(self):
+        """
+        True if the simulation is running
+        """
+        return self.state == 'running'
+
+    def cancelled(self):
+        """
+        True if the simulation was cancelled
+        """
+        return self.state == 'cancelled'
+
+    def done(self):
+        """
+        True if the simulation finished, failed or was cancelled
+        """
+        return self._event.is_set()
+
+    def progress(self):
+        """
+        progress of the run: the state, the phase that is running (see
+        :code:`sim.profile`), the number of solves that have completed and
+        the elapsed time
+
+        :rtype: dict
+        """
+        if self.state == 'done':
+            fraction = 1.
+        elif self._n_solves:
+            fraction = min(float(self._solves) / self._n_solves, 1.)
+        else:
+            fraction = 0.
+
+        elapsed = None
+        if self._started is not None:
+            elapsed = (self._finished or time.time()) - self._started
+
+        return {
+            'state': self.state,
+            'phase': self.phase,
+            'solves': self._solves,
+            'n_solves': self._n_solves,
+            'fraction': fraction,
+            'elapsed': elapsed,
+        }
+
+    def cancel(self):
+        """
+        Cancel the simulation. A running simulation has its process
+        terminated.
+
+        :rtype: bool
+        :return: True if the simulation was cancelled, False if it had
+                 already finished
+        """
+        return self.executor._cancel(self)
+
+    def add_done_callback(self, fn):
+        """
+        Call :code:`fn(future)` when the simulation finishes, fails or is
+        cancelled. If it already has, fn is called immediately.
+
+        :param callable fn: callback
+        """
+        if self.done():
+            fn(self)
+        else:
+            self._callbacks.append(fn)
+
+    # ----------------- Results ----------------- #
+
+    def wait(self, timeout=None):
+        """
+        Wait for the simulation to finish
+
+        :param float timeout: maximum time to wait (s)
+        :rtype: bool
+        :return: True if the simulation finished
+        """
+        self._event.wait(timeout)
+        return self.done()
+
+    def exception(self, timeout=None):
+        """
+        error raised by the simulation, None if it succeeded
+
+        :param float timeout: maximum time to wait (s)
+        :rtype: Exception
+        """
+        if not self.wait(timeout):
+            raise multiprocessing.TimeoutError(
+                "{} did not finish in {} s".format(self, timeout)
+            )
+        if self.state == 'cancelled':
+            return CancelledError("{} was cancelled".format(self))
+        if self.state == 'failed':
+            return SubmissionError(self.error)
+        return None
+
+    def result(self, timeout=None, mmap_mode=None):
+        """
+        Wait for the simulation to finish and return its fields, which are
+        loaded from the saved fields file and set on the submitted
+        simulation (:code:`sim.fields()`). If the simulation does not save
+        its fields (:code:`save_fields=False`), its outputs are returned
+        instead.
+
+        :param float timeout: maximum time to wait (s)
+        :param str mmap_mode: memory-map the fields file, see
+                              :code:`numpy.load`
+        :rtype: SimPEG.Fields or dict
+        """
+        error = self.exception(timeout)
+        if error is not None:
+            raise error
+        self.simulation._profile = self._profile
+        if not self.simulation.save_fields:
+            return self.simulation.output_results
+        if self._fields is None:
+            self._fields = self.simulation.load_fields(mmap_mode=mmap_mode)
+        return self._fields
+
+    @property
+    def profile(self):
+        """
+        profile of the run, available once it is done
+
+        :rtype: dict
+        """
+        return self._profile
+
+    # ----------------- Executor hooks ----------------- #
+
+    def _start(self, num_threads):
+        try:
+            self._n_solves = self.simulation._solve_counts()['n_solves']
+        except Exception:
+            self._n_solves = None
+        self._messages = multiprocessing.Queue()
+        self._process = multiprocessing.Process(
+            target=_run_submitted,
+            args=(
+                self.simulation.serialize(), self._messages, num_threads,
+                self.kwargs
+            )
+        )
+        self._started = time.time()
+        self.state = 'running'
+        self._process.start()
+
+    def _poll(self):
+        """
+        read the messages from the process
+
+        :rtype: bool
+        :return: True if the simulation has finished
+        """
+        # checked before reading so that the messages sent before the
+        # process exited are read
+        alive = self._process.is_alive()
+        while True:
+            try:
+                event, value = self._messages.get_nowait()
+            except Empty:
+                break
+
+            if event == 'start':
+                self.phase = value
+            elif event == 'end':
+                if value == 'solve':
+                    self._solves += 1
+                elif value == 'parallel solve':
+                    self._solves = self._n_solves or 0
+            elif event == 'done':
+                self._profile = value
+                self._finish('done')
+                return True
+            elif event == 'failed':
+                self.error = value
+                self._finish('failed')
+                return True
+
+        if not alive:
+            # the process exited without reporting, e.g. it was killed
+            self.error = "The process running {} exited with code {}".format(
+                self, self._process.exitcode
+            )
+            self._finish('failed')
+            return True
+        return False
+
+    def _finish(self, state):
+        self.state = state
+        self.phase = None
+        self._finished = time.time()
+        if self._process is not None:
+            self._process.join()
+            self._process = None
+        self._messages = None
+        self._event.set()
+
+        for fn in self._callbacks:
+            try:
+                fn(self)
+            except Exception:
+                warnings.warn(
+                    "A done callback of {} raised:\n{}".format(
+                        self, traceback.format_exc()
+                    )
+                )
+        self._callbacks = []
+
+
+class SimulationExecutor(object):
+    """
+    Runs submitted simulations, each in its own process, with at most
+    :code:`max_workers` at a time. Submissions beyond the limits wait until
+    a running simulation finishes. Each process is started and monitored
+    by a background thread, so submitting does not block the python session
+    (e.g. a Jupyter kernel driving :code:`FieldsViewer` widgets).
+
+    :param int max_workers: maximum number of simulations run at once
+    :param float max_memory: maximum predicted peak memory (GB) of the
+                             simulations run at once, predicted with
+                             :code:`sim.estimate()`. A simulation that is
+                             predicted to need more is run on its own.
+    :param int cores: number of cores, shared by the running simulations
+                      that do not set num_threads, defaults to the number of
+                      cores on the machine
+    :param float poll_interval: time between checks of the running
+                                simulations (s)
+    """
+
+    def __init__(
+        self, max_workers=2, max_memory=None, cores=None, poll_interval=0.2
+    ):
+        self.max_workers = max_workers
+        self.max_memory = max_memory
+        self.cores = cores
+        self.poll_interval = poll_interval
+        self.pending = []
+        self.running = []
+        self._condition = threading.Condition(threading.RLock())
+        self._thread = None
+
+    @property
+    def num_threads(self):
+        """
+        threads used by each simulation that does not set num_threads
+        """
+        cores = self.cores or multiprocessing.cpu_count()
+        return max(cores // self.max_workers, 1)
+
+    def submit(self, simulation, **kwargs):
+        """
+        Submit a simulation to be run
+
+        :param BaseSimulation simulation: simulation
+        :param kwargs: keyword arguments for :code:`run`
+        :rtype: SimulationFuture
+        """
+        kwargs.pop('save', None)
+        future = SimulationFuture(simulation, self, kwargs)
+        if self.max_memory is not None:
+            try:
+                future.memory = simulation.estimate()['peak_memory']
+            except Exception as error:
+                warnings.warn(
+                    "Could not estimate the memory of {}: {}".format(
+                        future, error
+                    )
+                )
+
+        with self._condition:
+            self.pending.append(future)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop)
+                self._thread.daemon = True
+                self._thread.start()
+            self._condition.notify()
+        return future
+
+    def shutdown(self, wait=True, cancel=False):
+        """
+        Stop the executor
+
+        :param bool wait: wait for the running and pending simulations
+        :param bool cancel: cancel the running and pending simulations
+        """
+        if cancel:
+            with self._condition:
+                for future in self.running + self.pending:
+                    self._cancel(future)
+        if wait:
+            for future in self.running + self.pending:
+                future.wait()
+
+    def _fits(self, future):
+        if len(self.running) >= self.max_workers:
+            return False
+        if self.max_memory is None or len(self.running) == 0:
+            return True
+        memory = sum(running.memory for running in self.running)
+        return memory + future.memory <= self.max_memory * 1024.**3
+
+    def _update(self):
+        for future in list(self.running):
+            if future._poll():
+                self.running.remove(future)
+
+        while len(self.pending) > 0 and self._fits(self.pending[0]):
+            future = self.pending.pop(0)
+            self.running.append(future)
+            try:
+                future._start(self.num_threads)
+            except Exception:
+                self.running.remove(future)
+                future.error = traceback.format_exc()
+                future._finish('failed')
+
+    def _loop(self):
+        while True:
+            with self._condition:
+                self._update()
+                if len(self.pending) == 0 and len(self.running) == 0:
+                    self._thread = None
+                    return
+                self._condition.wait(self.poll_interval)
+
+    def _cancel(self, future):
+        with self._condition:
+            if future.done():
+                return False
+            if future in self.pending:
+                self.pending.remove(future)
+            elif future in self.running:
+                future._process.terminate()
+                self.running.remove(future)
+            future._finish('cancelled')
+            self._condition.notify()
+            return True
+
+
+_EXECUTOR = None
+
+
+def get_executor():
+    """
+    executor shared by the submissions of this python session
+
+    :rtype: SimulationExecutor
+    """
+    global _EXECUTOR
+    if _EXECUTOR is None:
+        _EXECUTOR = SimulationExecutor()
+    return _EXECUTOR
+
+
+def set_limits(max_workers=None, max_memory=None, cores=None):
+    """
+    Set the limits of the shared executor. They apply to the simulations
+    started from now on.
+
+    :param int max_workers: maximum number of simulations run at once
+    :param float max_memory: maximum predicted peak memory (GB) of the
+                             simulations run at once
+    :param int cores: number of cores shared by the running simulations
+    :rtype: SimulationExecutor
+    """
+    executor = get_executor()
+    with executor._condition:
+        if max_workers is not None:
+            executor.max_workers = max_workers
+        if max_memory is not None:
+            executor.max_memory = max_memory
+        if cores is not None:
+            executor.cores = cores
+    return executor
@@ -0,0 +1,653 @@
+"""
+Local, on-disk job queue for running directories of simulations.
+
+.. code::
+
+    # queue every simulation bundle below sweeps/
+    python -m casingSimulations.jobs scan sweeps
+
+    # run them, 4 at a time with 2 threads and 8 GB each
+    python -m casingSimulations.jobs run sweeps --workers 4 --threads 2 \\
+        --memory 8 --retries 1
+
+    # or pack them onto the cores and 64 GB of memory by their predicted
+    # memory and runtime
+    python -m casingSimulations.jobs run sweeps --schedule --threads 2 \\
+        --total-memory 64
+
+    # see how far along they are
+    python -m casingSimulations.jobs status sweeps
+
+A bundle is a directory with a :code:`simulation.py` (written by
+:code:`casingSimulations.utils.writeSimulationPy`), which is run as a
+script, or otherwise a :code:`simulationParameters.json`, which is loaded
+and run. Each job runs in its own process. The state of the queue is kept
+in one json file per job in the queue directory (by default
+:code:`.casingQueue` in the root of the tree), so the queue survives
+restarts and can be inspected or edited by hand.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+import warnings
+
+import properties
+
+from .utils import content_hash, THREAD_ENVIRONMENT_VARIABLES
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+
+# names of the files that make up a simulation bundle
+SIMULATION_SCRIPT = 'simulation.py'
+SIMULATION_PARAMETERS = 'simulationParameters.json'
+
+# name of the queue directory in the root of the tree
+QUEUE_DIRECTORY = '.casingQueue'
+
+# marker written to the directory of a bundle once its run has succeeded
+DONE_MARKER = '.casingDone'
+
+STATUSES = ['queued', 'running', 'done', 'failed']
+
+
+def _rss(pid):
+    """
+    resident memory (bytes) of a process and, if psutil is installed, of
+    its child processes. None if it can not be measured on this platform.
+    """
+    if psutil is not None:
+        try:
+            process = psutil.Process(pid)
+            processes = [process] + process.children(recursive=True)
+        except psutil.NoSuchProcess:
+            return 0.
+        rss = 0.
+        for process in processes:
+            try:
+                rss += process.memory_info().rss
+            except psutil.NoSuchProcess:
+                continue
+        return rss
+
+    try:
+        with open('/proc/{}/status'.format(pid)) as infile:
+            for line in infile:
+                if line.startswith('VmRSS:'):
+                    return float(line.split()[1]) * 1024.
+    except (IOError, OSError):
+        pass
+    return None
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except OSError:
+        return False
+    return True
+
+
+def _kill_group(pgid):
+    """
+    kill a process group, e.g. a job and any processes it started
+    """
+    try:
+        os.killpg(pgid, signal.SIGKILL)
+    except OSError:
+        pass
+
+
+class JobQueue(properties.HasProperties):
+    """
+    On-disk queue of simulation bundles that are run as separate processes
+    with a limited number of concurrent workers. Each worker gets a thread
+    budget and a cap on its resident memory, above which it is killed.
+    Failed jobs are retried up to :code:`max_retries` times. A job that
+    succeeds leaves a :code:`DONE_MARKER` in its directory and is skipped
+    from then on.
+    """
+
+    directory = properties.String(
+        "directory in which the state of the queue is stored",
+        required=True
+    )
+
+    workers = properties.Integer(
+        "number of jobs run at once, if not set, the number of cores divided "
+        "by threads",
+        required=False,
+        min=1
+    )
+
+    threads = properties.Integer(
+        "number of threads for each job",
+        default=1,
+        min=1
+    )
+
+    memory = properties.Float(
+        "cap on the resident memory of each job (GB), jobs that exceed it "
+        "are killed",
+        required=False,
+        min=0.
+    )
+
+    max_retries = properties.Integer(
+        "number of times a failed job is retried",
+        default=0,
+        min=0
+    )
+
+    poll_interval = properties.Float(
+        "time between checks on the running jobs (s)",
+        default=1.
+    )
+
+    def __init__(self, **kwargs):
+        super(JobQueue, self).__init__(**kwargs)
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+
+    # ----------------- Queue state ----------------- #
+
+    def _job_file(self, job_id, extension='json'):
+        return os.path.sep.join([
+            self.directory, '{}.{}'.format(job_id, extension)
+        ])
+
+    @property
+    def jobs(self):
+        """
+        all of the jobs in the queue, in the order they were added
+
+        :rtype: list
+        """
+        jobs = []
+        for f in os.listdir(self.directory):
+            if f.endswith('.json'):
+                with open(os.path.sep.join([self.directory, f])) as infile:
+                    jobs.append(json.load(infile))
+        return sorted(jobs, key=lambda job: (job['added'], job['id']))
+
+    def update(self, job, **kwargs):
+        """
+        Update a job and write it to the queue
+
+        :param dict job: job to update
+        """
+        job.update(kwargs)
+        f = self._job_file(job['id'])
+        tmp = '{}.{}.tmp'.format(f, os.getpid())
+        with open(tmp, 'w') as outfile:
+            json.dump(job, outfile, indent=2)
+        os.rename(tmp, f)
+        return job
+
+    def add(self, target):
+        """
+        Add a simulation script or simulation parameters file to the queue.
+        Jobs that are already in the queue are left as they are.
+
+        :param str target: simulation.py or simulationParameters.json
+        :rtype: dict
+        """
+        target = os.path.abspath(target)
+        job_id = content_hash(target)[:12]
+        if os.path.isfile(self._job_file(job_id)):
+            return None
+
+        return self.update({
+            'id': job_id,
+            'target': target,
+            'directory': os.path.dirname(target),
+            'kind': 'script' if target.endswith('.py') else 'parameters',
+            'status': 'queued',
+            'attempts': 0,
+            'added': time.time(),
+        })
+
+    def scan(self, root):
+        """
+        Find the simulation bundles below a directory and add them to the
+        queue. A directory with a simulation.py is run with the script,
+        otherwise its simulationParameters.json is run.
+
+        :param str root: root of the tree to scan
+        :rtype: list
+        :return: the jobs that were added
+        """
+        added = []
+        for directory, dirnames, filenames in os.walk(root):
+            # don't descend into the queue itself
+            dirnames[:] = sorted(
+                d for d in dirnames if d != os.path.basename(self.directory)
+            )
+            if SIMULATION_SCRIPT in filenames:
+                target = SIMULATION_SCRIPT
+            elif SIMULATION_PARAMETERS in filenames:
+                target = SIMULATION_PARAMETERS
+            else:
+                continue
+            job = self.add(os.path.sep.join([directory, target]))
+            if job is not None:
+                added.append(job)
+        print('Queued {} new jobs from {}'.format(len(added), root))
+        return added
+
+    def reset(self, statuses=None):
+        """
+        Put jobs back in the queue
+
+        :param list statuses: statuses of the jobs to reset, defaults to
+                              failed jobs
+        """
+        if statuses is None:
+            statuses = ['failed']
+        for job in self.jobs:
+            if job['status'] in statuses:
+                self.update(job, status='queued', attempts=0)
+
+    # ----------------- Locks ----------------- #
+
+    def _claim(self, job):
+        """
+        take the lock on a job so that only one runner starts it
+        """
+        f = self._job_file(job['id'], 'lock')
+        try:
+            fd = os.open(f, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except OSError:
+            return False
+        with os.fdopen(fd, 'w') as outfile:
+            json.dump({'host': socket.gethostname(), 'pid': os.getpid()}, outfile)
+        return True
+
+    def _release(self, job):
+        f = self._job_file(job['id'], 'lock')
+        if os.path.isfile(f):
+            os.remove(f)
+
+    def _recover(self):
+        """
+        put jobs that were running when a runner on this host died back in
+        the queue
+        """
+        host = socket.gethostname()
+        for job in self.jobs:
+            f = self._job_file(job['id'], 'lock')
+            if job['status'] != 'running' or not os.path.isfile(f):
+                continue
+            with open(f) as infile:
+                lock = json.load(infile)
+            if lock['host'] == host and not _pid_alive(lock['pid']):
+                # the job's process can outlive its runner, kill it so the
+                # job does not run twice in the same directory
+                if job.get('pgid') is not None and job.get('host') == host:
+                    _kill_group(job['pgid'])
+                os.remove(f)
+                self.update(job, status='queued')
+
+    # ----------------- Running ----------------- #
+
+    @staticmethod
+    def _marker(job):
+        return os.path.sep.join([job['directory'], DONE_MARKER])
+
+    @classmethod
+    def completed(cls, job):
+        """
+        True if the job has run to completion, i.e. its done marker exists.
+        A fields file alone is not enough: streamed and checkpointed runs
+        create theirs before they finish.
+
+        :param dict job: job
+        :rtype: bool
+        """
+        return os.path.isfile(cls._marker(job))
+
+    def _command(self, job):
+        if job['kind'] == 'script':
+            return [sys.executable, os.path.basename(job['target'])]
+        return [
+            sys.executable, '-m', 'casingSimulations.jobs', 'run-one',
+            job['target'], '--threads', str(self.threads)
+        ]
+
+    def _start(self, job):
+        """
+        start a job in its own process
+        """
+        env = dict(os.environ)
+        for key in THREAD_ENVIRONMENT_VARIABLES:
+            env[key] = str(self.threads)
+
+        # the job is not complete until it succeeds again
+        if os.path.isfile(self._marker(job)):
+            os.remove(self._marker(job))
+
+        # start the job in its own session, and so its own process group,
+        # so that it can be killed along with any processes it starts
+        kwargs = {}
+        if hasattr(os, 'setsid'):
+            kwargs['preexec_fn'] = os.setsid
+
+        log = open(self._job_file(job['id'], 'log'), 'a')
+        process = subprocess.Popen(
+            self._command(job), cwd=job['directory'], env=env,
+            stdout=log, stderr=subprocess.STDOUT, **kwargs
+        )
+        self.update(
+            job, status='running', attempts=job['attempts'] + 1,
+            started=time.time(), host=socket.gethostname(), pid=process.pid,
+            pgid=process.pid if 'preexec_fn' in kwargs else None
+        )
+        print('   started {} ({})'.format(job['id'], job['target']))
+        return process, log
+
+    def _finish(self, job, returncode):
+        """
+        record the outcome of a job, requeueing it if it can be retried
+        """
+        elapsed = time.time() - job['started']
+        if returncode == 0:
+            status = 'done'
+            with open(self._marker(job), 'w') as outfile:
+                json.dump({'id': job['id'], 'finished': time.time()}, outfile)
+        elif job['attempts'] <= self.max_retries:
+            status = 'queued'
+        else:
+            status = 'failed'
+        self.update(
+            job, status=status, returncode=returncode, elapsed=elapsed,
+            finished=time.time()
+        )
+        self._release(job)
+        print('   {} {} (exit code {}). Elapsed time : {}'.format(
+            job['id'], status, returncode, elapsed
+        ))
+        return status
+
+    def _check_memory(self, job, process):
+        """
+        kill a job whose resident memory exceeds the memory cap
+
+        :rtype: bool
+        :return: True if the job was killed
+        """
+        if self.memory is None:
+            return False
+        rss = _rss(process.pid)
+        if rss is None:
+            if not getattr(self, '_warned_memory', False):
+                warnings.warn(
+                    "The memory of the jobs can not be measured on this "
+                    "platform (install psutil), the memory cap is not applied"
+                )
+                self._warned_memory = True
+            return False
+        if rss <= self.memory * 1024.**3:
+            return False
+
+        if job.get('pgid') is not None:
+            _kill_group(job['pgid'])
+        else:
+            process.kill()
+        self.update(job, killed='memory', peak_rss=rss)
+        print('   killed {}, {:.2f} GB exceeds the {:.2f} GB cap'.format(
+            job['id'], rss / 1024.**3, self.memory
+        ))
+        return True
+
+    def _select(self, pending, running):
+        """
+        choose the jobs to start from the pending jobs given the jobs that
+        are running
+        """
+        n = self._n_workers - len(running)
+        return pending[:max(n, 0)]
+
+    @property
+    def _n_workers(self):
+        if self.workers is not None:
+            return self.workers
+        return max(multiprocessing.cpu_count() // self.threads, 1)
+
+    def run(self, force=False):
+        """
+        Run the queued jobs
+
+        :param bool force: rerun jobs that are done or already complete
+        :rtype: dict
+        :return: number of jobs with each status
+        """
+        self._recover()
+        if force:
+            self.reset(statuses=['done', 'failed'])
+
+        pending = []
+        for job in self.jobs:
+            if job['status'] != 'queued':
+                continue
+            if not force and self.completed(job):
+                self.update(job, status='done', skipped=True)
+                print('   skipping {}, already complete'.format(job['id']))
+                continue
+            pending.append(job)
+
+        print('Running {} jobs with {} workers, {} threads each'.format(
+            len(pending), self._n_workers, self.threads
+        ))
+
+        t = time.time()
+        running = {}
+        while len(pending) > 0 or len(running) > 0:
+            for job in self._select(pending, running):
+                pending.remove(job)
+                if self._claim(job):
+                    running[job['id']] = (job,) + self._start(job)
+
+            time.sleep(self.poll_interval)
+            for job_id, (job, process, log) in list(running.items()):
+                returncode = process.poll()
+                if returncode is None and self._check_memory(job, process):
+                    returncode = process.wait()
+                if returncode is None:
+                    continue
+                log.close()
+                running.pop(job_id)
+                if self._finish(job, returncode) == 'queued':
+                    pending.append(job)
+
+        print('Done. Elapsed time : {}'.format(time.time() - t))
+        return self.status()
+
+    # ----------------- Status ----------------- #
+
+    def status(self):
+        """
+        number of jobs with each status
+
+        :rtype: dict
+        """
+        counts = dict((status, 0) for status in STATUSES)
+        for job in self.jobs:
+            counts[job['status']] += 1
+        return counts
+
+    def summary(self):
+        """
+        table of the jobs in the queue
+
+        :rtype: str
+        """
+        lines = ['{:<12} {:<8} {:>8} {:>10}  {}'.format(
+            'id', 'status', 'attempts', 'elapsed', 'target'
+        )]
+        for job in self.jobs:
+            elapsed = job.get('elapsed')
+            lines.append('{:<12} {:<8} {:>8} {:>10}  {}'.format(
+                job['id'], job['status'], job['attempts'],
+                '-' if elapsed is None else '{:.1f}'.format(elapsed),
+                job['target']
+            ))
+        counts = self.status()
+        lines.append(', '.join(
+            '{} {}'.format(counts[status], status) for status in STATUSES
+        ))
+        return '\n'.join(lines)
+
+
+def load_parameters(filename):
+    """
+    Load a simulation from the parameters file of a bundle. The saved
+    directory is relative to wherever the simulation was created, so it is
+    replaced with the directory of the file before the simulation is
+    created (which makes its directory).
+
+    :param str filename: simulationParameters.json
+    :rtype: casingSimulations.run.BaseSimulation
+    """
+    with open(filename, 'r') as infile:
+        jsondict = json.load(infile)
+    jsondict['directory'] = os.path.dirname(os.path.abspath(filename))
+    return properties.HasProperties.deserialize(jsondict, trusted=True)
+
+
+def run_parameters(filename, threads=None):
+    """
+    Load a simulation from its parameters file and run it
+
+    :param str filename: simulationParameters.json
+    :param int threads: number of threads
+    """
+    simulation = load_parameters(filename)
+    if threads is not None:
+        simulation.num_threads = threads
+    simulation.run()
+
+
+def main(args=None):
+    """
+    command line interface to the job queue
+    """
+    parser = argparse.ArgumentParser(
+        prog='casingSimulations.jobs',
+        description="Queue and run directories of casing simulations"
+    )
+    subparsers = parser.add_subparsers(dest='command')
+
+    def add_queue_arguments(subparser):
+        subparser.add_argument('root', help="root of the tree of simulations")
+        subparser.add_argument(
+            '--queue', default=None,
+            help="queue directory (default: ROOT/{})".format(QUEUE_DIRECTORY)
+        )
+
+    add_queue_arguments(subparsers.add_parser(
+        'scan', help="add the simulation bundles below ROOT to the queue"
+    ))
+
+    run_parser = subparsers.add_parser(
+        'run', help="scan ROOT and run the queued simulations"
+    )
+    add_queue_arguments(run_parser)
+    run_parser.add_argument(
+        '--workers', type=int, default=None,
+        help="number of simulations run at once (default: cores / threads)"
+    )
+    run_parser.add_argument(
+        '--threads', type=int, default=1, help="threads per simulation"
+    )
+    run_parser.add_argument(
+        '--memory', type=float, default=None,
+        help="cap on the resident memory of each simulation (GB)"
+    )
+    run_parser.add_argument(
+        '--retries', type=int, default=0,
+        help="number of times a failed simulation is retried"
+    )
+    run_parser.add_argument(
+        '--force', action='store_true',
+        help="rerun simulations that are already complete"
+    )
+    run_parser.add_argument(
+        '--schedule', action='store_true',
+        help="pack the simulations onto the cores and memory by their "
+        "predicted memory and runtime"
+    )
+    run_parser.add_argument(
+        '--total-memory', type=float, default=None,
+        help="memory available to all of the simulations when scheduling "
+        "(GB, default: 90%% of the physical memory)"
+    )
+    run_parser.add_argument(
+        '--cores', type=int, default=None,
+        help="cores available to all of the simulations when scheduling"
+    )
+
+    status_parser = subparsers.add_parser(
+        'status', help="summary of the queue"
+    )
+    add_queue_arguments(status_parser)
+
+    reset_parser = subparsers.add_parser(
+        'reset', help="put failed simulations back in the queue"
+    )
+    add_queue_arguments(reset_parser)
+
+    one_parser = subparsers.add_parser(
+        'run-one', help="run a single simulationParameters.json"
+    )
+    one_parser.add_argument('filename')
+    one_parser.add_argument('--threads', type=int, default=None)
+
+    args = parser.parse_args(args)
+
+    if args.command == 'run-one':
+        run_parameters(args.filename, threads=args.threads)
+        return
+    elif args.command is None:
+        parser.print_help()
+        return
+
+    Queue = JobQueue
+    if args.command == 'run' and args.schedule:
+        from .scheduler import Scheduler as Queue
+
+    queue = Queue(
+        directory=(
+            args.queue if args.queue is not None else
+            os.path.sep.join([args.root, QUEUE_DIRECTORY])
+        )
+    )
+
+    if args.command in ['scan', 'run']:
+        queue.scan(args.root)
+
+    if args.command == 'run':
+        queue.workers = args.workers
+        queue.threads = args.threads
+        queue.memory = args.memory
+        queue.max_retries = args.retries
+        if args.schedule:
+            queue.total_memory = args.total_memory
+            queue.cores = args.cores
+        queue.run(force=args.force)
+    elif args.command == 'reset':
+        queue.reset()
+
+    print(queue.summary())
+
+
+if __name__ == '__main__':
+    main()
@@ -14,6 +14,8 @@ from discretize.utils import mkvc
 
 from . import model
 from .base import BaseCasing
+from .cache import mesh_cache
+from .utils import content_hash
 # __all__ = [TensorMeshGenerator, CylMeshGenerator]
 
 
@@ -53,17 +55,47 @@ class BaseMeshGenerator(BaseCasing):
     @property
     def mesh(self):
         """
-        discretize mesh
+        discretize mesh. Mesh generators with the same mesh hash share one
+        mesh from the process-level mesh registry
+        (:code:`casingSimulations.cache.mesh_cache`), so the operators it
+        computes are reused across simulations. The registry keeps meshes
+        up to a small memory budget (:code:`mesh_cache.max_bytes`, 256 MB).
+        Larger meshes are not kept in the registry, but sweeps and pipelines
+        still share them between their simulations.
 
         :rtype: discretize.BaseMesh
         """
         if getattr(self, '_mesh', None) is None:
-            self._mesh = self._discretizePair(
-                [self.hx, self.hy, self.hz],
-                x0=self.x0
-            )
+            self._mesh = mesh_cache.mesh(self)
         return self._mesh
 
+    def _build_mesh(self):
+        """
+        build a new discretize mesh, bypassing the mesh registry
+
+        :rtype: discretize.BaseMesh
+        """
+        return self._discretizePair(
+            [self.hx, self.hy, self.hz],
+            x0=self.x0
+        )
+
+    @property
+    def mesh_hash(self):
+        """
+        hash of the mesh type, cell spacings and origin. Mesh generators with
+        the same hash produce identical meshes.
+
+        :rtype: str
+        """
+        return content_hash(
+            self._discretizePair.__name__,
+            np.asarray(self.hx, dtype=float),
+            np.asarray(self.hy, dtype=float),
+            np.asarray(self.hz, dtype=float),
+            np.asarray(self.x0, dtype=float)
+        )
+
     def copy(self):
         """
         Make a copy of the object
@@ -642,6 +642,23 @@ class FlawedCasingMixin(CasingMixin):
             self._indices_flaw_z(mesh)
         )
 
+    def baseline(self):
+        """
+        model parameters of the same casing without the flaw, e.g. a
+        :code:`CasingInHalfspace` for a :code:`FlawedCasingInHalfspace`
+
+        :rtype: Wholespace
+        """
+        Baseline = [
+            cls for cls in type(self).__mro__[1:]
+            if issubclass(cls, Wholespace) and
+            not issubclass(cls, FlawedCasingMixin)
+        ][0]
+        return Baseline(**dict(
+            (name, getattr(self, name)) for name in Baseline._props
+            if getattr(self, name) is not None
+        ))
+
     def add_sigma_casing(self, mesh, sigma):
         """
         add the conductivity of the casing to the provided conductivity model
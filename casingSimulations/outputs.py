@@ -0,0 +1,319 @@
+from collections import OrderedDict
+
+import numpy as np
+import properties
+
+from .physics import casing_current_operator
+from .utils import face3DthetaSlice, edge3DthetaSlice, ccv3DthetaSlice
+
+
+def field_location(fields, field):
+    """
+    where a field lives on the mesh: 'CC', 'N', 'F' or 'E'
+
+    :param SimPEG.Fields fields: fields
+    :param str field: name of the field, e.g. 'j'
+    :rtype: str
+    """
+    if field in fields.knownFields:
+        return fields.knownFields[field]
+    if field in fields.aliasFields:
+        return fields.aliasFields[field][1]
+    raise KeyError(
+        "{} is not a field of {}. The fields are {}".format(
+            field, type(fields).__name__,
+            sorted(
+                list(fields.knownFields.keys()) +
+                list(fields.aliasFields.keys())
+            )
+        )
+    )
+
+
+def _columns(data):
+    """
+    field data as a 2D array with a column per source (and time)
+    """
+    data = np.asarray(data)
+    return data.reshape(data.shape[0], -1)
+
+
+def _cell_centers(mesh, location, data):
+    """
+    field data averaged to the cell centers
+    """
+    if location == 'F':
+        return mesh.aveF2CCV * data
+    elif location == 'E':
+        return mesh.aveE2CCV * data
+    elif location == 'N':
+        return mesh.aveN2CC * data
+    return data
+
+
+class BaseOutput(properties.HasProperties):
+    """
+    Output request: a quantity that is evaluated from the fields right after
+    the solve and saved to the outputs file of the simulation, so the full
+    fields do not need to be stored. Outputs are evaluated one chunk of
+    sources (or times) at a time.
+    """
+
+    name = properties.String(
+        "name of the output, used as the prefix of its arrays in the outputs "
+        "file",
+        required=True
+    )
+
+    field = properties.String(
+        "field the output is computed from, e.g. 'j', 'e', 'b', 'h'",
+        default="j"
+    )
+
+    def __init__(self, **kwargs):
+        super(BaseOutput, self).__init__(**kwargs)
+
+    def coordinates(self, simulation, location):
+        """
+        Arrays of the output that do not depend on the sources, e.g. depths
+        or locations
+
+        :param casingSimulations.run.BaseSimulation simulation: simulation
+        :param str location: where the field lives on the mesh
+        :rtype: dict
+        """
+        return OrderedDict()
+
+    def evaluate(self, simulation, location, data):
+        """
+        Evaluate the output for a chunk of the fields
+
+        :param casingSimulations.run.BaseSimulation simulation: simulation
+        :param str location: where the field lives on the mesh
+        :param numpy.ndarray data: field, with a column per source (and
+                                   time) of the chunk
+        :rtype: dict
+        :return: arrays of the output with a column per column of data
+        """
+        raise NotImplementedError
+
+
+class CasingCurrents(BaseOutput):
+    """
+    Current (A) in the casing as a function of depth, see
+    :code:`casingSimulations.physics.casing_currents`
+    """
+
+    name = properties.String(
+        "name of the output",
+        default="casing_currents"
+    )
+
+    component = properties.StringChoice(
+        "'z' for the vertical current, 'x' for the radial current",
+        default="z",
+        choices=["x", "z"]
+    )
+
+    def _operator(self, simulation, location):
+        if location != 'F':
+            raise ValueError(
+                "Casing currents are computed from a field on faces, {} is "
+                "not".format(self.field)
+            )
+        return casing_current_operator(
+            simulation.meshGenerator.mesh, simulation.modelParameters
+        )[self.component]
+
+    def coordinates(self, simulation, location):
+        z, P = self._operator(simulation, location)
+        return OrderedDict([('z', z)])
+
+    def evaluate(self, simulation, location, data):
+        z, P = self._operator(simulation, location)
+        return OrderedDict([('currents', P * data)])
+
+
+class ThetaSlice(BaseOutput):
+    """
+    Slice of a field at an azimuth of a cylindrical mesh, see
+    :code:`casingSimulations.utils.face3DthetaSlice`
+    """
+
+    name = properties.String(
+        "name of the output",
+        default="theta_slice"
+    )
+
+    theta_ind = properties.Integer(
+        "index of the theta slice",
+        default=0,
+        min=0
+    )
+
+    def coordinates(self, simulation, location):
+        mesh = simulation.meshGenerator.mesh
+        return OrderedDict([('theta', mesh.vectorCCy[self.theta_ind])])
+
+    def evaluate(self, simulation, location, data):
+        mesh = simulation.meshGenerator.mesh
+
+        if location == 'F':
+            slice_ = face3DthetaSlice
+        elif location == 'E':
+            slice_ = edge3DthetaSlice
+        elif location == 'CC' and data.shape[0] == mesh.nC:
+            def slice_(mesh, v, theta_ind):
+                return v.reshape(mesh.vnC, order='F')[:, theta_ind, :]
+        elif location == 'CC':
+            slice_ = ccv3DthetaSlice
+        else:
+            raise ValueError(
+                "Theta slices of fields on {} are not supported".format(
+                    location
+                )
+            )
+
+        return OrderedDict([
+            ('values', np.column_stack([
+                np.asarray(slice_(mesh, data[:, i], self.theta_ind)).ravel(
+                    order='F'
+                )
+                for i in range(data.shape[1])
+            ])),
+        ])
+
+
+class DepthSlice(BaseOutput):
+    """
+    Field averaged to the cell centers of the layer of cells closest to a
+    depth, e.g. the surface. Vector fields have their x, y, z components
+    stacked.
+    """
+
+    name = properties.String(
+        "name of the output",
+        default="depth_slice"
+    )
+
+    z = properties.Float(
+        "depth of the slice",
+        default=0.
+    )
+
+    def _layer(self, mesh):
+        iz = np.argmin(np.abs(mesh.vectorCCz - self.z))
+        return mesh.gridCC[:, 2] == mesh.vectorCCz[iz]
+
+    def coordinates(self, simulation, location):
+        mesh = simulation.meshGenerator.mesh
+        return OrderedDict([('locations', mesh.gridCC[self._layer(mesh), :])])
+
+    def evaluate(self, simulation, location, data):
+        mesh = simulation.meshGenerator.mesh
+        data = _cell_centers(mesh, location, data)
+        n_components = data.shape[0] // mesh.nC
+
+        layer = self._layer(mesh)
+        inds = np.hstack([
+            np.where(layer)[0] + i * mesh.nC for i in range(n_components)
+        ])
+        return OrderedDict([('values', data[inds, :])])
+
+
+class Points(BaseOutput):
+    """
+    Field interpolated to points (e.g. receivers) from the cell centers.
+    Vector fields have their x, y, z components stacked.
+    """
+
+    name = properties.String(
+        "name of the output",
+        default="points"
+    )
+
+    locations = properties.Array(
+        "locations of the points in the coordinates of the mesh",
+        shape=('*', 3),
+        required=True
+    )
+
+    def coordinates(self, simulation, location):
+        return OrderedDict([('locations', self.locations)])
+
+    def evaluate(self, simulation, location, data):
+        mesh = simulation.meshGenerator.mesh
+        data = _cell_centers(mesh, location, data)
+        n_components = data.shape[0] // mesh.nC
+
+        P = mesh.getInterpolationMat(self.locations, 'CC')
+        return OrderedDict([
+            ('values', np.vstack([
+                P * data[i * mesh.nC:(i + 1) * mesh.nC, :]
+                for i in range(n_components)
+            ])),
+        ])
+
+
+def evaluate_outputs(simulation, fields, outputs, shape, chunks):
+    """
+    Evaluate output requests one chunk of the fields at a time, so the
+    derived fields (e.g. the current density) are never all in memory at
+    once, and streamed fields are read back one chunk at a time. Each chunk
+    is evaluated for all of the outputs before the next one is produced, so
+    the chunks can be solved as they are asked for.
+
+    :param casingSimulations.run.BaseSimulation simulation: simulation
+    :param SimPEG.Fields fields: fields object of the simulation, used for
+                                 the locations of the fields
+    :param list outputs: output requests
+    :param tuple shape: trailing shape of the fields, (nSrc,) or
+                        (nSrc, nT)
+    :param chunks: iterable of (indices, data) tuples, where the indices
+                   select along the last axis of the shape and data is a
+                   function of the name of a field that returns the field
+                   for those indices
+    :rtype: dict
+    :return: {'<name>_<array>': array}
+    """
+    locations = [field_location(fields, output.field) for output in outputs]
+    values = [OrderedDict() for output in outputs]
+
+    for index, data in chunks:
+        chunk_shape = tuple(shape[:-1]) + (len(index),)
+        for output, location, output_values in zip(
+            outputs, locations, values
+        ):
+            evaluated = output.evaluate(
+                simulation, location, _columns(data(output.field))
+            )
+            for key, value in evaluated.items():
+                value = np.asarray(value)
+                if key not in output_values:
+                    output_values[key] = np.zeros(
+                        (value.shape[0],) + tuple(shape), dtype=value.dtype
+                    )
+                output_values[key][..., index] = value.reshape(
+                    (value.shape[0],) + chunk_shape
+                )
+        # drop the chunk before the next one is produced
+        data = None
+
+    results = OrderedDict()
+    for output, location, output_values in zip(outputs, locations, values):
+        for key, value in output.coordinates(simulation, location).items():
+            results['{}_{}'.format(output.name, key)] = np.asarray(value)
+        for key, value in output_values.items():
+            results['{}_{}'.format(output.name, key)] = value
+    return results
+
+
+def load_outputs(filename):
+    """
+    Load the outputs saved by a simulation
+
+    :param str filename: outputs file (npz)
+    :rtype: dict
+    """
+    with np.load(filename) as npz:
+        return OrderedDict((key, npz[key]) for key in npz.files)
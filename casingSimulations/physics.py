@@ -2,6 +2,7 @@ from SimPEG import Utils
 import discretize
 
 import numpy as np
+import scipy.sparse as sp
 
 import matplotlib.pyplot as plt
 from matplotlib.colors import LogNorm
@@ -64,6 +65,58 @@ def casing_currents(j, mesh, model_parameters):
 
     return {"x": (z_ix, ixCasing[ix_inds]), "z": (z_iz, izCasing[iz_inds])}
 
+
+def casing_current_operator(mesh, model_parameters):
+    """
+    Sparse matrices that compute the current (A) within the casing from the
+    current density on the faces of the mesh, i.e. the linear map applied
+    by :code:`casing_currents`. These are used to compute sensitivities of
+    the casing currents, see :code:`casingSimulations.sensitivity`.
+
+    :param discretize.BaseMesh mesh: the discretize mesh which the casing is on
+    :param casingSimulations.model.BaseCasingParametersMixin: a model with
+                                                              casing
+
+    :return: :code:`{"x": (z_ix, Px), "z": (z_iz, Pz)}`, where
+             :code:`Px * j` is the radial current at the depths z_ix and
+             :code:`Pz * j` is the vertical current at the depths z_iz
+    """
+    casing_a = model_parameters.casing_a
+    casing_b = model_parameters.casing_b
+    casing_z = model_parameters.casing_z
+
+    def operator(grid, vnF, offset, vectorZ):
+        casing_faces = np.where(
+            (grid[:, 0] >= casing_a) &
+            (grid[:, 0] <= casing_b) &
+            (grid[:, 2] <= casing_z[1]) &
+            (grid[:, 2] >= casing_z[0])
+        )[0]
+
+        # faces are ordered x fastest, z slowest
+        iz = casing_faces // (vnF[0] * vnF[1])
+        inds = (vectorZ > casing_z[0]) & (vectorZ < casing_z[1])
+        row = -np.ones(len(vectorZ), dtype=int)
+        row[inds] = np.arange(inds.sum())
+
+        keep = row[iz] >= 0
+        P = sp.csr_matrix(
+            (
+                mesh.area[offset + casing_faces[keep]],
+                (row[iz[keep]], offset + casing_faces[keep])
+            ),
+            shape=(inds.sum(), mesh.nF)
+        )
+        return vectorZ[inds], P
+
+    return {
+        "x": operator(mesh.gridFx, mesh.vnFx, 0, mesh.vectorCCz),
+        "z": operator(
+            mesh.gridFz, mesh.vnFz, mesh.nFx + mesh.nFy, mesh.vectorNz
+        ),
+    }
+
+
 def casing_charges(charge, mesh, model_parameters):
     casing_inds = (
         (mesh.gridCC[:, 0] >= -model_parameters.casing_b-mesh.hx.min()) &
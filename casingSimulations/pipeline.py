@@ -0,0 +1,305 @@
+from collections import OrderedDict
+import json
+import multiprocessing
+import os
+import time
+import traceback
+
+import numpy as np
+import properties
+
+from .cache import mesh_cache
+from .run import BaseSimulation, SimulationDC
+from .utils import content_hash
+
+
+# physical properties shared between the stages of a pipeline, keyed by
+# their hash. These, and the meshes pinned in the mesh registry
+# (casingSimulations.cache.mesh_cache), are built in the parent process
+# before the pool is created so that forked workers inherit them.
+_SHARED = {}
+
+
+def _physprops_hash(simulation):
+    """
+    hash of the mesh and model that determine the physical properties of a
+    simulation
+    """
+    return content_hash(
+        simulation.meshGenerator.mesh_hash,
+        simulation.modelParameters.serialize()
+    )
+
+
+def _share(simulation):
+    """
+    give a simulation the mesh from the mesh registry and the shared
+    physical properties, adding its own if there are none yet
+    """
+    simulation.share_mesh(simulation.meshGenerator.mesh)
+
+    physprops_hash = _physprops_hash(simulation)
+    if physprops_hash not in _SHARED:
+        _SHARED[physprops_hash] = simulation.physprops
+    simulation._physprops = _SHARED[physprops_hash]
+
+
+class PipelineError(Exception):
+    """
+    One or more stages of a pipeline failed. The message holds the
+    traceback of each failed stage.
+    """
+
+
+def _run_stage(task):
+    """
+    Run a stage of a pipeline. This is called on the worker processes of a
+    parallel pipeline.
+
+    :param tuple task: (name, serialized simulation)
+    :rtype: dict
+    :return: timing of the stage
+    """
+    name, serialized = task
+    simulation = properties.HasProperties.deserialize(serialized, trusted=True)
+    return _run_simulation(name, simulation)
+
+
+def _run_simulation(name, simulation):
+    t = time.time()
+    timing = OrderedDict([
+        ('stage', name),
+        ('simulation', type(simulation).__name__),
+        ('fields', os.path.sep.join([
+            simulation.directory, simulation.fields_filename
+        ])),
+    ])
+    try:
+        _share(simulation)
+        simulation.run(save=True)
+        timing['status'] = 'done'
+        timing['profile'] = simulation.profile
+    except Exception:
+        timing['status'] = 'failed'
+        timing['error'] = traceback.format_exc()
+    timing['elapsed'] = time.time() - t
+    return timing
+
+
+class Pipeline(properties.HasProperties):
+    """
+    Run several simulations of the same casing model (e.g. 3D EM, 2D EM and
+    DC) in one process, or in parallel across processes, instead of one
+    after another in a generated simulation.py.
+
+    Stages that use the same mesh share a single mesh instance, and with it
+    the differential operators and inner products that discretize caches on
+    the mesh. Stages that also have the same model share their physical
+    properties. Each stage writes its own fields and profile, and the
+    pipeline writes a combined timing report.
+    """
+
+    simulations = properties.List(
+        "simulations run by the pipeline, in order",
+        properties.Instance("a simulation", BaseSimulation),
+        required=True
+    )
+
+    names = properties.List(
+        "name of each stage",
+        properties.String("name of the stage"),
+        required=False
+    )
+
+    directory = properties.String(
+        "directory for the timing report",
+        default="."
+    )
+
+    timing_filename = properties.String(
+        "filename for the combined timing report",
+        default="pipelineTiming.json"
+    )
+
+    n_procs = properties.Integer(
+        "number of processes the stages are distributed over",
+        default=1,
+        min=1
+    )
+
+    def __init__(self, **kwargs):
+        super(Pipeline, self).__init__(**kwargs)
+
+    @classmethod
+    def from_simulation(
+        cls, simulation, include2D=True, includeDC=True, **kwargs
+    ):
+        """
+        Create the pipeline that :code:`writeSimulationPy` used to write out
+        as a script: the simulation, a cylindrically symmetric 2D copy of it
+        and a DC simulation with the same source electrodes.
+
+        :param BaseSimulation simulation: 3D EM simulation with a single
+                                          source
+        :param bool include2D: include a 2D simulation
+        :param bool includeDC: include a DC simulation
+        :rtype: Pipeline
+        """
+        simulations = [simulation]
+        names = ['3D']
+
+        if include2D:
+            meshGenerator = simulation.meshGenerator
+            if hasattr(meshGenerator, 'create_2D_mesh'):
+                mesh2D = meshGenerator.create_2D_mesh()
+            else:
+                mesh2D = meshGenerator.copy()
+                mesh2D.hy = np.r_[2*np.pi]
+            src2D = simulation.src.copy()
+            src2D.modelParameters = simulation.modelParameters
+            src2D.meshGenerator = mesh2D
+            simulations.append(type(simulation)(
+                modelParameters=simulation.modelParameters,
+                meshGenerator=mesh2D,
+                src=src2D,
+                directory=simulation.directory,
+                fields_filename='fields2D.npy',
+                filename='simulation2D.json',
+                profile_filename='profile2D.json'
+            ))
+            names.append('2D')
+
+        if includeDC:
+            # make sure the electrodes are in the cell
+            csz = simulation.meshGenerator.csz
+            simulations.append(SimulationDC(
+                modelParameters=simulation.modelParameters,
+                meshGenerator=simulation.meshGenerator,
+                src_a=simulation.src.src_a_closest - np.r_[0., 0., csz/2.],
+                src_b=simulation.src.src_b_closest - np.r_[0., 0., csz/2.],
+                directory=simulation.directory,
+                filename='simulationDC.json',
+                profile_filename='profileDC.json'
+            ))
+            names.append('DC')
+
+        kwargs.setdefault('directory', simulation.directory)
+        return cls(simulations=simulations, names=names, **kwargs)
+
+    @property
+    def stage_names(self):
+        """
+        names of the stages
+
+        :rtype: list
+        """
+        if self.names is not None:
+            return list(self.names)
+        return [
+            '{}_{}'.format(i, simulation.physics)
+            for i, simulation in enumerate(self.simulations)
+        ]
+
+    @property
+    def timing(self):
+        """
+        timing of each of the stages of the last run
+
+        :rtype: dict
+        """
+        return getattr(self, '_timing', None)
+
+    def run(self):
+        """
+        Run all of the stages. The stages run even if an earlier one fails,
+        and the timing report is saved before a failure is raised.
+
+        :rtype: dict
+        :return: timing report
+        :raises PipelineError: if any of the stages failed
+        """
+        t = time.time()
+        names = self.stage_names
+
+        # build each distinct mesh and set of physical properties once
+        shared = set(_SHARED.keys())
+        pinned = mesh_cache.pin(
+            simulation.meshGenerator for simulation in self.simulations
+        )
+        for simulation in self.simulations:
+            _share(simulation)
+            simulation.physprops.sigma
+            simulation.physprops.mur
+        built = set(_SHARED.keys()) - shared
+        n_meshes = len(set(
+            simulation.meshGenerator.mesh_hash
+            for simulation in self.simulations
+        ))
+        print('Pipeline: {} stages, {} shared meshes, {} shared physical '
+              'properties'.format(len(names), n_meshes, len(built)))
+
+        n_procs = min(self.n_procs, len(self.simulations))
+        pool = None
+        try:
+            if n_procs <= 1:
+                stages = [
+                    _run_simulation(name, simulation)
+                    for name, simulation in zip(names, self.simulations)
+                ]
+            else:
+                pool = multiprocessing.Pool(processes=n_procs)
+                stages = pool.map(_run_stage, [
+                    (name, simulation.serialize())
+                    for name, simulation in zip(names, self.simulations)
+                ])
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+            for key in built:
+                _SHARED.pop(key, None)
+            mesh_cache.unpin(pinned)
+
+        for stage in stages:
+            print('   {stage} {status}. Elapsed time : {elapsed}'.format(
+                **stage
+            ))
+
+        self._timing = OrderedDict([
+            ('n_procs', n_procs),
+            ('elapsed', time.time() - t),
+            ('stages', stages),
+        ])
+        self.save_timing()
+        print('Pipeline done. Elapsed time : {}'.format(time.time() - t))
+
+        failed = [stage for stage in stages if stage['status'] == 'failed']
+        if len(failed) > 0:
+            raise PipelineError(
+                "{} of {} stages failed:\n{}".format(
+                    len(failed), len(stages), '\n'.join(
+                        '{stage}:\n{error}'.format(**stage)
+                        for stage in failed
+                    )
+                )
+            )
+        return self._timing
+
+    def save_timing(self, filename=None, directory=None):
+        """
+        Save the timing report to json
+
+        :param str filename: filename for the report
+        :param str directory: working directory for saving the file
+        """
+        if filename is None:
+            filename = self.timing_filename
+
+        if directory is None:
+            directory = self.directory
+
+        f = os.path.sep.join([directory, filename])
+        with open(f, 'w') as outfile:
+            json.dump(self.timing, outfile, indent=2)
+
+        print('Saved {}'.format(f))
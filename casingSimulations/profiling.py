@@ -0,0 +1,175 @@
+from collections import OrderedDict
+from contextlib import contextmanager
+import json
+import os
+import sys
+import time
+
+try:
+    import resource
+except ImportError:  # windows
+    resource = None
+
+
+def cpu_time():
+    """
+    user + system CPU time of the current process, summed over all of its
+    threads (s)
+
+    :rtype: float
+    """
+    t = os.times()
+    return t[0] + t[1]
+
+
+def peak_rss():
+    """
+    peak resident set size of the current process (bytes). None if it is
+    not available on this platform.
+
+    :rtype: float
+    """
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # linux reports kilobytes, macOS reports bytes
+    if sys.platform != 'darwin':
+        rss *= 1024
+    return float(rss)
+
+
+class Profiler(object):
+    """
+    Records the wall time, CPU time and peak resident set size of named
+    phases of a run. A phase can be entered more than once (e.g. a
+    factorization per frequency), in which case the times are summed.
+
+    .. code:: python
+
+        profiler = Profiler()
+        with profiler.phase('factorization'):
+            Ainv = Solver(A)
+    """
+
+    def __init__(self):
+        self.phases = OrderedDict()
+        self._start = (time.time(), cpu_time(), peak_rss())
+
+    @contextmanager
+    def phase(self, name):
+        """
+        Context manager that records a phase
+
+        :param str name: name of the phase
+        """
+        wall, cpu, rss = time.time(), cpu_time(), peak_rss()
+        try:
+            yield
+        finally:
+            self._record(
+                name, time.time() - wall, cpu_time() - cpu, rss, peak_rss()
+            )
+
+    def _record(self, name, wall, cpu, rss_start, rss_end):
+        if name not in self.phases:
+            self.phases[name] = OrderedDict([
+                ('wall', 0.), ('cpu', 0.), ('calls', 0),
+                ('peak_rss', None), ('rss_increase', None),
+            ])
+        phase = self.phases[name]
+        phase['wall'] += wall
+        phase['cpu'] += cpu
+        phase['calls'] += 1
+        if rss_end is not None:
+            # the peak only increases, so the increase during a phase shows
+            # which phase set it
+            phase['peak_rss'] = max(phase['peak_rss'] or 0., rss_end)
+            phase['rss_increase'] = (
+                (phase['rss_increase'] or 0.) + rss_end - rss_start
+            )
+
+    @property
+    def total(self):
+        """
+        wall time, CPU time and peak resident set size since the profiler
+        was created
+
+        :rtype: dict
+        """
+        wall, cpu, _ = self._start
+        return OrderedDict([
+            ('wall', time.time() - wall),
+            ('cpu', cpu_time() - cpu),
+            ('peak_rss', peak_rss()),
+        ])
+
+    def to_dict(self, **info):
+        """
+        profile as a dictionary
+
+        :param info: additional information to store with the profile, e.g.
+                     the number of cells or threads
+        :rtype: dict
+        """
+        profile = OrderedDict(sorted(info.items()))
+        profile['total'] = self.total
+        profile['phases'] = self.phases
+        return profile
+
+    def summary(self):
+        """
+        table of the phases, with the slowest phase first
+
+        :rtype: str
+        """
+        lines = ['{:<16} {:>10} {:>10} {:>6} {:>12}'.format(
+            'phase', 'wall (s)', 'cpu (s)', 'calls', 'peak RSS (MB)'
+        )]
+        for name, phase in sorted(
+            self.phases.items(), key=lambda item: -item[1]['wall']
+        ):
+            lines.append('{:<16} {:>10.3f} {:>10.3f} {:>6d} {:>12}'.format(
+                name, phase['wall'], phase['cpu'], phase['calls'],
+                '-' if phase['peak_rss'] is None else
+                '{:.1f}'.format(phase['peak_rss'] / 1024.**2)
+            ))
+        return '\n'.join(lines)
+
+
+@contextmanager
+def null_phase(name=None):
+    """
+    Stand-in for :code:`Profiler.phase` when nothing is being profiled
+    """
+    yield
+
+
+@contextmanager
+def report_phase(phase, name, callback):
+    """
+    Wrap a phase so that :code:`callback(name, 'start')` is called when it
+    is entered and :code:`callback(name, 'end')` when it is left, e.g. to
+    report the progress of a run to another process
+
+    :param phase: context manager of the phase, e.g. from
+                  :code:`Profiler.phase`
+    :param str name: name of the phase
+    :param callable callback: function of the name and the event
+    """
+    callback(name, 'start')
+    try:
+        with phase:
+            yield
+    finally:
+        callback(name, 'end')
+
+
+def load_profile(filename):
+    """
+    Load a profile written by a simulation
+
+    :param str filename: profile file (json)
+    :rtype: dict
+    """
+    with open(filename, 'r') as f:
+        return json.load(f, object_pairs_hook=OrderedDict)
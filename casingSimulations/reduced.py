@@ -0,0 +1,414 @@
+from collections import OrderedDict
+import time
+import warnings
+
+import numpy as np
+import scipy.sparse as sp
+import properties
+
+from .outputs import field_location
+from .physics import casing_current_operator
+from .run import SimulationFDEM
+
+
+class ReducedOrderFDEM(properties.HasProperties):
+    """
+    Reduced-order model of an FDEM simulation for dense frequency sweeps.
+
+    The system matrix of the quasi-static FDEM problem is affine in the
+    angular frequency, :code:`A(w) = K + iwM`, as is the right hand side,
+    :code:`b(w) = b0 + iwb1`. The solutions at a few frequencies span a
+    rational Krylov basis V, and the fields at any frequency are found by
+    solving the projected system
+    :code:`(V*KV + iwV*MV) y = V*b(w)` of the size of the basis, with
+    :code:`u = Vy`.
+
+    The solve frequencies are chosen greedily: starting from the ends of
+    :code:`freqs`, the frequency with the largest relative residual
+    :code:`|b(w) - A(w)Vy| / |b(w)|` is added to the basis until the
+    residual at all of :code:`freqs` is below :code:`tol`. The cost is one
+    factorization and solve per solve frequency, typically a handful for a
+    sweep over several decades.
+
+    .. code:: python
+
+        rom = ReducedOrderFDEM(simulation=sim, freqs=np.logspace(-2, 3, 200))
+        rom.build()
+        z, currents = rom.casing_currents()
+        fields = rom.fields(freqs=[1., 10.])
+
+    Casing currents are evaluated in the reduced space, so their cost does
+    not grow with the size of the mesh. :code:`solution` and :code:`fields`
+    lift the reduced solution back to the full system, and should be
+    limited to the frequencies where the full fields are needed.
+    """
+
+    simulation = properties.Instance(
+        "FDEM simulation to reduce. The system matrices and right hand sides "
+        "at its lowest and highest frequencies give the terms of the affine "
+        "model, the sweep itself is set by freqs",
+        SimulationFDEM,
+        required=True
+    )
+
+    freqs = properties.Array(
+        "frequencies at which the reduced model is evaluated by default, and "
+        "at which its error is estimated (Hz)",
+        required=True
+    )
+
+    tol = properties.Float(
+        "tolerance on the relative residual of the reduced model",
+        default=1e-6,
+        min=0.
+    )
+
+    max_solves = properties.Integer(
+        "maximum number of frequencies solved with the full system",
+        default=20,
+        min=2
+    )
+
+    def __init__(self, **kwargs):
+        super(ReducedOrderFDEM, self).__init__(**kwargs)
+
+    # ----------------- Full system ----------------- #
+
+    @property
+    def _prob(self):
+        prb = self.simulation.prob
+        prb.model = self.simulation.physprops.model
+        return prb
+
+    def _affine_terms(self):
+        """
+        K, M, b0 and b1 from the system matrices and right hand sides at
+        two of the simulation's frequencies
+        """
+        prb = self._prob
+        freqs = sorted(prb.survey.freqs)
+        if len(freqs) < 2:
+            f1, f2 = freqs[0], 2. * freqs[0]
+        else:
+            f1, f2 = freqs[0], freqs[-1]
+        w1, w2 = 2 * np.pi * f1, 2 * np.pi * f2
+
+        A1, A2 = prb.getA(f1), prb.getA(f2)
+        self._M = sp.csr_matrix((A2 - A1) / (1j * (w2 - w1)))
+        self._K = sp.csr_matrix(A1 - 1j * w1 * self._M)
+
+        b1 = np.asarray(prb.getRHS(f1), dtype=complex)
+        if len(freqs) < 2:
+            # a single frequency, the source term is assumed not to change
+            # with frequency
+            self._b1 = np.zeros_like(b1)
+        else:
+            b2 = np.asarray(prb.getRHS(f2), dtype=complex)
+            self._b1 = (b2 - b1) / (1j * (w2 - w1))
+        self._b0 = b1 - 1j * w1 * self._b1
+        if self._b0.ndim == 1:
+            self._b0 = self._b0[:, None]
+            self._b1 = self._b1[:, None]
+
+        # check that the system is affine in the frequency
+        f3 = np.sqrt(f1 * f2)
+        A3 = prb.getA(f3)
+        error = (
+            abs(A3 - self._A(2 * np.pi * f3)).max() / abs(A3).max()
+        )
+        if error > 1e-8:
+            warnings.warn(
+                "The system matrix is not affine in the frequency (relative "
+                "error {:1.2e}), the reduced model will not be accurate".format(
+                    error
+                )
+            )
+
+    def _A(self, w):
+        return self._K + 1j * w * self._M
+
+    def _b(self, w):
+        return self._b0 + 1j * w * self._b1
+
+    def _solve(self, f):
+        """
+        solve the full system at a frequency
+        """
+        prb = self.simulation.prob
+        Ainv = prb.Solver(self._A(2 * np.pi * f), **prb.solverOpts)
+        u = np.asarray(Ainv * self._b(2 * np.pi * f))
+        Ainv.clean()
+        return u.reshape(self._b0.shape)
+
+    # ----------------- Reduced system ----------------- #
+
+    def _add_to_basis(self, u):
+        if self._V is None:
+            V = u
+        else:
+            V = np.hstack([self._V, u])
+        V, R = np.linalg.qr(V)
+        # drop directions that are already spanned by the basis
+        keep = np.abs(np.diag(R)) > 1e-12 * np.abs(np.diag(R)).max()
+        self._V = V[:, keep]
+        self._KV = self._K * self._V
+        self._MV = self._M * self._V
+        VH = self._V.conj().T
+        self._Kr = VH.dot(self._KV)
+        self._Mr = VH.dot(self._MV)
+        self._b0r = VH.dot(self._b0)
+        self._b1r = VH.dot(self._b1)
+        # projected output operators depend on the basis
+        self._outputs = {}
+
+    def _reduced_solve(self, w):
+        return np.linalg.solve(
+            self._Kr + 1j * w * self._Mr, self._b0r + 1j * w * self._b1r
+        )
+
+    def residual(self, freqs=None):
+        """
+        relative residual of the reduced model, the largest over the sources
+
+        :param numpy.ndarray freqs: frequencies (Hz), defaults to
+                                    :code:`freqs`
+        :rtype: numpy.ndarray
+        """
+        if freqs is None:
+            freqs = self.freqs
+        residual = np.zeros(len(freqs))
+        for i, f in enumerate(freqs):
+            w = 2 * np.pi * f
+            b = self._b(w)
+            r = b - (self._KV + 1j * w * self._MV).dot(self._reduced_solve(w))
+            residual[i] = (
+                np.linalg.norm(r, axis=0) / np.linalg.norm(b, axis=0)
+            ).max()
+        return residual
+
+    @property
+    def solve_freqs(self):
+        """
+        frequencies at which the full system was solved (Hz)
+
+        :rtype: list
+        """
+        return list(getattr(self, '_solve_freqs', []))
+
+    @property
+    def rank(self):
+        """
+        size of the reduced model
+
+        :rtype: int
+        """
+        V = getattr(self, '_V', None)
+        return 0 if V is None else V.shape[1]
+
+    def build(self):
+        """
+        Choose the solve frequencies and build the reduced model
+
+        :rtype: ReducedOrderFDEM
+        """
+        t = time.time()
+        print('Building reduced-order model')
+        self._affine_terms()
+
+        freqs = np.sort(np.asarray(self.freqs, dtype=float))
+        self._V = None
+        self._solve_freqs = []
+        self._residuals = OrderedDict()
+
+        # a single frequency is only solved once
+        candidates = list(np.unique([freqs[0], freqs[-1]]))
+        while True:
+            for f in candidates:
+                self._add_to_basis(self._solve(f))
+                self._solve_freqs.append(float(f))
+
+            residual = self.residual(freqs)
+            i = np.argmax(residual)
+            self._residuals[len(self._solve_freqs)] = float(residual[i])
+            print('   {} solves, rank {}, max residual {:1.2e}'.format(
+                len(self._solve_freqs), self.rank, residual[i]
+            ))
+            if residual[i] <= self.tol:
+                break
+            if len(self._solve_freqs) >= self.max_solves:
+                warnings.warn(
+                    "The reduced model did not reach a residual of {} with "
+                    "{} solves (max residual {:1.2e} at {} Hz)".format(
+                        self.tol, self.max_solves, residual[i], freqs[i]
+                    )
+                )
+                break
+            candidates = [freqs[i]]
+
+        print('   ... Done. Elapsed time : {}'.format(time.time() - t))
+        return self
+
+    @property
+    def residuals(self):
+        """
+        largest residual after each step of :code:`build`, keyed by the
+        number of solves
+
+        :rtype: dict
+        """
+        return getattr(self, '_residuals', None)
+
+    # ----------------- Evaluation ----------------- #
+
+    def _check_built(self):
+        if self.rank == 0:
+            raise Exception(
+                "The reduced model has not been built, run build() first"
+            )
+
+    def solution(self, freqs=None):
+        """
+        solution of the full system at any frequencies, for each source of
+        the simulation. This lifts the reduced solution to the size of the
+        full system at each frequency.
+
+        :param numpy.ndarray freqs: frequencies (Hz), defaults to
+                                    :code:`freqs`
+        :rtype: numpy.ndarray
+        :return: (number of frequencies, size of the system, number of
+                 sources)
+        """
+        self._check_built()
+        if freqs is None:
+            freqs = self.freqs
+        return np.array([
+            self._V.dot(self._reduced_solve(2 * np.pi * f)) for f in freqs
+        ])
+
+    def _simulation_at(self, freqs):
+        """
+        copy of the simulation with the given frequencies that shares its
+        mesh
+        """
+        simulation = self.simulation.copy()
+        modelParameters = simulation.modelParameters
+        modelParameters.freqs = np.asarray(freqs, dtype=float)
+        sources = []
+        if getattr(simulation, 'src', None) is not None:
+            sources.append(simulation.src)
+        if getattr(simulation, 'srcList', None) is not None:
+            sources += simulation.srcList.sources
+        for src in sources:
+            src.modelParameters = modelParameters
+        simulation.share_mesh(self.simulation.meshGenerator.mesh)
+        return simulation
+
+    def fields(self, freqs=None):
+        """
+        SimPEG fields at any frequencies from the reduced model. These can
+        be used like the fields of a simulation run at those frequencies.
+        They are as large as the fields of a full run, so for casing
+        currents, use :code:`casing_currents`.
+
+        :param numpy.ndarray freqs: frequencies (Hz), defaults to
+                                    :code:`freqs`
+        :rtype: SimPEG.Fields
+        """
+        if freqs is None:
+            freqs = self.freqs
+        freqs = np.asarray(freqs, dtype=float)
+        u = self.solution(freqs)
+
+        simulation = self._simulation_at(freqs)
+        prb = simulation.prob
+        prb.model = simulation.physprops.model
+
+        # the simulation's sources are ordered by casing source, then by
+        # frequency
+        nF, n, nSrc = u.shape
+        solution = np.zeros((n, nSrc * nF), dtype=complex, order='F')
+        for i in range(nSrc):
+            solution[:, i * nF:(i + 1) * nF] = u[:, :, i].T
+        return simulation._fields_from_solution(prb, solution)
+
+    def _output_operator(self, component):
+        """
+        casing current operator in the reduced space. The current density is
+        affine in the solution, :code:`j = Ju + j0(w)`, where j0 is the
+        source term, so the casing currents are :code:`PJVy + Pj0(w)`. Only
+        PJV (nz x rank) and the two terms of :code:`Pj0 = c0 + iwc1` (nz x
+        number of sources) are stored.
+        """
+        if component in self._outputs:
+            return self._outputs[component]
+
+        z, P = casing_current_operator(
+            self.simulation.meshGenerator.mesh,
+            self.simulation.modelParameters
+        )[component]
+
+        # the source term, from the fields of a zero solution at two
+        # frequencies
+        freqs = np.r_[1., 2.]
+        w = 2 * np.pi * freqs
+        simulation = self._simulation_at(freqs)
+        prb = simulation.prob
+        prb.model = simulation.physprops.model
+        n, nSrc = self._b0.shape
+        fields = simulation._fields_from_solution(
+            prb, np.zeros((n, nSrc * len(freqs)), dtype=complex, order='F')
+        )
+        if field_location(fields, 'j') != 'F':
+            raise ValueError(
+                "The current density of the {} formulation is not on the "
+                "faces, use the h or j formulation".format(
+                    self.simulation.formulation
+                )
+            )
+        # the sources are ordered by casing source, then by frequency
+        Pj0 = (P * np.asarray(fields[:, 'j'])).reshape(
+            P.shape[0], nSrc, len(freqs)
+        )
+        c1 = (Pj0[:, :, 1] - Pj0[:, :, 0]) / (1j * (w[1] - w[0]))
+        c0 = Pj0[:, :, 0] - 1j * w[0] * c1
+
+        # derivative of the currents with respect to the solution, projected
+        # onto the basis one depth at a time
+        src = prb.survey.srcList[0]
+        PJV = np.vstack([
+            np.asarray(
+                fields._jDeriv(
+                    src, None, np.asarray(P[k, :].todense()).ravel(),
+                    adjoint=True
+                )[0],
+                dtype=complex
+            ).ravel().dot(self._V)
+            for k in range(P.shape[0])
+        ])
+
+        self._outputs[component] = (z, PJV, c0, c1)
+        return self._outputs[component]
+
+    def casing_currents(self, freqs=None, component='z'):
+        """
+        casing current profile at any frequencies from the reduced model,
+        see :code:`casingSimulations.physics.casing_currents`. The currents
+        are evaluated in the reduced space, without the full fields.
+
+        :param numpy.ndarray freqs: frequencies (Hz), defaults to
+                                    :code:`freqs`
+        :param str component: 'z' (vertical current) or 'x' (radial current)
+        :rtype: tuple
+        :return: depths of the profile (nz) and the currents (number of
+                 casing sources, number of frequencies, nz)
+        """
+        self._check_built()
+        if freqs is None:
+            freqs = self.freqs
+        z, PJV, c0, c1 = self._output_operator(component)
+
+        currents = np.array([
+            PJV.dot(self._reduced_solve(w)) + c0 + 1j * w * c1
+            for w in 2 * np.pi * np.asarray(freqs, dtype=float)
+        ])
+        return z, currents.transpose(2, 0, 1)
@@ -3,6 +3,9 @@ import numpy as np
 import scipy.sparse as sp
 import os
 import json
+import multiprocessing
+import warnings
+from collections import OrderedDict
 from scipy.constants import mu_0
 
 import discretize
@@ -12,24 +15,57 @@ from SimPEG.EM import FDEM, TDEM
 from SimPEG import Utils, Maps
 from SimPEG.EM.Static import DC
 
-try:
-    from pymatsolver import Pardiso as Solver
-except ImportError:
-    import warnings
-    warnings.warn(
-        "Could not import Pardiso, falling back to LU. Will be slow."
-    )
-    from SimPEG import SolverLU as Solver
-
 from .base import LoadableInstance, BaseCasing
 from .model import Wholespace, PhysicalProperties
 from .mesh import BaseMeshGenerator, CylMeshGenerator, TensorMeshGenerator
 from .sources import BaseCasingSrc, SourceList
-from .utils import writeSimulationPy
+from .utils import (
+    writeSimulationPy, content_hash, save_fields_chunked, storage_dtype,
+    load_fields_chunked, thread_limits, thread_info
+)
+from .cache import (
+    factorization_cache, factorization_nbytes, result_cache, mesh_cache,
+    operator_cache
+)
+from .solvers import (
+    DEFAULT_SOLVER, available_solvers, get_solver, perturbation_rows,
+    Woodbury, PerturbationGMRES
+)
+from .profiling import Profiler, null_phase, report_phase, load_profile
+from .estimate import CostModel, operator_nnz
+from .transform import transform_frequencies, step_off_response
+from .outputs import BaseOutput, evaluate_outputs, load_outputs
 from . import sources
 from .info import __version__
 
 
+def _solve_frequencies(task):
+    """
+    Factor and solve a serialized FDEM simulation at a subset of its
+    frequencies. This is called on the worker processes of a frequency
+    parallel run.
+
+    :param tuple task: (serialized simulation, list of frequencies)
+    :rtype: list
+    :return: list of (frequency, solution) tuples
+    """
+    serialized, freqs = task
+
+    simulation = properties.HasProperties.deserialize(serialized, trusted=True)
+    simulation.share_mesh(simulation.meshGenerator.mesh)
+
+    prb = simulation.prob
+
+    result = []
+    with thread_limits(simulation.num_threads):
+        simulation._set_model(prb, simulation.physprops.model)
+        for freq in freqs:
+            Ainv = prb.Solver(prb.getA(freq), **prb.solverOpts)
+            result.append((freq, Ainv * prb.getRHS(freq)))
+            Ainv.clean()
+    return result
+
+
 class BaseSimulation(BaseCasing):
     """
     Base class wrapper to run an EM Forward Simulation
@@ -40,14 +76,70 @@ class BaseSimulation(BaseCasing):
         default="fields.npy"
     )
 
+    fields_format = properties.StringChoice(
+        "format of the fields file: a single .npy file or a chunked .npz "
+        "file with a chunk per frequency (FDEM) or time (TDEM)",
+        default="npy",
+        choices=["npy", "chunked"]
+    )
+
+    fields_compression = properties.Bool(
+        "compress the chunks of a chunked fields file (lossless)",
+        default=True
+    )
+
+    fields_precision = properties.StringChoice(
+        "precision with which the fields are stored",
+        default="double",
+        choices=["double", "single"]
+    )
+
     filename = properties.String(
         "filename for the simulation parameters",
         default="simulationParameters.json"
     )
 
+    profile_filename = properties.String(
+        "filename for the performance profile of the run",
+        default="profile.json"
+    )
+
+    outputs = properties.List(
+        "output requests (e.g. casing currents, slices or points) evaluated "
+        "right after the solve and saved to the outputs file",
+        properties.Instance("output request", BaseOutput),
+        required=False
+    )
+
+    outputs_filename = properties.String(
+        "filename for the outputs",
+        default="outputs.npz"
+    )
+
+    save_fields = properties.Bool(
+        "save the full solution to the fields file when the simulation is "
+        "run with save=True. Turn off to only keep the outputs",
+        default=True
+    )
+
+    cache_operators = properties.Bool(
+        "keep the inner product matrices in the process-level operator cache "
+        "so that runs with the same mesh and sigma (or mu) reuse them. The "
+        "cache holds up to casingSimulations.cache.operator_cache.max_bytes "
+        "(2 GB) for the life of the process",
+        default=False
+    )
+
     num_threads = properties.Integer(
-        "number of threads",
-        default=1
+        "maximum number of threads used by BLAS, OpenMP and the solver, if "
+        "not set, the libraries choose their own thread counts",
+        required=False,
+        min=1
+    )
+
+    threads = properties.Dictionary(
+        "effective thread counts of the thread pools during the last run",
+        required=False
     )
 
     modelParameters = LoadableInstance(
@@ -79,6 +171,29 @@ class BaseSimulation(BaseCasing):
         default=False
     )
 
+    solver = properties.String(
+        "name of the solver in the solver registry, e.g. 'pardiso', "
+        "'superlu', 'bicgstab' or 'gmres'",
+        default=DEFAULT_SOLVER
+    )
+
+    solver_opts = properties.Dictionary(
+        "keyword arguments for the solver, e.g. {'ordering': 'COLAMD'} for "
+        "superlu or {'tol': 1e-8, 'preconditioner': 'ilu'} for bicgstab "
+        "and gmres",
+        required=False
+    )
+
+    use_result_cache = properties.Bool(
+        "load the result from the result cache if an identical simulation "
+        "has already been run and store new results in it",
+        default=False
+    )
+
+    # properties of the simulation (besides the model, mesh and sources) that
+    # change the result
+    _result_props = ['formulation', 'solver', 'solver_opts']
+
     def __init__(self, **kwargs):
         # set keyword arguments
         Utils.setKwargs(self, **kwargs)
@@ -105,6 +220,27 @@ class BaseSimulation(BaseCasing):
     def _set_srcList(self, change):
         self.srcList = SourceList(sources=[self.src])
 
+    @properties.validator('solver')
+    def _validate_solver(self, change):
+        if change['value'] not in available_solvers():
+            raise properties.ValidationError(
+                "{} is not a registered solver. The available solvers are "
+                "{}".format(change['value'], available_solvers())
+            )
+
+    @property
+    def Solver(self):
+        """
+        solver class from the solver registry
+
+        :rtype: class
+        """
+        return get_solver(self.solver)
+
+    @property
+    def _solverOpts(self):
+        return dict(self.solver_opts) if self.solver_opts is not None else {}
+
     @property
     def physprops(self):
         if getattr(self, '_physprops', None) is None:
@@ -121,6 +257,66 @@ class BaseSimulation(BaseCasing):
     def survey(self):
         return self._survey
 
+    @property
+    def meshGenerators(self):
+        """
+        All of the mesh generators attached to the simulation and its sources.
+        When a simulation is deserialized, each of these is a separate
+        instance.
+
+        :rtype: list
+        """
+        meshGenerators = [self.meshGenerator]
+        sources = []
+        if getattr(self, 'src', None) is not None:
+            sources.append(self.src)
+        if getattr(self, 'srcList', None) is not None:
+            sources += self.srcList.sources
+        for src in sources:
+            if getattr(src, 'meshGenerator', None) is not None:
+                meshGenerators.append(src.meshGenerator)
+        return meshGenerators
+
+    def share_mesh(self, mesh):
+        """
+        Use an already constructed mesh for the simulation and its sources
+        rather than having each mesh generator build its own.
+
+        :param discretize.BaseMesh mesh: mesh built from the same hx, hy, hz
+                                         and x0 as the meshGenerator
+        """
+        for meshGenerator in self.meshGenerators:
+            meshGenerator._mesh = mesh
+
+    @property
+    def result_hash(self):
+        """
+        hash of everything that determines the result of the simulation: the
+        model parameters, mesh generator, sources, formulation and software
+        version. Filenames and directories are not included.
+
+        :rtype: str
+        """
+        def strip(value):
+            if isinstance(value, dict):
+                return dict(
+                    (key, strip(val)) for key, val in value.items()
+                    if key not in ['directory', 'filename']
+                )
+            if isinstance(value, list):
+                return [strip(val) for val in value]
+            return value
+
+        srcList = getattr(self, 'srcList', None)
+        return content_hash(
+            type(self).__name__,
+            __version__,
+            strip(self.modelParameters.serialize()),
+            strip(self.meshGenerator.serialize()),
+            strip(srcList.serialize()) if srcList is not None else None,
+            *[getattr(self, key) for key in self._result_props]
+        )
+
     def write_py(self, includeDC=True, include2D=True):
         """
         Write a python script for running the simulation
@@ -148,28 +344,142 @@ class BaseSimulation(BaseCasing):
             include2D=include2D
         )
 
+    @property
+    def load_timing(self):
+        """
+        time taken by each step of loading the simulation results with
+        :code:`casingSimulations.utils.loadSimulationResults`
+
+        :rtype: dict
+        """
+        return getattr(self, '_load_timing', None)
+
     def fields(self):
         """
-        fields from the forward simulation
+        fields from the forward simulation. The fields are kept even if the
+        simulation only keeps its outputs when it is run.
         """
         if getattr(self, '_fields', None) is None:
-            self._fields = self.run()
+            self._keep_fields = True
+            try:
+                self._fields = self.run()
+            finally:
+                self._keep_fields = False
         return self._fields
 
-    def run(self, save=True, verbose=False):
+    def run(self, save=True, verbose=False, force=False, resume=False):
         """
         Run the forward simulation
+
+        :param bool save: save the simulation parameters and fields
+        :param bool verbose: run the problem in verbose mode
+        :param bool force: solve even if the result is in the result cache
+        :param bool resume: resume from the last checkpoint (TDEM only)
+        :rtype: SimPEG.Fields
+        :return: fields, or None if they are dropped as the outputs are
+                 evaluated, see :code:`_outputs_while_solving`
         """
+        # limit the threads used by the physical properties, matrix assembly
+        # and the solver
+        with thread_limits(self.num_threads):
+            return self._run(
+                save=save, verbose=verbose, force=force, resume=resume
+            )
 
-        # ----------------- Validate Parameters ----------------- #
+    def submit(self, executor=None, **kwargs):
+        """
+        Run the forward simulation in a separate process without blocking
+        the caller. The fields are saved and can be retrieved from the
+        returned handle, which also reports the progress of the run and
+        can cancel it.
+
+        .. code:: python
+
+            future = sim.submit()
+            future.progress()
+            fields = future.result()
+
+        :param casingSimulations.futures.SimulationExecutor executor:
+            executor to run the simulation on, defaults to the shared
+            executor, whose limits are set with
+            :code:`casingSimulations.futures.set_limits`
+        :param kwargs: keyword arguments for :code:`run` (verbose, force,
+                       resume)
+        :rtype: casingSimulations.futures.SimulationFuture
+        """
+        from .futures import get_executor
+        if executor is None:
+            executor = get_executor()
+        return executor.submit(self, **kwargs)
 
-        print('Validating parameters...')
-        self.validate()
+    def load_fields(self, mmap_mode=None):
+        """
+        Populate the fields from the solution saved in the working
+        directory by a previous run
+
+        :param str mmap_mode: memory-map the fields file, see
+                              :code:`numpy.load`
+        :rtype: SimPEG.Fields
+        """
+        f = '/'.join([self.directory, self.fields_filename])
+        if self.fields_format == 'chunked' and not os.path.isfile(f):
+            solution = load_fields_chunked(
+                '/'.join([self.directory, self.chunked_fields_filename])
+            )
+        else:
+            solution = np.load(f, mmap_mode=mmap_mode)
+
+        prb = self.prob
+        prb.model = self.physprops.model
+        self._fields = self._fields_from_solution(prb, solution)
+        return self._fields
+
+    def _run(self, save=True, verbose=False, force=False, resume=False):
+        self._profiler = Profiler()
+        try:
+            fields = self._run_phases(
+                save=save, verbose=verbose, force=force, resume=resume
+            )
+        finally:
+            mesh = getattr(self.meshGenerator, '_mesh', None)
+            try:
+                concurrent = self._solve_counts()['concurrent_factorizations']
+            except Exception:
+                concurrent = None
+            self._profile = self._profiler.to_dict(
+                simulation=type(self).__name__,
+                nC=mesh.nC if mesh is not None else None,
+                system_size=(
+                    self._system_size(mesh) if mesh is not None else None
+                ),
+                solver=self.solver,
+                num_threads=self.num_threads,
+                threads=self.threads,
+                concurrent_factorizations=concurrent,
+            )
+            if verbose:
+                print(self._profiler.summary())
+            self._profiler = None
+
+        if save:
+            self.save_profile()
+
+        # keep the operators computed during the run on disk if the mesh
+        # registry persists them
+        mesh_cache.persist(self.meshGenerator.mesh_hash)
+        return fields
+
+    def _run_phases(self, save=True, verbose=False, force=False, resume=False):
 
+        # ----------------- Validate Parameters ----------------- #
 
+        print('Validating parameters...')
+        with self._phase('validation'):
+            self.validate()
 
         # grab the discretize mesh off of the mesh object
-        sim_mesh = self.meshGenerator.mesh
+        with self._phase('mesh'):
+            sim_mesh = self.meshGenerator.mesh
         print('      max x: {}, min z: {}, max z: {}, nC: {}'.format(
             sim_mesh.vectorNx.max(),
             sim_mesh.vectorNz.min(),
@@ -177,37 +487,467 @@ class BaseSimulation(BaseCasing):
             sim_mesh.nC
         ))
 
-        # save simulation parameters
+        # save simulation parameters along with the effective thread counts
+        self.threads = thread_info()
         if save:
-            self.save()
+            with self._phase('save'):
+                self.save()
 
         # ----------------- Set up the simulation ----------------- #
-        physprops = self.physprops
-        prb = self.prob
+        with self._phase('physprops'):
+            physprops = self.physprops
+            physprops.sigma
+            physprops.mur
+
+        with self._phase('sources'):
+            self._assemble_sources()
+
+        with self._phase('setup'):
+            prb = self.prob
 
         if verbose is True:
             prb.verbose = True
         # survey = self.survey
         # prb.pair(survey)
 
+        # ----------------- Check the result cache ----------------- #
+        solution = None
+        if self.use_result_cache:
+            result_hash = self.result_hash
+            if not force:
+                with self._phase('result cache'):
+                    solution = result_cache.get(result_hash)
+
         # ----------------- Run the the simulation ----------------- #
-        print('Starting {}'.format(type(self).__name__))
-        t = time.time()
+        streamed = False
+        if solution is not None:
+            print('Loading result {} from the result cache'.format(
+                result_hash
+            ))
+            prb.model = physprops.model
+            fields = self._fields_from_solution(prb, solution)
+
+        elif self._outputs_while_solving:
+            print('Starting {}'.format(type(self).__name__))
+            t = time.time()
+
+            print('Using {} Solver'.format(prb.Solver))
+            fields = None
+            self._output_results = evaluate_outputs(
+                self, prb.fieldsPair(prb.mesh, prb.survey), self.outputs,
+                self._solution_shape(prb, 1)[1:],
+                self._solve_output_chunks(prb, physprops.model)
+            )
+            self._store_operators(prb)
+            print('   ... Done. Elapsed time : {}'.format(time.time()-t))
 
-        print('Using {} Solver'.format(prb.Solver))
-        fields = prb.fields(physprops.model)
-        print('   ... Done. Elapsed time : {}'.format(time.time()-t))
+        else:
+            print('Starting {}'.format(type(self).__name__))
+            t = time.time()
 
-        if save:
-            np.save(
-                '/'.join([self.directory, self.fields_filename]),
-                fields[:, '{}Solution'.format(self.formulation)]
+            print('Using {} Solver'.format(prb.Solver))
+            fields = self._compute_fields(
+                prb, physprops.model, resume=resume
+            )
+            self._store_operators(prb)
+            print('   ... Done. Elapsed time : {}'.format(time.time()-t))
+
+            # streamed fields have already been written to the fields file
+            streamed = self._streams_fields
+            solution = self._solution(fields)
+
+            if self.use_result_cache:
+                with self._phase('result cache'):
+                    result_cache.put(result_hash, solution)
+
+        if self.outputs:
+            if fields is not None:
+                with self._phase('outputs'):
+                    self._output_results = evaluate_outputs(
+                        self, fields, self.outputs,
+                        self._solution_shape(prb, 1)[1:],
+                        self._output_chunks(prb, fields)
+                    )
+            if save:
+                with self._phase('save'):
+                    self.save_outputs()
+
+        if save and self.save_fields and not streamed:
+            with self._phase('save'):
+                self._save_fields(prb, solution)
+        elif save and self.save_fields and (
+            self.fields_format != 'npy' or self.fields_precision != 'double'
+        ):
+            warnings.warn(
+                "The fields were streamed to {}. fields_format and "
+                "fields_precision are ignored for streamed fields.".format(
+                    self.fields_filename
+                )
             )
-
 
         self._fields = fields
         return fields
 
+    @property
+    def output_results(self):
+        """
+        arrays of the output requests from the last run, keyed by
+        '<output name>_<array>'. If the simulation has not been run, they
+        are loaded from the :code:`outputs_filename` in the working
+        directory if there is one.
+
+        :rtype: dict
+        """
+        if getattr(self, '_output_results', None) is None:
+            f = '/'.join([self.directory, self.outputs_filename])
+            if os.path.isfile(f):
+                self._output_results = load_outputs(f)
+        return getattr(self, '_output_results', None)
+
+    def save_outputs(self, filename=None, directory=None):
+        """
+        Save the outputs of the last run to npz
+
+        :param str filename: filename for the outputs
+        :param str directory: working directory for saving the file
+        """
+        if filename is None:
+            filename = self.outputs_filename
+
+        if directory is None:
+            directory = self.directory
+
+        f = '/'.join([directory, filename])
+        np.savez(f, **self.output_results)
+        print('Saved {}'.format(f))
+
+    def _phase(self, name):
+        """
+        context manager that records a phase of the run in the profile
+        """
+        profiler = getattr(self, '_profiler', None)
+        if profiler is None:
+            phase = null_phase(name)
+        else:
+            phase = profiler.phase(name)
+
+        # progress reporting of submitted runs, see casingSimulations.futures
+        callback = getattr(self, '_phase_callback', None)
+        if callback is None:
+            return phase
+        return report_phase(phase, name, callback)
+
+    def _assemble_sources(self):
+        """
+        construct the source terms
+        """
+        if getattr(self, 'srcList', None) is not None:
+            self.srcList.srcList
+
+    @property
+    def profile(self):
+        """
+        wall time, CPU time and peak resident set size of each phase of the
+        last run: validation, mesh, physprops, sources, setup, assembly,
+        factorization, solve and save. If the simulation has not been run,
+        the profile is loaded from the :code:`profile_filename` in the
+        working directory if there is one.
+
+        :rtype: dict
+        """
+        if getattr(self, '_profile', None) is None:
+            f = '/'.join([self.directory, self.profile_filename])
+            if os.path.isfile(f):
+                self._profile = load_profile(f)
+        return getattr(self, '_profile', None)
+
+    def save_profile(self, filename=None, directory=None):
+        """
+        Save the profile of the last run to json
+
+        :param str filename: filename for the profile
+        :param str directory: working directory for saving the file
+        """
+        if filename is None:
+            filename = self.profile_filename
+
+        if directory is None:
+            directory = self.directory
+
+        f = '/'.join([directory, filename])
+        with open(f, 'w') as outfile:
+            json.dump(self.profile, outfile, indent=2)
+
+    @property
+    def chunked_fields_filename(self):
+        """
+        filename for a chunked fields file
+
+        :rtype: str
+        """
+        return '{}.npz'.format(os.path.splitext(self.fields_filename)[0])
+
+    def _fields_chunks(self, prb):
+        """
+        chunks of a chunked fields file: a list of (label, indices) tuples
+        selecting along the last axis of the solution
+        """
+        return [(None, np.arange(prb.survey.nSrc))]
+
+    def _output_chunks(self, prb, fields):
+        """
+        chunks of :code:`_fields_chunks` as (indices, data) tuples for
+        evaluating the output requests, where data is a function of the
+        name of a field that returns the field for those indices
+        """
+        srcList = prb.survey.srcList
+        for _, index in self._fields_chunks(prb):
+            srcs = [srcList[i] for i in index]
+            yield index, lambda field, srcs=srcs: fields[srcs, field]
+
+    @property
+    def _outputs_while_solving(self):
+        """
+        True if the outputs are evaluated as the fields are solved and the
+        fields are then dropped, so the full fields are never held: only the
+        outputs are kept (:code:`save_fields=False`), the result cache is not
+        used and the fields are not asked for with :code:`fields()`
+        """
+        return False
+
+    def _solve_output_chunks(self, prb, model):
+        """
+        solve the forward problem one chunk at a time and yield the chunks
+        as (indices, data) tuples, see :code:`_output_chunks`
+        """
+        raise NotImplementedError
+
+    def _save_fields(self, prb, solution):
+        """
+        Save the solution in the format given by :code:`fields_format`
+        """
+        if self.fields_format == 'chunked':
+            f = '/'.join([self.directory, self.chunked_fields_filename])
+            save_fields_chunked(
+                f, solution, self._fields_chunks(prb),
+                compress=self.fields_compression,
+                precision=self.fields_precision
+            )
+        else:
+            f = '/'.join([self.directory, self.fields_filename])
+            np.save(
+                f,
+                np.asfortranarray(
+                    solution,
+                    dtype=storage_dtype(solution.dtype, self.fields_precision)
+                )
+            )
+        print('Saved {}'.format(f))
+
+    def _compute_fields(self, prb, model, resume=False):
+        """
+        Solve the forward problem
+
+        :param SimPEG.Problem.BaseProblem prb: paired SimPEG problem
+        :param numpy.ndarray model: model vector
+        :param bool resume: resume from the last checkpoint
+        :rtype: SimPEG.Fields
+        """
+        self._set_model(prb, model)
+        with self._phase('fields'):
+            return prb.fields(model)
+
+    def _set_model(self, prb, model):
+        """
+        Set the model of the problem. If :code:`cache_operators` is True, the
+        inner product matrices computed for the previous model are added to
+        the operator cache, and those of the new model that are in the cache
+        (e.g. the sigma matrices in a mu sweep) are restored on the problem.
+
+        The physical properties build a new model vector each time, so
+        models are compared by content. Setting the model the problem
+        already has keeps its matrices and does not touch the cache.
+
+        :param SimPEG.Problem.BaseProblem prb: paired SimPEG problem
+        :param numpy.ndarray model: model vector
+        """
+        if prb.model is not None:
+            if content_hash(prb.model) == content_hash(model):
+                return
+            self._store_operators(prb)
+        prb.model = model
+        if self.cache_operators:
+            with self._phase('operator cache'):
+                restored = operator_cache.restore(
+                    prb, self.meshGenerator.mesh_hash
+                )
+            if len(restored) > 0:
+                print('   reusing {}'.format(', '.join(restored)))
+
+    def _store_operators(self, prb):
+        """
+        add the inner product matrices computed by the problem to the
+        operator cache
+        """
+        if self.cache_operators and prb.model is not None:
+            operator_cache.store(prb, self.meshGenerator.mesh_hash)
+
+    @property
+    def _streams_fields(self):
+        """
+        True if the fields are written to the fields file as they are
+        computed
+        """
+        return False
+
+    # ----------------- Cost estimate ----------------- #
+
+    _system_dtype = float
+
+    @property
+    def _system_location(self):
+        """
+        where the unknowns of the linear system live: 'E' (edges) for the e
+        and h formulations, 'F' (faces) for the b and j formulations
+        """
+        return {'e': 'E', 'h': 'E', 'b': 'F', 'j': 'F'}[self.formulation]
+
+    def _system_size(self, mesh):
+        """
+        number of unknowns in the linear system
+        """
+        return int({
+            'E': mesh.nE, 'F': mesh.nF, 'CC': mesh.nC
+        }[self._system_location])
+
+    def _solve_counts(self):
+        """
+        number of factorizations, solves (calls with all of the right hand
+        sides at once), sources and stored times, and the maximum number of
+        factorizations held at once
+        """
+        raise NotImplementedError
+
+    def _n_sources(self):
+        """
+        number of casing sources
+        """
+        if getattr(self, 'srcList', None) is not None:
+            return len(self.srcList.sources)
+        return 1
+
+    def estimate(self, cost_model=None):
+        """
+        Estimate the size and cost of the simulation without solving it.
+        Only the mesh is built. Memory (bytes) and times (s) come from a
+        :code:`casingSimulations.estimate.CostModel`, which can be
+        calibrated with the profiles of previous runs.
+
+        .. code:: python
+
+            from casingSimulations.estimate import estimate_summary
+            print(estimate_summary(sim.estimate()))
+
+        :param CostModel cost_model: cost model, defaults to the uncalibrated
+                                     model
+        :rtype: dict
+        """
+        if cost_model is None:
+            cost_model = CostModel()
+
+        mesh = self.meshGenerator.mesh
+        n = self._system_size(mesh)
+        counts = self._solve_counts()
+
+        factorization_memory = cost_model('factorization_memory', n)
+        fields_memory = float(
+            n * counts['n_sources'] * counts['n_times'] *
+            np.dtype(self._system_dtype).itemsize
+        )
+        peak_memory = (
+            counts['concurrent_factorizations'] * factorization_memory +
+            (0. if self._streams_fields else fields_memory)
+        )
+
+        return OrderedDict([
+            ('simulation', type(self).__name__),
+            ('formulation', self.formulation),
+            ('nC', int(mesh.nC)),
+            ('nF', int(mesh.nF)),
+            ('nE', int(mesh.nE)),
+            ('nN', int(mesh.nN)),
+            ('system_location', self._system_location),
+            ('system_size', n),
+            ('nnz', operator_nnz(mesh, self._system_location)),
+            ('n_factorizations', counts['n_factorizations']),
+            ('n_solves', counts['n_solves']),
+            ('n_sources', counts['n_sources']),
+            ('n_times', counts['n_times']),
+            (
+                'concurrent_factorizations',
+                counts['concurrent_factorizations']
+            ),
+            ('factorization_memory', factorization_memory),
+            ('fields_memory', fields_memory),
+            ('peak_memory', peak_memory),
+            (
+                'factorization_time',
+                counts['n_factorizations'] *
+                cost_model('factorization_time', n)
+            ),
+            ('solve_time', counts['n_solves'] * cost_model('solve_time', n)),
+        ])
+
+    def _solution_shape(self, prb, nP):
+        """
+        shape of the array in which the fields object stores the solution
+        """
+        return (nP, prb.survey.nSrc)
+
+    def _solution_size(self, prb, f, solution):
+        """
+        number of mesh locations (cells, nodes, faces or edges) the solution
+        is defined on
+        """
+        return {
+            'CC': prb.mesh.nC, 'N': prb.mesh.nN,
+            'F': prb.mesh.nF, 'E': prb.mesh.nE
+        }[f.knownFields[solution]]
+
+    def _allocate_solution(self, prb, f, solution, dtype=float):
+        """
+        Allocate the storage for the solution in a fields object. It is in
+        fortran order so that the solution for each source (and time) is
+        contiguous, both in memory and in the saved fields file.
+        """
+        f._fields[solution] = np.zeros(
+            self._solution_shape(prb, self._solution_size(prb, f, solution)),
+            dtype=dtype, order='F'
+        )
+        return f._fields[solution]
+
+    def _solution(self, fields):
+        """
+        array in which the fields object stores the solution (not a copy)
+        """
+        return fields._fields['{}Solution'.format(self.formulation)]
+
+    def _fields_from_solution(self, prb, solution):
+        """
+        Create a fields object that uses a stored solution as its storage.
+        The solution is not copied, so it can be a memory-mapped array.
+
+        :param SimPEG.Problem.BaseProblem prb: paired SimPEG problem with
+                                               the model set
+        :param numpy.ndarray solution: stored solution
+        :rtype: SimPEG.Fields
+        """
+        f = prb.fieldsPair(prb.mesh, prb.survey)
+        f._fields['{}Solution'.format(self.formulation)] = solution.reshape(
+            self._solution_shape(prb, solution.shape[0]), order='A'
+        )
+        return f
+
 
 class SimulationFDEM(BaseSimulation):
     """
@@ -222,11 +962,374 @@ class SimulationFDEM(BaseSimulation):
         choices=["e", "b", "h", "j"]
     )
 
+    cache_factorizations = properties.Bool(
+        "keep factorizations in the process-level cache so that later runs "
+        "with the same mesh, model and frequency can reuse them. All of the "
+        "frequencies are then held in memory at once",
+        default=False
+    )
+
+    num_procs = properties.Integer(
+        "number of processes over which the frequencies are distributed. "
+        "Each process does its own factorizations",
+        default=1,
+        min=1
+    )
+
+    perturbation = properties.StringChoice(
+        "solve a flawed casing model (FlawedCasingMixin) as a perturbation "
+        "of the same model without the flaw, reusing the factorization of "
+        "the model without the flaw: 'woodbury' (low-rank correction) or "
+        "'iterative' (GMRES preconditioned with the factorization). The "
+        "factorizations of the model without the flaw are always kept in "
+        "the factorization cache, whatever cache_factorizations is, so that "
+        "later flaws of the same model reuse them",
+        choices=['woodbury', 'iterative'],
+        required=False
+    )
+
+    perturbation_max_rank = properties.Integer(
+        "largest perturbation (number of changed rows of the system) solved "
+        "with a low-rank correction, larger ones are solved iteratively",
+        default=200,
+        min=0
+    )
+
+    perturbation_tol = properties.Float(
+        "relative tolerance of the iterative perturbation solve",
+        default=1e-10,
+        min=0.
+    )
+
     physics = "FDEM"
 
+    _result_props = [
+        'formulation', 'solver', 'solver_opts', 'perturbation',
+        'perturbation_max_rank', 'perturbation_tol'
+    ]
+
     def __init__(self, **kwargs):
         super(SimulationFDEM, self).__init__(**kwargs)
 
+    def _factorization_key(self, prb, model_hash, freq):
+        """
+        key of a factorization in the factorization cache
+        """
+        return content_hash(
+            self.physics, self.formulation, prb.Solver.__name__,
+            prb.solverOpts, self.meshGenerator.mesh_hash, model_hash,
+            float(freq)
+        )
+
+    def _compute_fields(self, prb, model, resume=False):
+        """
+        Solve the FDEM problem one frequency at a time. If
+        :code:`cache_factorizations` is True, factorizations are taken from
+        and added to the process-level factorization cache, so a later run
+        with the same mesh, model, formulation and frequency only needs to
+        do the back-substitutions. If :code:`num_procs` is larger than one,
+        the frequencies that are not in the cache are distributed over a
+        pool of worker processes.
+
+        If :code:`perturbation` is set, the flawed model is instead solved
+        as a perturbation of the model without the flaw, see
+        :code:`_compute_perturbed_fields`.
+        """
+        if self.perturbation is not None:
+            return self._compute_perturbed_fields(prb, model)
+
+        self._set_model(prb, model)
+        f = prb.fieldsPair(prb.mesh, prb.survey)
+        self._allocate_solution(prb, f, prb._solutionType, dtype=complex)
+
+        model_hash = content_hash(model)
+
+        freqs = []
+        for freq in prb.survey.freqs:
+            key = self._factorization_key(prb, model_hash, freq)
+            Ainv = None
+            if self.cache_factorizations:
+                Ainv = factorization_cache.get(key)
+
+            if Ainv is not None:
+                print('   reusing factorization for {} Hz'.format(freq))
+                self._solve_frequency(prb, f, freq, key, Ainv=Ainv)
+            else:
+                freqs.append((freq, key))
+
+        num_procs = min(self.num_procs, len(freqs))
+        if num_procs > 1 and multiprocessing.current_process().daemon:
+            warnings.warn(
+                "Worker processes can not start a pool, solving the "
+                "frequencies in serial"
+            )
+            num_procs = 1
+
+        if num_procs > 1:
+            print(
+                '   distributing {} frequencies over {} processes'.format(
+                    len(freqs), num_procs
+                )
+            )
+            serialized = self.serialize()
+            tasks = [
+                (serialized, [freq for freq, _ in freqs[i::num_procs]])
+                for i in range(num_procs)
+            ]
+            pool = multiprocessing.Pool(processes=num_procs)
+            try:
+                with self._phase('parallel solve'):
+                    results = pool.map(_solve_frequencies, tasks)
+            finally:
+                pool.close()
+                pool.join()
+
+            for result in results:
+                for freq, u in result:
+                    self._set_solution(prb, f, freq, u)
+
+        else:
+            for freq, key in freqs:
+                self._solve_frequency(prb, f, freq, key)
+
+        return f
+
+    def _solve_frequency(self, prb, f, freq, key, Ainv=None):
+        """
+        Solve at a frequency and put the solution in the fields. Without a
+        factorization, the system is factored, and the factorization is
+        added to the factorization cache if :code:`cache_factorizations` is
+        True.
+        """
+        cached = Ainv is not None
+        if not cached:
+            with self._phase('assembly'):
+                A = prb.getA(freq)
+            with self._phase('factorization'):
+                Ainv = prb.Solver(A, **prb.solverOpts)
+            cached = (
+                self.cache_factorizations and
+                factorization_cache.put(
+                    key, Ainv, factorization_nbytes(Ainv, A)
+                )
+            )
+        with self._phase('sources'):
+            rhs = prb.getRHS(freq)
+        with self._phase('solve'):
+            self._set_solution(prb, f, freq, Ainv * rhs)
+        if not cached:
+            Ainv.clean()
+
+    def _baseline_model(self):
+        """
+        model vector of the model parameters without the flaw
+        """
+        if not hasattr(self.modelParameters, 'baseline'):
+            raise TypeError(
+                "perturbation solves need a flawed casing model "
+                "(FlawedCasingMixin), not a {}".format(
+                    type(self.modelParameters).__name__
+                )
+            )
+        return PhysicalProperties(
+            self.meshGenerator, self.modelParameters.baseline()
+        ).model
+
+    def _perturbation_solver(self, A, A0, A0inv):
+        """
+        solver for the flawed system that uses the factorization of the
+        system without the flaw
+        """
+        if self.perturbation == 'woodbury':
+            rows = perturbation_rows(A, A0)
+            rank = len(rows)
+            if rank <= self.perturbation_max_rank:
+                print('   low-rank correction of rank {}'.format(rank))
+                return Woodbury(A, A0inv, A0, rows=rows)
+            warnings.warn(
+                "The flaw changes {} rows of the system, more than "
+                "perturbation_max_rank={}, solving it iteratively".format(
+                    rank, self.perturbation_max_rank
+                )
+            )
+        return PerturbationGMRES(A, A0inv, tol=self.perturbation_tol)
+
+    def _compute_perturbed_fields(self, prb, model):
+        """
+        Solve a flawed casing model with the factorization of the same
+        model without the flaw (the baseline). The baseline factorizations
+        are always kept in the factorization cache, since reusing them is
+        the point of a perturbation solve: a study of many flaws in the
+        same process factors the baseline once per frequency (as long as
+        they fit in the cache's memory budget), and each flaw then costs a
+        few back-substitutions.
+        """
+        f = prb.fieldsPair(prb.mesh, prb.survey)
+        self._allocate_solution(prb, f, prb._solutionType, dtype=complex)
+
+        with self._phase('physprops'):
+            baseline = self._baseline_model()
+        baseline_hash = content_hash(baseline)
+
+        for freq in prb.survey.freqs:
+            self._solve_perturbed_frequency(
+                prb, f, freq, model, baseline, baseline_hash
+            )
+
+        return f
+
+    def _solve_perturbed_frequency(
+        self, prb, f, freq, model, baseline, baseline_hash
+    ):
+        """
+        Solve the flawed model at a frequency with the factorization of the
+        baseline and put the solution in the fields
+        """
+        key = self._factorization_key(prb, baseline_hash, freq)
+        A0inv = factorization_cache.get(key)
+
+        self._set_model(prb, baseline)
+        with self._phase('assembly'):
+            A0 = prb.getA(freq)
+
+        cached = A0inv is not None
+        if cached:
+            print('   reusing baseline factorization for {} Hz'.format(freq))
+        else:
+            with self._phase('factorization'):
+                A0inv = prb.Solver(A0, **prb.solverOpts)
+            cached = factorization_cache.put(
+                key, A0inv, factorization_nbytes(A0inv, A0)
+            )
+
+        self._set_model(prb, model)
+        with self._phase('assembly'):
+            A = prb.getA(freq)
+        with self._phase('perturbation'):
+            Ainv = self._perturbation_solver(A, A0, A0inv)
+        with self._phase('sources'):
+            rhs = prb.getRHS(freq)
+        with self._phase('solve'):
+            self._set_solution(prb, f, freq, Ainv * rhs)
+
+        Ainv.clean()
+        if not cached:
+            A0inv.clean()
+
+    @property
+    def _outputs_while_solving(self):
+        """
+        Outputs that are the only thing kept from a run are evaluated one
+        frequency at a time, right after the frequency is solved, so only
+        the solution at one frequency is held at once. Frequency parallel
+        runs solve all of the frequencies before any outputs are evaluated.
+        """
+        return (
+            len(self.outputs or []) > 0 and not self.save_fields and
+            not self.use_result_cache and self.num_procs == 1 and
+            not getattr(self, '_keep_fields', False)
+        )
+
+    def _frequency_fields(self, prb, freq):
+        """
+        fields object for the sources at a frequency, with storage for the
+        solution at that frequency only
+        """
+        survey = FDEM.Survey(prb.survey.getSrcByFreq(freq))
+        # share the problem without pairing it, so the problem keeps the
+        # survey with all of the frequencies
+        survey._prob = prb
+        f = prb.fieldsPair(prb.mesh, survey)
+        f._fields[prb._solutionType] = np.zeros(
+            (self._solution_size(prb, f, prb._solutionType), survey.nSrc),
+            dtype=complex, order='F'
+        )
+        return f
+
+    def _solve_output_chunks(self, prb, model):
+        """
+        Solve one frequency at a time and yield the fields at each frequency
+        for evaluating the outputs. The fields at a frequency are dropped
+        once the next frequency is asked for.
+        """
+        if self.perturbation is not None:
+            with self._phase('physprops'):
+                baseline = self._baseline_model()
+            baseline_hash = content_hash(baseline)
+        else:
+            self._set_model(prb, model)
+            model_hash = content_hash(model)
+
+        for freq, index in self._fields_chunks(prb):
+            f = self._frequency_fields(prb, freq)
+            if self.perturbation is not None:
+                self._solve_perturbed_frequency(
+                    prb, f, freq, model, baseline, baseline_hash
+                )
+            else:
+                key = self._factorization_key(prb, model_hash, freq)
+                Ainv = None
+                if self.cache_factorizations:
+                    Ainv = factorization_cache.get(key)
+                if Ainv is not None:
+                    print('   reusing factorization for {} Hz'.format(freq))
+                self._solve_frequency(prb, f, freq, key, Ainv=Ainv)
+
+            yield index, lambda field, f=f: self._frequency_field(f, field)
+            del f
+
+    def _frequency_field(self, f, field):
+        """
+        field at a frequency for evaluating the outputs
+        """
+        with self._phase('outputs'):
+            return f[:, field]
+
+    def _set_solution(self, prb, f, freq, u):
+        """
+        put the solution for all sources at a frequency in the fields
+        """
+        Srcs = prb.survey.getSrcByFreq(freq)
+        f[Srcs, prb._solutionType] = u
+
+    def _fields_chunks(self, prb):
+        """
+        one chunk per frequency
+        """
+        srcList = prb.survey.srcList
+        return [
+            (
+                freq,
+                np.array([
+                    i for i, src in enumerate(srcList) if src.freq == freq
+                ])
+            )
+            for freq in sorted(prb.survey.freqs)
+        ]
+
+    _system_dtype = complex
+
+    def _solve_counts(self):
+        """
+        one factorization and one solve per frequency. Cached
+        factorizations are all held at once, with num_procs > 1 each
+        process holds one.
+        """
+        nF = len(np.unique(self.modelParameters.freqs))
+        if self.num_procs > 1:
+            concurrent = min(self.num_procs, nF)
+        elif self.cache_factorizations:
+            concurrent = nF
+        else:
+            concurrent = 1
+        return dict(
+            n_factorizations=nF,
+            n_solves=nF,
+            n_sources=self._n_sources() * nF,
+            n_times=1,
+            concurrent_factorizations=concurrent,
+        )
+
     @property
     def prob(self):
         if getattr(self, '_prob', None) is None:
@@ -236,7 +1339,8 @@ class SimulationFDEM(BaseSimulation):
                 self.meshGenerator.mesh,
                 sigmaMap=self.physprops.wires.sigma,
                 muMap=self.physprops.wires.mu,
-                Solver=Solver,
+                Solver=self.Solver,
+                solverOpts=self._solverOpts,
                 verbose=self.verbose
             )
 
@@ -269,11 +1373,432 @@ class SimulationTDEM(BaseSimulation):
         choices=["e", "b", "h", "j"]
     )
 
+    max_factorizations = properties.Integer(
+        "warn if the time-step schedule requires more than this many "
+        "factorizations",
+        default=10,
+        min=1
+    )
+
+    checkpoint_steps = properties.Integer(
+        "write a checkpoint every n time steps",
+        required=False,
+        min=1
+    )
+
+    checkpoint_interval = properties.Float(
+        "write a checkpoint when this many seconds have passed since the "
+        "last one",
+        required=False,
+        min=0.
+    )
+
+    checkpoint_filename = properties.String(
+        "filename for the checkpoint",
+        default="checkpointTDEM.npz"
+    )
+
+    stream_fields = properties.Bool(
+        "write the solution at each time step to a memory-mapped fields file "
+        "as it is computed rather than keeping all times in memory",
+        default=False
+    )
+
+    frequency_transform = properties.Bool(
+        "compute the step-off response at the times of the time steps by "
+        "transforming FDEM solutions at logarithmically spaced frequencies "
+        "rather than by time stepping",
+        default=False
+    )
+
+    transform_freqs = properties.Array(
+        "frequencies solved for the frequency transform (Hz), by default "
+        "they are chosen from the times",
+        required=False
+    )
+
+    transform_freqs_per_decade = properties.Integer(
+        "number of frequencies per decade for the frequency transform",
+        default=10,
+        min=1
+    )
+
+    transform_num_procs = properties.Integer(
+        "number of processes over which the frequencies of the frequency "
+        "transform are distributed",
+        default=1,
+        min=1
+    )
+
     physics = "TDEM"
 
+    _result_props = [
+        'formulation', 'solver', 'solver_opts', 'frequency_transform',
+        'transform_freqs', 'transform_freqs_per_decade'
+    ]
+
     def __init__(self, **kwargs):
         super(SimulationTDEM, self).__init__(**kwargs)
 
+    @property
+    def _checkpoint_file(self):
+        return '/'.join([self.directory, self.checkpoint_filename])
+
+    def _write_checkpoint(self, F, solution, nT):
+        """
+        Write the solution for the first nT times, along with the simulation
+        parameters, to the checkpoint file
+        """
+        f = self._checkpoint_file
+        checkpoint = dict(
+            nT=nT,
+            result_hash=self.result_hash,
+            simulation=json.dumps(self.serialize())
+        )
+
+        # streamed solutions are already in the fields file
+        if self.stream_fields:
+            F._fields[solution].flush()
+        else:
+            checkpoint['solution'] = F[:, solution, :nT]
+
+        tmp = '{}.tmp'.format(f)
+        with open(tmp, 'wb') as outfile:
+            np.savez(outfile, **checkpoint)
+        os.rename(tmp, f)
+        print('   checkpoint at time step {}'.format(nT - 1))
+
+    def _load_checkpoint(self, prb, F, solution, streamed=False):
+        """
+        Load the checkpoint into the fields. If the solution was streamed,
+        it is read from the fields file, which must have been opened
+        (:code:`streamed=True`).
+
+        :rtype: int
+        :return: number of times that were loaded, 0 if there is no
+                 checkpoint for this simulation
+        """
+        f = self._checkpoint_file
+        if not os.path.isfile(f):
+            print('   no checkpoint found, starting from the initial fields')
+            return 0
+
+        checkpoint = np.load(f)
+        if str(checkpoint['result_hash']) != self.result_hash:
+            warnings.warn(
+                "The checkpoint {} was written by a different simulation, "
+                "starting from the initial fields".format(f)
+            )
+            return 0
+
+        nT = int(checkpoint['nT'])
+        if 'solution' in checkpoint.files:
+            F[:, solution, :nT] = checkpoint['solution'].reshape(
+                -1, prb.survey.nSrc, nT
+            )
+        elif not streamed:
+            warnings.warn(
+                "The checkpoint {} refers to a streamed fields file that "
+                "could not be opened, starting from the initial "
+                "fields".format(f)
+            )
+            return 0
+        print('   resuming from time step {}'.format(nT - 1))
+        return nT
+
+    def _transform_freqs(self):
+        """
+        frequencies solved for the frequency transform
+        """
+        if self.transform_freqs is not None:
+            return np.sort(np.asarray(self.transform_freqs, dtype=float))
+        return transform_frequencies(
+            np.cumsum(self.modelParameters.timeSteps),
+            n_per_decade=self.transform_freqs_per_decade
+        )
+
+    def _transform_simulation(self, freqs):
+        """
+        FDEM simulation with the same model, mesh, sources and formulation
+        at the frequencies of the frequency transform
+        """
+        modelParameters = self.modelParameters.copy()
+        modelParameters.freqs = freqs
+        sources = []
+        for src in self.srcList.sources:
+            src = src.copy()
+            src.modelParameters = modelParameters
+            src.physics = "FDEM"
+            sources.append(src)
+
+        kwargs = dict(
+            (key, getattr(self, key)) for key in ['solver_opts', 'num_threads']
+            if getattr(self, key) is not None
+        )
+        simulation = SimulationFDEM(
+            modelParameters=modelParameters,
+            meshGenerator=self.meshGenerator,
+            srcList=SourceList(sources=sources),
+            formulation=self.formulation,
+            solver=self.solver,
+            num_procs=self.transform_num_procs,
+            cache_factorizations=False,
+            directory=self.directory,
+            **kwargs
+        )
+        simulation.share_mesh(self.meshGenerator.mesh)
+        return simulation
+
+    def _compute_transformed_fields(self, prb, model):
+        """
+        Compute the step-off response at the times of the time steps from
+        FDEM solutions at logarithmically spaced frequencies (see
+        :code:`casingSimulations.transform`). The frequencies are
+        independent, so they can be distributed over
+        :code:`transform_num_procs` processes, and no time-step sizes need
+        to be factored. The fields at the initial time are the initial
+        fields of the TDEM problem, and the fields are stored in the same
+        structure as those from time stepping.
+        """
+        self._set_model(prb, model)
+        F = prb.fieldsPair(prb.mesh, prb.survey)
+        solution = '{}Solution'.format(prb._fieldType)
+        self._allocate_solution(prb, F, solution)
+
+        times = np.cumsum(prb.timeSteps)
+        freqs = self._transform_freqs()
+        print('   transforming {} frequencies to {} times'.format(
+            len(freqs), len(times)
+        ))
+
+        fdem = self._transform_simulation(freqs)
+        fdem._profiler = getattr(self, '_profiler', None)
+        fprb = fdem.prob
+        u = fdem._solution(fdem._compute_fields(fprb, fdem.physprops.model))
+
+        # the FDEM sources are ordered by casing source, then by frequency
+        nSrc = prb.survey.nSrc
+        u = u.reshape(u.shape[0], nSrc, len(freqs)).transpose(2, 0, 1)
+
+        with self._phase('transform'):
+            F[:, solution, 0] = prb.getInitialFields()
+            response = step_off_response(freqs, u, times)
+            for tInd in range(len(times)):
+                F[:, solution, tInd + 1] = response[tInd]
+
+        return F
+
+    @property
+    def factorization_stats(self):
+        """
+        number of factorizations done and the number of time steps that
+        reused a factorization in the last run
+
+        :rtype: dict
+        """
+        return getattr(self, '_factorization_stats', None)
+
+    @property
+    def _streams_fields(self):
+        return self.stream_fields and not self.frequency_transform
+
+    def _solution_shape(self, prb, nP):
+        return (nP, prb.survey.nSrc, len(prb.timeSteps) + 1)
+
+    def _fields_chunks(self, prb):
+        """
+        one chunk per time
+        """
+        times = np.hstack([0., np.cumsum(prb.timeSteps)])
+        return [(time, np.r_[i]) for i, time in enumerate(times)]
+
+    def _output_chunks(self, prb, fields):
+        for _, index in self._fields_chunks(prb):
+            yield index, lambda field, i=int(index[0]): fields[:, field, i]
+
+    def _solve_counts(self):
+        """
+        one factorization per distinct time-step size and one solve per
+        time step. A factorization is held from the first to the last time
+        step that uses it. With the frequency transform, one factorization
+        and solve per frequency.
+        """
+        timeSteps = np.asarray(self.modelParameters.timeSteps)
+        if self.frequency_transform:
+            nF = len(self._transform_freqs())
+            return dict(
+                n_factorizations=nF,
+                n_solves=nF,
+                n_sources=self._n_sources(),
+                n_times=len(timeSteps) + 1,
+                concurrent_factorizations=min(self.transform_num_procs, nF),
+            )
+        first_use, last_use = {}, {}
+        for tInd, dt in enumerate(timeSteps):
+            first_use.setdefault(dt, tInd)
+            last_use[dt] = tInd
+        concurrent = max([
+            sum(
+                1 for dt in first_use
+                if first_use[dt] <= tInd <= last_use[dt]
+            )
+            for tInd in range(len(timeSteps))
+        ] + [1])
+        return dict(
+            n_factorizations=len(first_use),
+            n_solves=len(timeSteps),
+            n_sources=self._n_sources(),
+            n_times=len(timeSteps) + 1,
+            concurrent_factorizations=concurrent,
+        )
+
+    def _open_fields_file(self, prb, F, solution, resume=False):
+        """
+        Open the fields file as a memory-mapped array for streaming the
+        solution. Each time is stored contiguously (fortran order). When
+        resuming, an existing fields file is opened for updating.
+
+        :rtype: tuple
+        :return: (memory-mapped array, True if an existing file was opened)
+        """
+        f = '/'.join([self.directory, self.fields_filename])
+        shape = self._solution_shape(
+            prb, self._solution_size(prb, F, solution)
+        )
+
+        if resume and os.path.isfile(f):
+            storage = np.lib.format.open_memmap(f, mode='r+')
+            if storage.shape == shape:
+                return storage, True
+            del storage
+
+        storage = np.lib.format.open_memmap(
+            f, mode='w+', dtype=float, shape=shape, fortran_order=True
+        )
+        return storage, False
+
+    def _compute_fields(self, prb, model, resume=False):
+        """
+        Step through time, factoring the system once for each distinct
+        time-step size. A factorization is kept until the last time step of
+        its size, so time-step sizes that repeat later in the schedule are not
+        refactored.
+
+        If :code:`checkpoint_steps` or :code:`checkpoint_interval` is set, the
+        solution is periodically written to the checkpoint file. With
+        :code:`resume=True`, time stepping restarts from the last checkpoint.
+
+        If :code:`frequency_transform` is True, the fields are instead
+        computed with :code:`_compute_transformed_fields`.
+        """
+        if self.frequency_transform:
+            return self._compute_transformed_fields(prb, model)
+
+        timeSteps = np.asarray(prb.timeSteps)
+
+        # last time-step index at which each time-step size is used
+        last_use = dict((dt, tInd) for tInd, dt in enumerate(timeSteps))
+        if len(last_use) > self.max_factorizations:
+            warnings.warn(
+                "The time-step schedule has {} distinct time-step sizes, "
+                "each requires a factorization. Consider grouping the "
+                "{} time steps into fewer blocks of constant size".format(
+                    len(last_use), len(timeSteps)
+                )
+            )
+
+        self._set_model(prb, model)
+        F = prb.fieldsPair(prb.mesh, prb.survey)
+        solution = '{}Solution'.format(prb._fieldType)
+
+        streamed = False
+        if self.stream_fields:
+            F._fields[solution], streamed = self._open_fields_file(
+                prb, F, solution, resume=resume
+            )
+        else:
+            self._allocate_solution(prb, F, solution)
+
+        start = 0
+        if resume:
+            start = max(
+                self._load_checkpoint(prb, F, solution, streamed=streamed) - 1,
+                0
+            )
+        if start == 0:
+            F[:, solution, 0] = prb.getInitialFields()
+
+        checkpoint = (
+            self.checkpoint_steps is not None or
+            self.checkpoint_interval is not None
+        )
+        t_checkpoint = time.time()
+
+        stats = {'factorizations': 0, 'reused': 0}
+        factors = {}
+        try:
+            for tInd, dt in enumerate(timeSteps):
+                if tInd < start:
+                    continue
+
+                Ainv = factors.get(dt)
+                if Ainv is None:
+                    if self.verbose:
+                        print('Factoring...   (dt = {:e})'.format(dt))
+                    with self._phase('assembly'):
+                        Adiag = prb.getAdiag(tInd)
+                    with self._phase('factorization'):
+                        Ainv = prb.Solver(Adiag, **prb.solverOpts)
+                    factors[dt] = Ainv
+                    stats['factorizations'] += 1
+                else:
+                    stats['reused'] += 1
+
+                with self._phase('sources'):
+                    rhs = prb.getRHS(tInd+1)
+                with self._phase('assembly'):
+                    Asubdiag = prb.getAsubdiag(tInd)
+                with self._phase('solve'):
+                    sol = Ainv * (rhs - Asubdiag * F[:, solution, tInd])
+                    if sol.ndim == 1:
+                        sol.shape = (sol.size, 1)
+                    F[:, solution, tInd+1] = sol
+
+                if checkpoint and (
+                    (
+                        self.checkpoint_steps is not None and
+                        (tInd + 1) % self.checkpoint_steps == 0
+                    ) or (
+                        self.checkpoint_interval is not None and
+                        time.time() - t_checkpoint >= self.checkpoint_interval
+                    )
+                ):
+                    with self._phase('checkpoint'):
+                        self._write_checkpoint(F, solution, tInd + 2)
+                    t_checkpoint = time.time()
+
+                # this time-step size is not used again
+                if last_use[dt] == tInd:
+                    factors.pop(dt).clean()
+        finally:
+            for Ainv in factors.values():
+                Ainv.clean()
+
+        print(
+            '   {factorizations} factorizations, {reused} time steps reused '
+            'a factorization'.format(**stats)
+        )
+        self._factorization_stats = stats
+
+        if self.stream_fields:
+            F._fields[solution].flush()
+
+        # the run is complete, the checkpoint is no longer needed
+        if os.path.isfile(self._checkpoint_file):
+            os.remove(self._checkpoint_file)
+
+        return F
+
     @property
     def prob(self):
         if getattr(self, '_prob', None) is None:
@@ -284,7 +1809,8 @@ class SimulationTDEM(BaseSimulation):
                     timeSteps=self.modelParameters.timeSteps,
                     sigmaMap=self.physprops.wires.sigma,
                     mu=self.physprops.mu, # right now the TDEM code doesn't support mu inversions
-                    Solver=Solver,
+                    Solver=self.Solver,
+                    solverOpts=self._solverOpts,
                     verbose=self.verbose
                 )
 
@@ -324,22 +1850,130 @@ class SimulationDC(BaseSimulation):
         default="phi"
     )
 
+    solve_poles = properties.Bool(
+        "solve once for each unique electrode location (pole) rather than "
+        "for each dipole. The dipole responses are built by superposition "
+        "with dipole_solution",
+        default=False
+    )
+
+    _result_props = [
+        'formulation', 'solver', 'solver_opts', 'src_a', 'src_b',
+        'solve_poles'
+    ]
+
+    _system_location = 'CC'
+
     physics = "DC"
 
     def __init__(self, **kwargs):
         super(SimulationDC, self).__init__(**kwargs)
 
-        self._prob = DC.Problem3D_CC(
-            self.meshGenerator.mesh,
-            sigmaMap=self.physprops.wires.sigma,
-            bc_type='Dirichlet',
-            Solver=Solver
+    @property
+    def prob(self):
+        if getattr(self, '_prob', None) is None:
+            self._prob = DC.Problem3D_CC(
+                self.meshGenerator.mesh,
+                sigmaMap=self.physprops.wires.sigma,
+                bc_type='Dirichlet',
+                Solver=self.Solver,
+                solverOpts=self._solverOpts
+            )
+            if self.solve_poles:
+                poles = self.poles[0]
+                self._srcList = [
+                    DC.Src.Pole([], poles[i, :])
+                    for i in range(poles.shape[0])
+                ]
+            else:
+                self._srcList = [
+                    DC.Src.Dipole([], self.src_a[i, :], self.src_b[i, :])
+                    for i in range(self.src_a.shape[0])
+                ]
+            # self._src = DC.Src.Dipole([], self.src_a, self.src_b)
+            self._survey = DC.Survey(self._srcList)
+
+            self._prob.pair(self._survey)
+        return self._prob
+
+    @property
+    def survey(self):
+        if getattr(self, '_survey', None) is None:
+            self.prob
+        return self._survey
+
+    @property
+    def poles(self):
+        """
+        unique electrode locations of the dipoles and, for each dipole, the
+        index of its a and b electrodes in them
+
+        :rtype: tuple
+        :return: (poles, index_a, index_b)
+        """
+        nD = self.src_a.shape[0]
+        poles, inverse = np.unique(
+            np.vstack([self.src_a, self.src_b]), axis=0, return_inverse=True
         )
-        self._srcList = [
-            DC.Src.Dipole([], self.src_a[i, :], self.src_b[i, :])
-            for i in range(self.src_a.shape[0])
-        ]
-        # self._src = DC.Src.Dipole([], self.src_a, self.src_b)
-        self._survey = DC.Survey(self._srcList)
+        inverse = inverse.ravel()
+        return poles, inverse[:nD], inverse[nD:]
 
-        self._prob.pair(self._survey)
+    def dipole_solution(self, fields=None):
+        """
+        potential for each dipole. If :code:`solve_poles` is True, it is
+        built by superposition of the pole solutions: the response of the
+        dipole AB is the response of A minus the response of B.
+
+        :param SimPEG.Fields fields: fields, defaults to those of the last
+                                     run
+        :rtype: numpy.ndarray
+        :return: (nC, number of dipoles) array
+        """
+        if fields is None:
+            fields = self.fields()
+        solution = self._solution(fields)
+        if not self.solve_poles:
+            return solution
+        _, index_a, index_b = self.poles
+        return solution[:, index_a] - solution[:, index_b]
+
+    def _compute_fields(self, prb, model, resume=False):
+        """
+        Factor the DC operator once and solve for all of the sources (poles
+        or dipoles) at once
+        """
+        self._set_model(prb, model)
+        f = prb.fieldsPair(prb.mesh, prb.survey)
+
+        with self._phase('assembly'):
+            A = prb.getA()
+        with self._phase('factorization'):
+            Ainv = prb.Solver(A, **prb.solverOpts)
+        with self._phase('sources'):
+            rhs = prb.getRHS()
+        with self._phase('solve'):
+            f[prb.survey.srcList, prb._solutionType] = Ainv * rhs
+        Ainv.clean()
+
+        if self.solve_poles:
+            print('   solved for {} poles of {} dipoles'.format(
+                prb.survey.nSrc, self.src_a.shape[0]
+            ))
+        return f
+
+    def _solve_counts(self):
+        """
+        one factorization and one solve with all of the sources (poles or
+        dipoles)
+        """
+        if self.solve_poles:
+            n_sources = self.poles[0].shape[0]
+        else:
+            n_sources = self.src_a.shape[0]
+        return dict(
+            n_factorizations=1,
+            n_solves=1,
+            n_sources=n_sources,
+            n_times=1,
+            concurrent_factorizations=1,
+        )
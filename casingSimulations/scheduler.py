@@ -0,0 +1,327 @@
+import glob
+import multiprocessing
+import os
+import re
+import warnings
+
+import properties
+
+from .estimate import CostModel
+from .jobs import JobQueue, SIMULATION_PARAMETERS, load_parameters
+from . import run
+from .profiling import load_profile
+
+
+# memory used by a python process with numpy, scipy and SimPEG imported
+# before any simulation is set up (bytes)
+BASELINE_MEMORY = 300e6
+
+# simulation set up by a script written by
+# casingSimulations.utils.writeSimulationPy
+SCRIPT_SIMULATION = re.compile(
+    r"casingSimulations\.run\.Simulation(?P<physics>\w+)\(\s*"
+    r"modelParameters='(?P<modelParameters>[^']*)',\s*"
+    r"meshGenerator='(?P<meshGenerator>[^']*)',\s*"
+    r"src='(?P<src>[^']*)'"
+)
+
+
+def script_simulation(filename):
+    """
+    Simulation set up by a simulation.py written by
+    :code:`casingSimulations.utils.writeSimulationPy`, built from the
+    model, mesh and source json files next to it. This is available before
+    the script has run and written its simulationParameters.json.
+
+    :param str filename: simulation.py
+    :rtype: casingSimulations.run.BaseSimulation
+    :return: the simulation, None if the script does not set one up from
+             json files
+    """
+    with open(filename) as infile:
+        match = SCRIPT_SIMULATION.search(infile.read())
+    if match is None:
+        return None
+
+    directory = os.path.dirname(os.path.abspath(filename))
+    files = dict(
+        (key, os.path.sep.join([directory, match.group(key)]))
+        for key in ['modelParameters', 'meshGenerator', 'src']
+    )
+    if not all(os.path.isfile(f) for f in files.values()):
+        return None
+
+    return getattr(run, 'Simulation{}'.format(match.group('physics')))(
+        directory=directory, **files
+    )
+
+
+def physical_memory():
+    """
+    physical memory of the machine (bytes). None if it is not available on
+    this platform.
+
+    :rtype: float
+    """
+    try:
+        return float(
+            os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
+        )
+    except (AttributeError, ValueError, OSError):
+        return None
+
+
+class Scheduler(JobQueue):
+    """
+    Job queue that packs simulations onto the available cores and memory.
+
+    The memory and runtime of each job are predicted from the mesh,
+    frequencies, time steps and sources with :code:`sim.estimate()`. Jobs
+    are started largest predicted memory first (longest runtime first for
+    ties), and smaller jobs fill in around them, as long as the predicted
+    memory of the running jobs stays under :code:`total_memory` and their
+    threads stay under :code:`cores`. A job that is predicted to need more
+    than :code:`total_memory` is run on its own.
+
+    Predictions improve as the queue runs: the cost model of each type of
+    simulation is calibrated with the :code:`profile.json` of the completed
+    runs, and a job that has been run before uses its own measured peak
+    memory and runtime.
+    """
+
+    total_memory = properties.Float(
+        "memory available to all of the running jobs (GB), defaults to 90% "
+        "of the physical memory",
+        required=False,
+        min=0.
+    )
+
+    cores = properties.Integer(
+        "number of cores available to all of the running jobs, defaults to "
+        "the number of cores on the machine",
+        required=False,
+        min=1
+    )
+
+    def __init__(self, **kwargs):
+        super(Scheduler, self).__init__(**kwargs)
+        self._cost_models = None
+        self._stale = True
+
+    @property
+    def _memory_limit(self):
+        if self.total_memory is not None:
+            return self.total_memory * 1024.**3
+        memory = physical_memory()
+        if memory is None:
+            return float('inf')
+        return 0.9 * memory
+
+    @property
+    def _cores(self):
+        if self.cores is not None:
+            return self.cores
+        return multiprocessing.cpu_count()
+
+    @property
+    def _n_workers(self):
+        if self.workers is not None:
+            return self.workers
+        return max(self._cores // self.threads, 1)
+
+    # ----------------- Learning ----------------- #
+
+    @staticmethod
+    def _profiles(directory):
+        """
+        profiles of the runs in a directory
+        """
+        profiles = []
+        files = glob.glob(os.path.sep.join([directory, 'profile*.json']))
+        for f in sorted(files):
+            try:
+                profiles.append(load_profile(f))
+            except ValueError:
+                continue
+        return profiles
+
+    @property
+    def cost_models(self):
+        """
+        cost model for each type of simulation, calibrated with the
+        profiles of the completed jobs
+
+        :rtype: dict
+        """
+        if self._cost_models is None:
+            profiles = {}
+            for job in self.jobs:
+                if job['status'] != 'done':
+                    continue
+                for profile in self._profiles(job['directory']):
+                    profiles.setdefault(
+                        profile.get('simulation'), []
+                    ).append(profile)
+            self._cost_models = dict(
+                (simulation, CostModel().calibrate(simulation_profiles))
+                for simulation, simulation_profiles in profiles.items()
+            )
+        return self._cost_models
+
+    # ----------------- Prediction ----------------- #
+
+    @staticmethod
+    def _estimate(job):
+        """
+        cost estimate of the simulation of a job, None if it can not be
+        loaded. For scripts, the simulationParameters.json written by the
+        3D simulation is used once the script has run, and before that, the
+        simulation is built from the model, mesh and source json files that
+        the script loads (see :code:`script_simulation`).
+        """
+        if job['kind'] == 'parameters':
+            filename = job['target']
+        else:
+            filename = os.path.sep.join([
+                job['directory'], SIMULATION_PARAMETERS
+            ])
+            if not os.path.isfile(filename):
+                filename = job['target']
+        if not os.path.isfile(filename):
+            return None
+
+        try:
+            if filename.endswith('.py'):
+                simulation = script_simulation(filename)
+                if simulation is None:
+                    return None
+            else:
+                simulation = load_parameters(filename)
+            return dict(simulation.estimate())
+        except Exception as error:
+            warnings.warn(
+                "Could not estimate the cost of {}: {}".format(
+                    filename, error
+                )
+            )
+            return None
+
+    def predict(self, job):
+        """
+        Predict the peak memory (bytes) and runtime (s) of a job and store
+        them on the job as predicted_memory and predicted_time
+
+        :param dict job: job
+        :rtype: dict
+        """
+        # a job that has been run before is its own best predictor
+        profiles = self._profiles(job['directory'])
+        if len(profiles) > 0 and all(
+            profile['total'].get('peak_rss') is not None
+            for profile in profiles
+        ):
+            return self.update(
+                job,
+                predicted_memory=max(
+                    profile['total']['peak_rss'] for profile in profiles
+                ),
+                predicted_time=sum(
+                    profile['total']['wall'] for profile in profiles
+                ),
+                prediction='profile'
+            )
+
+        if 'estimate' not in job:
+            job['estimate'] = self._estimate(job)
+        estimate = job['estimate']
+
+        if estimate is None:
+            # nothing is known about the job, it is limited by the memory cap
+            return self.update(
+                job,
+                predicted_memory=(
+                    self.memory * 1024.**3 if self.memory is not None else
+                    BASELINE_MEMORY
+                ),
+                predicted_time=0.,
+                prediction='unknown'
+            )
+
+        cost_model = self.cost_models.get(estimate['simulation'], CostModel())
+        n = estimate['system_size']
+        factorization_memory = cost_model('factorization_memory', n)
+
+        # the part of the estimate that does not depend on the cost model
+        # (e.g. the fields)
+        other_memory = (
+            estimate['peak_memory'] -
+            estimate['concurrent_factorizations'] *
+            estimate['factorization_memory']
+        )
+        return self.update(
+            job,
+            predicted_memory=(
+                BASELINE_MEMORY + other_memory +
+                estimate['concurrent_factorizations'] * factorization_memory
+            ),
+            predicted_time=(
+                estimate['n_factorizations'] *
+                cost_model('factorization_time', n) +
+                estimate['n_solves'] * cost_model('solve_time', n)
+            ),
+            prediction='estimate'
+        )
+
+    # ----------------- Scheduling ----------------- #
+
+    def _select(self, pending, running):
+        """
+        first-fit decreasing packing of the pending jobs into the memory
+        and cores that the running jobs leave free
+        """
+        if self._stale:
+            self._cost_models = None
+            for job in pending:
+                self.predict(job)
+            self._stale = False
+
+        memory = sum(job['predicted_memory'] for job, _, _ in running.values())
+        threads = len(running) * self.threads
+        n = len(running)
+
+        selected = []
+        for job in sorted(
+            pending,
+            key=lambda job: (-job['predicted_memory'], -job['predicted_time'])
+        ):
+            if n >= self._n_workers or threads + self.threads > self._cores:
+                break
+
+            fits = memory + job['predicted_memory'] <= self._memory_limit
+            if not fits and n > 0:
+                continue
+            if not fits:
+                warnings.warn(
+                    "{} is predicted to need {:.1f} GB, more than the "
+                    "{:.1f} GB available, running it on its own".format(
+                        job['id'], job['predicted_memory'] / 1024.**3,
+                        self._memory_limit / 1024.**3
+                    )
+                )
+
+            selected.append(job)
+            memory += job['predicted_memory']
+            threads += self.threads
+            n += 1
+            print('   predicted {:.2f} GB, {:.1f} s for {}'.format(
+                job['predicted_memory'] / 1024.**3, job['predicted_time'],
+                job['id']
+            ))
+        return selected
+
+    def _finish(self, job, returncode):
+        status = super(Scheduler, self)._finish(job, returncode)
+        if status == 'done':
+            # recalibrate with the profile of the completed run
+            self._stale = True
+        return status
@@ -0,0 +1,243 @@
+import time
+from collections import OrderedDict
+
+import numpy as np
+import scipy.sparse as sp
+
+from .cache import factorization_cache
+from .model import PhysicalProperties
+from .physics import casing_current_operator
+from .utils import content_hash
+
+
+def _is_symmetric(A):
+    """
+    True if a sparse matrix equals its (non-conjugate) transpose
+    """
+    dA = abs(A - A.T)
+    return dA.nnz == 0 or dA.max() <= 1e-12 * abs(A).max()
+
+
+def _row(P, k):
+    """
+    row k of a sparse matrix as a dense vector
+    """
+    return np.asarray(P[k, :].todense()).ravel()
+
+
+def _sensitivity_blocks(simulation, component, fields, projection):
+    """
+    Generator of the adjoint sensitivities of the casing current profile,
+    one frequency at a time. Each row of the sensitivity (one source, one
+    depth) is multiplied by the projection as soon as it is computed, so
+    only the projected rows are kept in memory.
+
+    :rtype: generator
+    :return: (freq, source indices, depths, currents (nSrc_f, nz),
+             projected sensitivities (nSrc_f, nz, n)) for each frequency
+    """
+    if simulation.physics != 'FDEM':
+        raise NotImplementedError(
+            "Sensitivities are implemented for FDEM simulations, not "
+            "{}".format(simulation.physics)
+        )
+
+    t = time.time()
+    if fields is None:
+        fields = simulation.fields()
+
+    prb = simulation.prob
+    model = simulation.physprops.model
+    prb.model = model
+    mesh = prb.mesh
+
+    if fields.aliasFields['j'][1] != 'F':
+        raise NotImplementedError(
+            "The current density of the {} formulation is not on the faces, "
+            "use the h or j formulation".format(simulation.formulation)
+        )
+
+    z, P = casing_current_operator(
+        mesh, simulation.modelParameters
+    )[component]
+
+    srcList = prb.survey.srcList
+    nz = P.shape[0]
+    if projection is None:
+        project = lambda row: row
+        n = model.size
+    else:
+        project = lambda row: projection.T.dot(row)
+        n = projection.shape[1]
+
+    print('Computing casing current sensitivities')
+    model_hash = content_hash(model)
+    for freq in prb.survey.freqs:
+        A = prb.getA(freq)
+        symmetric = _is_symmetric(A)
+
+        ATinv = None
+        if symmetric and simulation.cache_factorizations:
+            ATinv = factorization_cache.get(
+                simulation._factorization_key(prb, model_hash, freq)
+            )
+        cached = ATinv is not None
+        if not cached:
+            ATinv = prb.Solver(
+                A if symmetric else sp.csr_matrix(A.T), **prb.solverOpts
+            )
+
+        # derivative of the profile with respect to the solution, for each
+        # depth, followed by one adjoint solve for all of the depths
+        srcs = prb.survey.getSrcByFreq(freq)
+        df_duT = np.column_stack([
+            np.asarray(
+                fields._jDeriv(srcs[0], None, _row(P, k), adjoint=True)[0],
+                dtype=complex
+            ).ravel() for k in range(nz)
+        ])
+        ATinvdf_duT = np.asarray(ATinv * df_duT).reshape(df_duT.shape)
+        if not cached:
+            ATinv.clean()
+
+        indices = [srcList.index(src) for src in srcs]
+        currents = np.zeros((len(srcs), nz), dtype=complex)
+        J = np.zeros((len(srcs), nz, n), dtype=complex)
+        for i, src in enumerate(srcs):
+            u_src = fields[src, prb._solutionType]
+            currents[i, :] = P * np.asarray(fields[src, 'j']).ravel()
+
+            for k in range(nz):
+                v = ATinvdf_duT[:, k]
+                df_dmT = fields._jDeriv(
+                    src, None, _row(P, k), adjoint=True
+                )[1]
+                dA_dmT = prb.getADeriv(freq, u_src, v, adjoint=True)
+                dRHS_dmT = prb.getRHSDeriv(freq, src, v, adjoint=True)
+                J[i, k, :] = project(np.asarray(
+                    df_dmT + (-dA_dmT + dRHS_dmT), dtype=complex
+                ).ravel())
+
+        yield freq, indices, z, currents, J
+
+    print('   ... Done. Elapsed time : {}'.format(time.time() - t))
+
+
+def casing_current_sensitivity(simulation, component='z', fields=None):
+    """
+    Adjoint sensitivity of the casing current profile (see
+    :code:`casingSimulations.physics.casing_currents`) to the conductivity
+    and permeability of every cell, for each source of an FDEM simulation.
+
+    For each frequency, one solve with the transpose of the system matrix
+    (with all of the depths of the profile as right hand sides) gives the
+    sensitivity of the whole profile for all sources at that frequency. The
+    h and j formulations have symmetric system matrices, so the
+    factorization of the forward run is reused if it is in the
+    factorization cache.
+
+    The full sensitivity has nSrc x nz x 2nC complex entries, which does not
+    fit in memory for large meshes, so it is returned one frequency at a
+    time. To aggregate it to a few model parameters without keeping the cell
+    sensitivities, use :code:`parameter_sensitivity`.
+
+    .. code:: python
+
+        for block in casing_current_sensitivity(sim):
+            dI_dsigma = block['sigma']  # (nSrc at this frequency, nz, nC)
+
+    :param casingSimulations.run.SimulationFDEM simulation: simulation
+    :param str component: 'z' (vertical current, default) or 'x' (radial
+                          current)
+    :param SimPEG.Fields fields: fields of the simulation, computed with
+                                 :code:`simulation.fields()` if not provided
+    :rtype: generator
+    :return: for each frequency, a dict with the frequency 'freq', the
+             indices of its sources in the source list 'sources', the depths
+             of the profile 'z', the casing currents 'currents' (nSrc_f, nz)
+             and the complex sensitivities 'sigma' and 'mu' (nSrc_f, nz, nC)
+             with respect to the conductivity and permeability of each cell.
+             'model' (nSrc_f, nz, 2*nC) is the sensitivity with respect to
+             the model vector :code:`simulation.physprops.model`.
+    """
+    nC = simulation.meshGenerator.mesh.nC
+    for freq, indices, z, currents, J in _sensitivity_blocks(
+        simulation, component, fields, None
+    ):
+        yield OrderedDict([
+            ('freq', freq),
+            ('sources', indices),
+            ('z', z),
+            ('currents', currents),
+            ('model', J),
+            ('sigma', J[:, :, :nC]),
+            ('mu', J[:, :, nC:]),
+        ])
+
+
+def parameter_sensitivity(
+    simulation, parameter, step=None, component='z', fields=None
+):
+    """
+    Sensitivity of the casing current profile to a parameter of the model
+    parameters of the simulation (e.g. :code:`sigma_casing`,
+    :code:`mur_casing` or :code:`flaw_z`). The change of the model vector
+    with the parameter is found with a finite difference of the physical
+    properties, which does not need a solve, and the adjoint sensitivities
+    are contracted with it row by row, so the cell sensitivities are never
+    stored.
+
+    Parameters that change the geometry (e.g. :code:`flaw_z`,
+    :code:`casing_t`) only change the model when a cell boundary is crossed,
+    so their step should be about the size of the cells.
+
+    :param casingSimulations.run.SimulationFDEM simulation: simulation
+    :param str parameter: name of a (float or array) property of the model
+                          parameters
+    :param float step: finite difference step, defaults to 1e-3 times the
+                       magnitude of the parameter
+    :param str component: 'z' (vertical current, default) or 'x' (radial
+                          current)
+    :param SimPEG.Fields fields: fields of the simulation, computed with
+                                 :code:`simulation.fields()` if not provided
+    :rtype: numpy.ndarray
+    :return: complex sensitivity of the casing current profile (nSrc, nz)
+             for a float parameter, (nSrc, nz, n) for an array parameter
+             with n entries
+    """
+    modelParameters = simulation.modelParameters
+    value = getattr(modelParameters, parameter)
+    values = np.atleast_1d(np.array(value, dtype=float))
+
+    if step is None:
+        step = 1e-3 * np.abs(values).max()
+        if step == 0.:
+            step = 1e-3
+
+    m0 = simulation.physprops.model
+    dm_dp = np.zeros((m0.size, values.size))
+    for i in range(values.size):
+        perturbed = modelParameters.copy()
+        perturbed_values = values.copy()
+        perturbed_values[i] += step
+        setattr(
+            perturbed, parameter,
+            perturbed_values if np.ndim(value) > 0 else perturbed_values[0]
+        )
+        m = PhysicalProperties(simulation.meshGenerator, perturbed).model
+        dm_dp[:, i] = (m - m0) / step
+
+    dI_dp = None
+    for freq, indices, z, currents, J in _sensitivity_blocks(
+        simulation, component, fields, dm_dp
+    ):
+        if dI_dp is None:
+            dI_dp = np.zeros(
+                (simulation.prob.survey.nSrc, len(z), values.size),
+                dtype=complex
+            )
+        dI_dp[indices, :, :] = J
+
+    if np.ndim(value) == 0:
+        return dI_dp[:, :, 0]
+    return dI_dp
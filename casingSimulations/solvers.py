@@ -0,0 +1,507 @@
+import inspect
+import warnings
+
+import numpy as np
+import scipy.linalg
+import scipy.sparse as sp
+from scipy.sparse import linalg as spla
+
+try:
+    from pymatsolver import Pardiso
+except ImportError:
+    Pardiso = None
+
+
+##############################################################################
+#                                                                            #
+#                                 Registry                                   #
+#                                                                            #
+##############################################################################
+
+# solver used when a simulation does not specify one
+DEFAULT_SOLVER = 'pardiso'
+
+# registered solvers {name: Solver}. Each Solver is constructed as
+# Solver(A, **solver_opts), solves with Ainv * rhs and is released with
+# Ainv.clean(), which is the interface SimPEG problems expect.
+SOLVERS = {}
+
+
+def register_solver(name):
+    """
+    Class decorator that adds a solver to the registry so it can be
+    selected by name on a simulation
+
+    :param str name: name of the solver
+    """
+    def decorator(Solver):
+        SOLVERS[name] = Solver
+        return Solver
+    return decorator
+
+
+def get_solver(name=None):
+    """
+    Look up a solver in the registry. If Pardiso is requested but
+    pymatsolver is not installed, SuperLU is used instead.
+
+    :param str name: name of the solver, defaults to :code:`DEFAULT_SOLVER`
+    :rtype: class
+    """
+    if name is None:
+        name = DEFAULT_SOLVER
+
+    if name == 'pardiso' and name not in SOLVERS:
+        warnings.warn(
+            "Could not import Pardiso, falling back to SuperLU. Will be slow."
+        )
+        name = 'superlu'
+
+    if name not in SOLVERS:
+        raise KeyError(
+            "{} is not a registered solver. The available solvers are "
+            "{}".format(name, sorted(available_solvers()))
+        )
+    return SOLVERS[name]
+
+
+def available_solvers():
+    """
+    names of the solvers that can be selected on a simulation
+
+    :rtype: list
+    """
+    return sorted(set(list(SOLVERS.keys()) + ['pardiso']))
+
+
+if Pardiso is not None:
+    register_solver('pardiso')(Pardiso)
+
+
+##############################################################################
+#                                                                            #
+#                              Direct Solvers                                #
+#                                                                            #
+##############################################################################
+
+def _solve_columns(solve, b, dtype):
+    """
+    apply a solve to a vector or to each column of a matrix
+    """
+    b = np.asarray(b)
+    if b.ndim == 1:
+        return solve(b.astype(dtype, copy=False))
+
+    x = np.empty(b.shape, dtype=dtype, order='F')
+    for i in range(b.shape[1]):
+        x[:, i] = solve(np.ascontiguousarray(b[:, i], dtype=dtype))
+    return x
+
+
+def _lu_nbytes(lu):
+    """
+    memory used by the L and U factors of a SuperLU object (bytes)
+    """
+    return float(sum(
+        M.data.nbytes + M.indices.nbytes + M.indptr.nbytes
+        for M in [lu.L, lu.U]
+    ))
+
+
+@register_solver('superlu')
+class SuperLU(object):
+    """
+    Direct solver using the SuperLU factorization in scipy. Lower peak
+    memory than Pardiso with a fill-reducing column ordering, but single
+    threaded.
+
+    :param scipy.sparse.spmatrix A: system matrix
+    :param str ordering: column ordering, one of 'COLAMD' (default),
+                         'MMD_AT_PLUS_A', 'MMD_ATA' or 'NATURAL'
+    """
+
+    orderings = ['COLAMD', 'MMD_AT_PLUS_A', 'MMD_ATA', 'NATURAL']
+
+    def __init__(self, A, ordering='COLAMD', **kwargs):
+        if ordering not in self.orderings:
+            raise ValueError(
+                "ordering must be one of {}, not {}".format(
+                    self.orderings, ordering
+                )
+            )
+        self.ordering = ordering
+        self.dtype = A.dtype
+        self.solver = spla.splu(sp.csc_matrix(A), permc_spec=ordering)
+
+    @property
+    def nbytes(self):
+        """
+        memory used by the factors (bytes)
+
+        :rtype: float
+        """
+        if self.solver is None:
+            return 0.
+        return _lu_nbytes(self.solver)
+
+    def __mul__(self, b):
+        dtype = np.result_type(self.dtype, np.asarray(b).dtype)
+        return _solve_columns(self.solver.solve, b, dtype)
+
+    def clean(self):
+        self.solver = None
+
+
+##############################################################################
+#                                                                            #
+#                             Iterative Solvers                              #
+#                                                                            #
+##############################################################################
+
+def _ilu(A, drop_tol=1e-4, fill_factor=10., **kwargs):
+    """
+    incomplete LU preconditioner
+    """
+    ilu = spla.spilu(
+        sp.csc_matrix(A), drop_tol=drop_tol, fill_factor=fill_factor
+    )
+    M = spla.LinearOperator(
+        A.shape, matvec=lambda x: ilu.solve(np.ravel(x)), dtype=A.dtype
+    )
+    return M, _lu_nbytes(ilu)
+
+
+def _jacobi(A, **kwargs):
+    """
+    diagonal (Jacobi) preconditioner
+    """
+    d = A.diagonal()
+    d[d == 0] = 1.
+    dinv = 1. / d
+    M = spla.LinearOperator(
+        A.shape, matvec=lambda x: dinv * np.ravel(x), dtype=A.dtype
+    )
+    return M, float(dinv.nbytes)
+
+
+def _block_jacobi(A, block_size=1000, **kwargs):
+    """
+    block Jacobi preconditioner: each diagonal block of size
+    :code:`block_size` is factored with SuperLU
+    """
+    A = sp.csc_matrix(A)
+    blocks = []
+    for i0 in range(0, A.shape[0], block_size):
+        i1 = min(i0 + block_size, A.shape[0])
+        blocks.append((i0, i1, spla.splu(A[i0:i1, i0:i1].tocsc())))
+
+    def matvec(x):
+        x = np.asarray(x).ravel()
+        y = np.empty(x.shape, dtype=np.result_type(A.dtype, x.dtype))
+        for i0, i1, lu in blocks:
+            y[i0:i1] = lu.solve(x[i0:i1].astype(y.dtype, copy=False))
+        return y
+
+    M = spla.LinearOperator(A.shape, matvec=matvec, dtype=A.dtype)
+    return M, sum(_lu_nbytes(lu) for _, _, lu in blocks)
+
+
+PRECONDITIONERS = {
+    'ilu': _ilu,
+    'jacobi': _jacobi,
+    'block_jacobi': _block_jacobi,
+}
+
+
+def _keywords(function):
+    """
+    names of the arguments of a function
+    """
+    try:
+        return set(inspect.signature(function).parameters)
+    except AttributeError:  # python 2
+        return set(inspect.getargspec(function).args)
+
+
+# newer versions of scipy call the relative tolerance of the Krylov methods
+# rtol rather than tol, older versions of gmres do not have callback_type
+_TOL_KEYWORD = 'rtol' if 'rtol' in _keywords(spla.bicgstab) else 'tol'
+_GMRES_CALLBACK_TYPE = 'callback_type' in _keywords(spla.gmres)
+
+
+class ConvergenceError(Exception):
+    """
+    An iterative solver did not converge to the requested tolerance
+    """
+
+
+class BaseIterativeSolver(object):
+    """
+    Preconditioned Krylov solver with the same interface as the direct
+    solvers. Only the preconditioner is stored, so the memory is much lower
+    than for a direct factorization on large 3D meshes.
+
+    :param scipy.sparse.spmatrix A: system matrix
+    :param float tol: relative tolerance on the residual
+    :param float atol: absolute tolerance on the residual
+    :param int maxiter: maximum number of iterations
+    :param str preconditioner: 'ilu' (default), 'block_jacobi', 'jacobi' or
+                               None
+    :param float drop_tol: drop tolerance of the ILU preconditioner
+    :param float fill_factor: fill factor of the ILU preconditioner
+    :param int block_size: size of the blocks of the block Jacobi
+                           preconditioner
+    :param bool raise_on_failure: raise a :code:`ConvergenceError` if the
+                                  solver does not converge (default),
+                                  otherwise warn and return the last
+                                  iterate
+    """
+
+    def __init__(
+        self, A, tol=1e-8, atol=0., maxiter=1000, preconditioner='ilu',
+        raise_on_failure=True, **kwargs
+    ):
+        if preconditioner is not None and preconditioner not in PRECONDITIONERS:
+            raise ValueError(
+                "preconditioner must be one of {} or None, not {}".format(
+                    sorted(PRECONDITIONERS.keys()), preconditioner
+                )
+            )
+        self.A = sp.csr_matrix(A)
+        self.dtype = A.dtype
+        self.tol = tol
+        self.atol = atol
+        self.maxiter = maxiter
+        self.preconditioner = preconditioner
+        self.raise_on_failure = raise_on_failure
+        self.iterations = []
+
+        self.M = None
+        self._preconditioner_nbytes = 0.
+        if preconditioner is not None:
+            self.M, self._preconditioner_nbytes = PRECONDITIONERS[
+                preconditioner
+            ](self.A, **kwargs)
+
+    @property
+    def nbytes(self):
+        """
+        memory used by the preconditioner (bytes)
+
+        :rtype: float
+        """
+        return float(self._preconditioner_nbytes)
+
+    def _krylov(self, b, **kwargs):
+        """
+        call the Krylov method
+        """
+        raise NotImplementedError
+
+    def _solve(self, b):
+        count = [0]
+
+        def callback(*args):
+            count[0] += 1
+
+        kwargs = {_TOL_KEYWORD: self.tol}
+        x, info = self._krylov(
+            b, M=self.M, atol=self.atol, maxiter=self.maxiter,
+            callback=callback, **kwargs
+        )
+        self.iterations.append(count[0])
+
+        if info < 0:
+            raise ValueError(
+                "{} failed with illegal input or breakdown (info={})".format(
+                    type(self).__name__, info
+                )
+            )
+        elif info > 0:
+            residual = (
+                np.linalg.norm(self.A * x - b) / max(np.linalg.norm(b), 1e-300)
+            )
+            message = (
+                "{} did not converge in {} iterations, the relative "
+                "residual is {:1.2e}".format(
+                    type(self).__name__, info, residual
+                )
+            )
+            if self.raise_on_failure:
+                raise ConvergenceError(message)
+            warnings.warn(message)
+        return x
+
+    def __mul__(self, b):
+        dtype = np.result_type(self.dtype, np.asarray(b).dtype)
+        return _solve_columns(self._solve, b, dtype)
+
+    def clean(self):
+        self.A = None
+        self.M = None
+
+
+@register_solver('bicgstab')
+class BiCGStab(BaseIterativeSolver):
+    """
+    BiCGStab with an ILU, block Jacobi or Jacobi preconditioner
+    """
+
+    def _krylov(self, b, **kwargs):
+        return spla.bicgstab(self.A, b, **kwargs)
+
+
+@register_solver('gmres')
+class GMRES(BaseIterativeSolver):
+    """
+    Restarted GMRES with an ILU, block Jacobi or Jacobi preconditioner
+
+    :param int restart: number of iterations between restarts
+    """
+
+    def __init__(self, A, restart=50, **kwargs):
+        self.restart = restart
+        super(GMRES, self).__init__(A, **kwargs)
+
+    def _krylov(self, b, **kwargs):
+        # count the inner iterations
+        if _GMRES_CALLBACK_TYPE:
+            kwargs['callback_type'] = 'pr_norm'
+        return spla.gmres(self.A, b, restart=self.restart, **kwargs)
+
+
+##############################################################################
+#                                                                            #
+#                              Perturbations                                 #
+#                                                                            #
+##############################################################################
+
+def perturbation_rows(A, A0):
+    """
+    rows in which a perturbed system matrix differs from the unperturbed
+    one. Their number is the rank of the low-rank correction.
+
+    :param scipy.sparse.spmatrix A: perturbed system matrix
+    :param scipy.sparse.spmatrix A0: unperturbed system matrix
+    :rtype: numpy.ndarray
+    """
+    dA = sp.csr_matrix(A - A0)
+    dA.eliminate_zeros()
+    return np.unique(dA.nonzero()[0])
+
+
+class Woodbury(object):
+    """
+    Solve a perturbed system :code:`A = A0 + dA` with the factorization of
+    the unperturbed system :code:`A0`, where dA is non-zero in only a few
+    rows (e.g. those of the edges or faces around a flaw in the casing).
+    With :code:`dA = U V`, U selecting the r perturbed rows, the
+    Sherman-Morrison-Woodbury identity gives
+
+    .. math::
+
+        A^{-1} b = A_0^{-1} b -
+            A_0^{-1} U (I + V A_0^{-1} U)^{-1} V A_0^{-1} b
+
+    Setting up costs r back-substitutions with A0 and the factorization of
+    a dense r x r matrix, each solve then costs one back-substitution.
+
+    :param scipy.sparse.spmatrix A: perturbed system matrix
+    :param A0inv: factorization of the unperturbed system matrix
+    :param scipy.sparse.spmatrix A0: unperturbed system matrix
+    :param numpy.ndarray rows: perturbed rows, computed with
+                               :code:`perturbation_rows` if not provided
+    """
+
+    def __init__(self, A, A0inv, A0, rows=None):
+        self.A0inv = A0inv
+        if rows is None:
+            rows = perturbation_rows(A, A0)
+        self.rows = np.asarray(rows, dtype=int)
+        r = len(self.rows)
+        self.dtype = np.result_type(A.dtype, A0.dtype)
+
+        # the flaw does not change the system, solve with A0 alone
+        if r == 0:
+            self.V = None
+            self.A0invU = None
+            self.capacitance = None
+            return
+
+        self.V = sp.csr_matrix(A - A0)[self.rows, :]
+        U = np.zeros((A.shape[0], r), dtype=self.dtype, order='F')
+        U[self.rows, np.arange(r)] = 1.
+        self.A0invU = np.asarray(A0inv * U)
+        self.capacitance = scipy.linalg.lu_factor(
+            np.eye(r, dtype=self.dtype) + self.V * self.A0invU
+        )
+
+    @property
+    def rank(self):
+        """
+        rank of the correction
+
+        :rtype: int
+        """
+        return len(self.rows)
+
+    @property
+    def nbytes(self):
+        """
+        memory used by the correction (bytes), the factorization of the
+        unperturbed system is not included
+
+        :rtype: float
+        """
+        if self.rank == 0:
+            return 0.
+        return float(
+            self.A0invU.nbytes + self.capacitance[0].nbytes +
+            self.V.data.nbytes
+        )
+
+    def __mul__(self, b):
+        x = np.asarray(self.A0inv * b)
+        if self.rank == 0:
+            return x
+        z = scipy.linalg.lu_solve(self.capacitance, self.V * x)
+        return x - self.A0invU.dot(z)
+
+    def clean(self):
+        # the factorization of the unperturbed system belongs to the caller
+        self.A0inv = None
+        self.A0invU = None
+        self.capacitance = None
+
+
+class PerturbationGMRES(GMRES):
+    """
+    GMRES on a perturbed system :code:`A = A0 + dA` preconditioned with the
+    factorization of the unperturbed system :code:`A0`. The preconditioned
+    operator differs from the identity by a matrix of the rank of dA, so
+    GMRES converges in at most rank + 1 iterations, and usually in far fewer
+    when the perturbation is small. Each iteration costs one
+    back-substitution with A0.
+
+    :param scipy.sparse.spmatrix A: perturbed system matrix
+    :param A0inv: factorization of the unperturbed system matrix
+    :param float tol: relative tolerance on the residual
+    :param int maxiter: maximum number of iterations
+    """
+
+    def __init__(self, A, A0inv, tol=1e-10, maxiter=200, **kwargs):
+        kwargs['preconditioner'] = None
+        kwargs.setdefault('restart', maxiter)
+        super(PerturbationGMRES, self).__init__(
+            A, tol=tol, maxiter=maxiter, **kwargs
+        )
+        self.A0inv = A0inv
+        self.M = spla.LinearOperator(
+            self.A.shape, dtype=self.dtype,
+            matvec=lambda x: np.asarray(A0inv * np.ravel(x))
+        )
+
+    def clean(self):
+        # the factorization of the unperturbed system belongs to the caller
+        super(PerturbationGMRES, self).clean()
+        self.A0inv = None
@@ -0,0 +1,294 @@
+import itertools
+import json
+import multiprocessing
+import os
+import time
+import traceback
+
+import numpy as np
+import properties
+
+from .cache import mesh_cache
+from .run import BaseSimulation
+from .sources import SourceList
+
+
+def _jsonable(value):
+    """
+    convert numpy types so that the value can be written to json
+    """
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+def _run_case(case):
+    """
+    Run a single case of a parameter sweep. This is called on the worker
+    processes.
+
+    :param dict case: serialized simulation, mesh hash and bookkeeping for
+                      the case
+    :rtype: dict
+    :return: summary of the run
+    """
+    summary = dict(
+        (key, case[key]) for key in ['case', 'directory', 'overrides', 'mesh']
+    )
+
+    t = time.time()
+    try:
+        simulation = properties.HasProperties.deserialize(
+            case['simulation'], trusted=True
+        )
+
+        # the mesh comes from the registry of this process, which forked
+        # workers inherit from the parent
+        mesh = simulation.meshGenerator.mesh
+        simulation.share_mesh(mesh)
+
+        simulation.run(save=True)
+
+        summary['nC'] = mesh.nC
+        summary['fields'] = os.path.sep.join([
+            simulation.directory, simulation.fields_filename
+        ])
+        summary['status'] = 'done'
+    except Exception:
+        summary['status'] = 'failed'
+        summary['error'] = traceback.format_exc()
+
+    summary['elapsed'] = time.time() - t
+    return summary
+
+
+class ParameterSweep(properties.HasProperties):
+    """
+    Run a base simulation over a grid of parameter overrides on a local
+    process pool.
+
+    Each key of :code:`parameters` is the name of a property on the
+    modelParameters, the meshGenerator or the simulation (checked in that
+    order) and each value is a list of values to take. The simulation is run
+    for every combination. Each distinct mesh is built once and shared
+    between the runs that use it and the output of each run is written to
+    its own directory.
+    """
+
+    simulation = properties.Instance(
+        "simulation whose parameters are swept",
+        BaseSimulation,
+        required=True
+    )
+
+    parameters = properties.Dictionary(
+        "parameters to sweep over {name: [values]}",
+        required=True
+    )
+
+    directory = properties.String(
+        "Working directory. Each case is run in a sub-directory of it",
+        default="."
+    )
+
+    case_directory = properties.String(
+        "format of the directory name for each case",
+        default="case{:04d}"
+    )
+
+    summary_filename = properties.String(
+        "filename for the summary of the sweep",
+        default="sweepSummary.json"
+    )
+
+    n_procs = properties.Integer(
+        "number of worker processes, if not set, all available cores are used",
+        required=False,
+        min=1
+    )
+
+    def __init__(self, **kwargs):
+        super(ParameterSweep, self).__init__(**kwargs)
+
+    @property
+    def cases(self):
+        """
+        list of the parameter overrides for each case
+
+        :rtype: list
+        """
+        keys = sorted(self.parameters.keys())
+        return [
+            dict(zip(keys, values)) for values in
+            itertools.product(*[self.parameters[key] for key in keys])
+        ]
+
+    @property
+    def summary(self):
+        """
+        summary of each of the runs in the sweep
+
+        :rtype: list
+        """
+        return getattr(self, '_summary', None)
+
+    def _create_simulation(self, overrides, directory):
+        """
+        create a copy of the base simulation with the overrides applied
+        """
+        sim = self.simulation
+
+        modelParameters = sim.modelParameters.copy()
+        meshGenerator = sim.meshGenerator.copy()
+        meshGenerator.modelParameters = modelParameters
+
+        sim_kwargs = {}
+        for key, value in overrides.items():
+            if key in modelParameters._props:
+                setattr(modelParameters, key, value)
+            elif key in meshGenerator._props:
+                setattr(meshGenerator, key, value)
+            elif key in sim._props:
+                sim_kwargs[key] = value
+            else:
+                raise KeyError(
+                    "{} is not a property of the modelParameters, "
+                    "meshGenerator or simulation".format(key)
+                )
+
+        # sources are rebuilt on the new model and mesh
+        if getattr(sim, 'src', None) is not None:
+            sources = [sim.src]
+        elif getattr(sim, 'srcList', None) is not None:
+            sources = sim.srcList.sources
+        else:
+            sources = []
+
+        new_sources = []
+        for src in sources:
+            new_src = src.copy()
+            new_src.modelParameters = modelParameters
+            new_src.meshGenerator = meshGenerator
+            for key in ['src_a', 'src_b']:
+                if key in overrides:
+                    setattr(new_src, key, overrides[key])
+            new_sources.append(new_src)
+
+        skip = [
+            'modelParameters', 'meshGenerator', 'src', 'srcList', 'directory'
+        ]
+        kwargs = dict(
+            (key, getattr(sim, key)) for key in sim._props
+            if key not in skip and getattr(sim, key) is not None
+        )
+        kwargs.update(sim_kwargs)
+
+        if getattr(sim, 'src', None) is not None:
+            kwargs['src'] = new_sources[0]
+        elif len(new_sources) > 0:
+            kwargs['srcList'] = SourceList(sources=new_sources)
+
+        return type(sim)(
+            modelParameters=modelParameters,
+            meshGenerator=meshGenerator,
+            directory=directory,
+            **kwargs
+        )
+
+    def run(self):
+        """
+        Run all of the cases in the sweep
+
+        :rtype: list
+        :return: summary of each of the runs
+        """
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+
+        # set up each of the cases
+        cases = []
+        meshGenerators = {}
+        for i, overrides in enumerate(self.cases):
+            directory = os.path.sep.join([
+                self.directory, self.case_directory.format(i)
+            ])
+            simulation = self._create_simulation(overrides, directory)
+            mesh_hash = simulation.meshGenerator.mesh_hash
+            meshGenerators.setdefault(mesh_hash, simulation.meshGenerator)
+
+            cases.append({
+                'case': i,
+                'directory': directory,
+                'overrides': dict(
+                    (key, _jsonable(value)) for key, value in overrides.items()
+                ),
+                'mesh': mesh_hash,
+                'simulation': simulation.serialize(),
+            })
+
+        # build each distinct mesh once, pinned in the mesh registry of this
+        # process for the duration of the sweep so that forked workers
+        # inherit them
+        print(
+            'Sweep: {} cases, {} distinct meshes'.format(
+                len(cases), len(meshGenerators)
+            )
+        )
+        pinned = mesh_cache.pin(meshGenerators.values())
+
+        n_procs = self.n_procs
+        if n_procs is None:
+            n_procs = multiprocessing.cpu_count()
+        n_procs = min(n_procs, len(cases))
+
+        t = time.time()
+        pool = None
+        try:
+            if n_procs <= 1:
+                results = (_run_case(case) for case in cases)
+            else:
+                pool = multiprocessing.Pool(processes=n_procs)
+                results = pool.imap_unordered(_run_case, cases)
+
+            summary = []
+            for result in results:
+                print(
+                    '   case {case} {status}. Elapsed time : '
+                    '{elapsed}'.format(**result)
+                )
+                summary.append(result)
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+            mesh_cache.unpin(pinned)
+
+        print(
+            'Sweep done. Elapsed time : {}'.format(time.time()-t)
+        )
+
+        summary = sorted(summary, key=lambda result: result['case'])
+        self._summary = summary
+        self.save_summary()
+        return summary
+
+    def save_summary(self, filename=None, directory=None):
+        """
+        Save the summary of the sweep to json
+
+        :param str filename: filename for the summary
+        :param str directory: working directory for saving the file
+        """
+        if filename is None:
+            filename = self.summary_filename
+
+        if directory is None:
+            directory = self.directory
+
+        f = os.path.sep.join([directory, filename])
+        with open(f, 'w') as outfile:
+            json.dump(self.summary, outfile, indent=2)
+
+        print('Saved {}'.format(f))
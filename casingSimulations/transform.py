@@ -0,0 +1,126 @@
+import numpy as np
+from scipy.interpolate import interp1d
+
+
+##############################################################################
+#                                                                            #
+#                                 Defaults                                   #
+#                                                                            #
+##############################################################################
+
+# number of points per decade on which the spectrum is interpolated for the
+# quadrature of the cosine transform
+INTERPOLATION_PER_DECADE = 40
+
+
+##############################################################################
+#                                                                            #
+#                                Transforms                                  #
+#                                                                            #
+##############################################################################
+
+def transform_frequencies(times, n_per_decade=10, extend=2.):
+    """
+    Logarithmically spaced frequencies for transforming frequency domain
+    responses to the times given. They extend :code:`extend` decades below
+    1/(2 pi max(times)) and above 1/(2 pi min(times)).
+
+    :param numpy.ndarray times: times (s), larger than zero
+    :param int n_per_decade: number of frequencies per decade
+    :param float extend: number of decades beyond the range of the times
+    :rtype: numpy.ndarray
+    """
+    times = np.asarray(times, dtype=float)
+    if np.any(times <= 0):
+        raise ValueError("The times must be larger than zero")
+    fmin = np.log10(1. / (2 * np.pi * times.max())) - extend
+    fmax = np.log10(1. / (2 * np.pi * times.min())) + extend
+    n = int(np.ceil((fmax - fmin) * n_per_decade)) + 1
+    return np.logspace(fmin, fmax, n)
+
+
+def _segment_weights(w, t):
+    """
+    weights of the values at w of the integral of a piecewise linear
+    function times cos(wt) from w[0] to w[-1] (Filon quadrature, exact for
+    any t), (len(t), len(w))
+    """
+    t = t[:, None]
+    a, b = w[:-1][None, :], w[1:][None, :]
+    # (cos(bt) - cos(at)) / (t**2 (b - a)), written to avoid cancellation
+    dcos = (
+        -2 * np.sin(0.5 * (a + b) * t) * np.sin(0.5 * (b - a) * t) /
+        (t**2 * (b - a))
+    )
+    weights = np.zeros((t.shape[0], len(w)))
+    weights[:, 1:] += np.sin(b * t) / t + dcos
+    weights[:, :-1] += -np.sin(a * t) / t - dcos
+    return weights
+
+
+def step_off_operator(freqs, times):
+    """
+    Linear operator that takes the imaginary part of a frequency domain
+    response at the frequencies freqs to the step-off response at the
+    times, for the :math:`e^{i\\omega t}` convention used by SimPEG:
+
+    .. math::
+
+        f(t) = -\\frac{2}{\\pi} \\int_0^\\infty
+            \\frac{\\mathrm{Im}\\, F(\\omega)}{\\omega}
+            \\cos(\\omega t) \\, d\\omega
+
+    :code:`Im F / w` is interpolated with a cubic in log frequency on a
+    dense grid and the cosine transform of the interpolant is computed
+    with a Filon quadrature, which is exact for the oscillatory part at
+    any time. Below the lowest frequency, :code:`Im F / w` is taken as
+    constant, and the spectrum is truncated above the highest frequency.
+
+    :param numpy.ndarray freqs: frequencies (Hz), at least 4, increasing
+    :param numpy.ndarray times: times (s), larger than zero
+    :rtype: numpy.ndarray
+    :return: (len(times), len(freqs)) operator applied to Im F
+    """
+    freqs = np.asarray(freqs, dtype=float)
+    times = np.asarray(times, dtype=float)
+    if len(freqs) < 4 or np.any(np.diff(freqs) <= 0):
+        raise ValueError(
+            "At least 4 increasing frequencies are needed for the transform"
+        )
+
+    w = 2 * np.pi * freqs
+    log_w = np.log(w)
+
+    # interpolation of Im F / w onto a dense grid
+    n = int(np.ceil(
+        (log_w[-1] - log_w[0]) / np.log(10) * INTERPOLATION_PER_DECADE
+    )) + 1
+    log_w_dense = np.linspace(log_w[0], log_w[-1], max(n, len(w)))
+    w_dense = np.exp(log_w_dense)
+    interpolation = interp1d(
+        log_w, np.diag(1. / w), kind='cubic', axis=0
+    )(log_w_dense)
+
+    # integral from 0 to the lowest frequency, with Im F / w constant
+    weights = _segment_weights(w_dense, times)
+    weights[:, 0] += np.sin(w_dense[0] * times) / times
+
+    return -2. / np.pi * weights.dot(interpolation)
+
+
+def step_off_response(freqs, values, times):
+    """
+    Step-off response at the times from frequency domain responses, see
+    :code:`step_off_operator`
+
+    :param numpy.ndarray freqs: frequencies (Hz)
+    :param numpy.ndarray values: complex responses with the frequency along
+                                 the first axis
+    :param numpy.ndarray times: times (s), larger than zero
+    :rtype: numpy.ndarray
+    :return: responses with the time along the first axis
+    """
+    values = np.asarray(values)
+    T = step_off_operator(freqs, times)
+    result = T.dot(values.imag.reshape(values.shape[0], -1))
+    return result.reshape((len(times),) + values.shape[1:])
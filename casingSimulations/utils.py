@@ -1,12 +1,35 @@
 import json
+import hashlib
 import numpy as np
 import time
 import os
 import datetime
+import multiprocessing
+import warnings
+from contextlib import contextmanager
 from discretize import utils
 import properties
 import casingSimulations
 
+try:
+    import threadpoolctl
+except ImportError:
+    threadpoolctl = None
+
+# the missing threadpoolctl warning is only shown once per process
+_warned_threadpoolctl = False
+
+
+# environment variables read by the threaded math libraries (OpenMP, MKL,
+# OpenBLAS, Accelerate, numexpr) when they are initialized
+THREAD_ENVIRONMENT_VARIABLES = [
+    'OMP_NUM_THREADS',
+    'MKL_NUM_THREADS',
+    'OPENBLAS_NUM_THREADS',
+    'VECLIB_MAXIMUM_THREADS',
+    'NUMEXPR_NUM_THREADS',
+]
+
 
 def load_properties(filename):
     """
@@ -24,6 +47,100 @@ def load_properties(filename):
     return data
 
 
+def content_hash(*args):
+    """
+    sha1 hash of the contents of the provided arguments. Numpy arrays are
+    hashed on their dtype, shape and data, dictionaries and lists (for
+    example serialized properties) on their json representation and
+    everything else on its repr.
+
+    :rtype: str
+    :return: hex digest of the hash
+    """
+    sha = hashlib.sha1()
+    for arg in args:
+        if isinstance(arg, np.ndarray):
+            sha.update(
+                '{}{}'.format(arg.dtype.str, arg.shape).encode('utf-8')
+            )
+            sha.update(np.ascontiguousarray(arg).tobytes())
+        elif isinstance(arg, (dict, list, tuple)):
+            sha.update(
+                json.dumps(arg, sort_keys=True, default=repr).encode('utf-8')
+            )
+        else:
+            sha.update(repr(arg).encode('utf-8'))
+    return sha.hexdigest()
+
+
+@contextmanager
+def thread_limits(num_threads=None):
+    """
+    Context manager that limits the number of threads used by the BLAS,
+    OpenMP and MKL (including Pardiso) thread pools. If threadpoolctl is
+    installed, the limits are applied to the libraries that are already
+    loaded. The thread environment variables are also set so that
+    libraries loaded later, and child processes, pick up the same limit.
+    Everything is restored on exit.
+
+    :param int num_threads: maximum number of threads, if None, the thread
+                            pools are left as they are
+    """
+    global _warned_threadpoolctl
+    if num_threads is None:
+        yield
+        return
+
+    environ = dict(
+        (key, os.environ.get(key)) for key in THREAD_ENVIRONMENT_VARIABLES
+    )
+    for key in THREAD_ENVIRONMENT_VARIABLES:
+        os.environ[key] = str(num_threads)
+
+    limiter = None
+    if threadpoolctl is not None:
+        limiter = threadpoolctl.threadpool_limits(limits=num_threads)
+    elif not _warned_threadpoolctl:
+        _warned_threadpoolctl = True
+        warnings.warn(
+            "threadpoolctl is not installed, the number of threads is only "
+            "limited through environment variables. This has no effect on "
+            "libraries that are already loaded."
+        )
+
+    try:
+        yield
+    finally:
+        if limiter is not None:
+            limiter.restore_original_limits()
+        for key, value in environ.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+
+
+def thread_info():
+    """
+    Effective number of threads of each of the loaded thread pools (e.g.
+    openblas, mkl, openmp) along with the thread environment variables that
+    are set.
+
+    :rtype: dict
+    """
+    info = {}
+    if threadpoolctl is not None:
+        for pool in threadpoolctl.threadpool_info():
+            api = pool.get('internal_api', pool.get('prefix'))
+            info[api] = max(info.get(api, 0), pool['num_threads'])
+    info['environment'] = dict(
+        (key, os.environ[key]) for key in THREAD_ENVIRONMENT_VARIABLES
+        if key in os.environ
+    )
+    info['cpu_count'] = multiprocessing.cpu_count()
+    return info
+
+
 # grab 2D slices
 def face3DthetaSlice(mesh3D, j3D, theta_ind=0):
     """
@@ -96,8 +213,27 @@ def writeSimulationPy(
     directory='.',
     simulation_filename='simulation.py',
     includeDC=True,  # cheap, why not
-    include2D=True  # cheap, why not
+    include2D=True,  # cheap, why not
+    use_pipeline=True
 ):
+    """
+    Write a python script for running a simulation
+
+    :param str modelParameters: model parameters file
+    :param str meshGenerator: mesh generator file
+    :param str src: source file
+    :param str physics: 'FDEM' or 'TDEM'
+    :param str fields_filename: filename for the fields
+    :param str directory: directory to write the script in
+    :param str simulation_filename: filename of the script
+    :param bool includeDC: include a DC simulation
+    :param bool include2D: include a 2D simulation
+    :param bool use_pipeline: run the simulation and the 2D and DC
+                              simulations in a
+                              :code:`casingSimulations.pipeline.Pipeline`,
+                              which shares the mesh and physical properties
+                              between them, rather than one after another
+    """
 
     sim_file = '/'.join([directory, simulation_filename])
     with open(sim_file, 'w') as f:
@@ -134,6 +270,18 @@ sim = casingSimulations.run.Simulation{physics}(
             )
         )
 
+        if use_pipeline:
+            f.write(
+                """# run the simulation along with the 2D and DC simulations
+pipeline = casingSimulations.pipeline.Pipeline.from_simulation(
+    sim, include2D={include2D}, includeDC={includeDC}
+)
+pipeline.run()
+""".format(include2D=include2D, includeDC=includeDC)
+            )
+            print('wrote {}'.format(sim_file))
+            return
+
         # write the run
         f.write(
             "# run the simulation \nfields = sim.run()\n"
@@ -155,7 +303,8 @@ sim2D = casingSimulations.run.Simulation{physics}(
     meshGenerator=mesh2D,
     src=src2D,
     fields_filename='fields2D.npy',
-    filename='simulation2D.json'
+    filename='simulation2D.json',
+    profile_filename='profile2D.json'
 )
 \n""".format(
                     physics=physics,
@@ -179,6 +328,7 @@ src_b = sim.src.src_b_closest - np.r_[0., 0., csz/2.]
 
 simDC = casingSimulations.run.SimulationDC(
     filename='simulationDC.json',
+    profile_filename='profileDC.json',
     modelParameters=sim.modelParameters,
     meshGenerator=sim.meshGenerator,
     src_a=src_a,
@@ -193,53 +343,194 @@ simDC = casingSimulations.run.SimulationDC(
     print('wrote {}'.format(sim_file))
 
 
+def storage_dtype(dtype, precision='double'):
+    """
+    dtype with which a solution is stored
+
+    :param numpy.dtype dtype: dtype of the solution
+    :param str precision: 'double' or 'single'
+    :rtype: numpy.dtype
+    """
+    dtype = np.dtype(dtype)
+    if precision == 'single':
+        return np.dtype(np.complex64 if dtype.kind == 'c' else np.float32)
+    elif precision == 'double':
+        return np.dtype(np.complex128 if dtype.kind == 'c' else np.float64)
+    raise ValueError(
+        "precision must be 'single' or 'double', not {}".format(precision)
+    )
+
+
+def save_fields_chunked(
+    filename, solution, chunks, compress=True, precision='double'
+):
+    """
+    Save a solution to a chunked :code:`.npz` file. Each chunk is a set of
+    indices along the last axis of the solution (e.g. the sources at one
+    frequency or a single time) and is stored as its own member of the file
+    so that it can be read on its own.
+
+    :param str filename: file to write
+    :param numpy.ndarray solution: solution to save
+    :param list chunks: list of (label, indices) tuples. The label is a
+                        number, e.g. the frequency or time of the chunk
+    :param bool compress: compress the chunks (lossless)
+    :param str precision: 'double' or 'single' precision storage
+    """
+    dtype = storage_dtype(solution.dtype, precision)
+
+    arrays = {
+        'shape': np.array(solution.shape),
+        'n_chunks': np.array(len(chunks)),
+    }
+    for i, (label, index) in enumerate(chunks):
+        arrays['chunk_{}'.format(i)] = np.asfortranarray(
+            solution[..., index], dtype=dtype
+        )
+        arrays['index_{}'.format(i)] = np.asarray(index)
+        arrays['label_{}'.format(i)] = np.array(
+            np.nan if label is None else label
+        )
+
+    with open(filename, 'wb') as f:
+        if compress:
+            np.savez_compressed(f, **arrays)
+        else:
+            np.savez(f, **arrays)
+
+
+def fields_chunk_labels(filename):
+    """
+    labels (e.g. frequencies or times) of the chunks in a chunked fields
+    file
+
+    :param str filename: chunked fields file
+    :rtype: numpy.ndarray
+    """
+    with np.load(filename) as npz:
+        return np.array([
+            npz['label_{}'.format(i)] for i in range(int(npz['n_chunks']))
+        ])
+
+
+def load_fields_chunk(filename, chunk):
+    """
+    Read a single chunk from a chunked fields file. Only that chunk is read
+    (and decompressed).
+
+    :param str filename: chunked fields file
+    :param int chunk: index of the chunk
+    :rtype: tuple
+    :return: (label, indices along the last axis of the solution, data)
+    """
+    with np.load(filename) as npz:
+        return (
+            npz['label_{}'.format(chunk)][()],
+            npz['index_{}'.format(chunk)],
+            npz['chunk_{}'.format(chunk)]
+        )
+
+
+def load_fields_chunked(filename):
+    """
+    Read the full solution from a chunked fields file
+
+    :param str filename: chunked fields file
+    :rtype: numpy.ndarray
+    """
+    solution = None
+    with np.load(filename) as npz:
+        for i in range(int(npz['n_chunks'])):
+            data = npz['chunk_{}'.format(i)]
+            if solution is None:
+                solution = np.zeros(
+                    tuple(npz['shape']), dtype=data.dtype, order='F'
+                )
+            solution[..., npz['index_{}'.format(i)]] = data
+    return solution
+
+
 def loadSimulationResults(
     directory=".",
     simulationParameters="simulationParameters.json",
     fields="fields.npy",
-    meshGenerator=None
+    meshGenerator=None,
+    mmap_mode=None,
+    lazy=False
 ):
+    """
+    Load a simulation and populate its fields from the saved solution. The
+    time taken by each step is printed and stored in a dictionary on the
+    simulation (:code:`simulation.load_timing`).
+
+    :param str directory: directory containing the simulation
+    :param str simulationParameters: filename of the simulation parameters
+    :param str fields: filename of the fields
+    :param casingSimulations.mesh.BaseMeshGenerator meshGenerator: mesh
+        generator to use instead of the one that was saved
+    :param str mmap_mode: if set (e.g. :code:`'r'`), the fields file is
+        memory-mapped and only read as the fields are accessed, see
+        :code:`numpy.load`. Streamed TDEM fields can be opened this way.
+    :param bool lazy: open the fields file read-only and memory-mapped
+        (same as :code:`mmap_mode='r'`). Indexing the fields, e.g.
+        :code:`simulation._fields[src, 'j']`, then only reads the part of
+        the file for that source.
+
+    Chunked (:code:`.npz`) fields files can not be memory-mapped and are
+    read in full, use :code:`load_fields_chunk` to read a single chunk.
+    """
     print("Loading simulation in {}".format(directory))
+    timing = {}
+    t_start = time.time()
+
+    if lazy and mmap_mode is None:
+        mmap_mode = 'r'
 
     # load and populate the simulation
+    t = time.time()
     simulation = load_properties(
-        os.path.sep.join([directory, "simulationParameters.json"]),
+        os.path.sep.join([directory, simulationParameters]),
     )
 
+    if meshGenerator is not None:
+        simulation.share_mesh(meshGenerator.mesh)
+
     simulation.prob.model = simulation.physprops.model
+    timing['simulation'] = time.time() - t
 
     # load up the numpy array of the soln
-    print("   loading fields")
-    field = np.load(os.path.sep.join([directory, fields]))
+    print("   loading fields{}".format(
+        " (memory-mapped)" if mmap_mode is not None else ""
+    ))
+    t = time.time()
+    fields_file = os.path.sep.join([directory, fields])
+    if (
+        getattr(simulation, 'fields_format', 'npy') == 'chunked' and
+        not os.path.isfile(fields_file)
+    ):
+        fields_file = os.path.sep.join([
+            directory, simulation.chunked_fields_filename
+        ])
 
-    if meshGenerator is None:
-        meshGenerator = simulation.meshGenerator
+    if fields_file.endswith('.npz'):
+        field = load_fields_chunked(fields_file)
+    else:
+        field = np.load(fields_file, mmap_mode=mmap_mode)
+    timing['fields'] = time.time() - t
 
     print("  repopulating fields")
     t = time.time()
-    # fields = simulation.prob.fieldsPair(
-    #     simulation.meshGenerator.mesh, simulation.survey
-    # )
-
-    if isinstance(
-        simulation,
-        (
-            casingSimulations.run.SimulationFDEM,
-            casingSimulations.run.SimulationDC
-        )
-    ):
-        simulation._fields = simulation.prob.fieldsPair(
-            meshGenerator.mesh, simulation.survey
-        )[
-            :, '{}Solution'.format(simulation.formulation)
-        ]
-    elif isinstance(simulation, casingSimulations.run.SimulationTDEM):
-        simulation._fields = simulation.prob.fieldsPair(
-            meshGenerator.mesh, simulation.survey
-        )[
-            :, :, '{}Solution'.format(simulation.formulation)
-        ]
-
-    print('   ... Done. Elapsed time : {}\n'.format(time.time()-t))
 
+    simulation._fields = simulation._fields_from_solution(
+        simulation.prob, field
+    )
+    timing['populate'] = time.time() - t
+    timing['total'] = time.time() - t_start
+
+    print(
+        '   ... Done. Elapsed time : {total} (simulation: {simulation}, '
+        'fields: {fields}, populate: {populate})\n'.format(**timing)
+    )
+
+    simulation._load_timing = timing
     return simulation
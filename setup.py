@@ -4,8 +4,7 @@ from __future__ import print_function
 in settings where steel cased wells are present.
 """
 
-from distutils.core import setup
-from setuptools import find_packages
+from setuptools import setup, find_packages
 
 CLASSIFIERS = [
     'Development Status :: 4 - Beta',
@@ -43,6 +42,19 @@ setup(
         'SimPEG',
     ],
 
+    extras_require={
+        # resident memory of the jobs and their child processes
+        'jobs': ['psutil'],
+        # limits on the BLAS / OpenMP / MKL thread pools that are loaded
+        'threads': ['threadpoolctl'],
+    },
+
+    entry_points={
+        'console_scripts': [
+            'casingSimulations-jobs = casingSimulations.jobs:main',
+        ],
+    },
+
     author="Lindsey Heagy",
     author_email="lindseyheagy@gmail.com",
     description="Casing Simulations: Electromagnetics + Steel Cased Wells",
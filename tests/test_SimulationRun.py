@@ -5,6 +5,10 @@ import shutil
 
 import casingSimulations
 
+from .utils import (
+    casing_in_wholespace, coarse_mesh, top_casing_src, casing_setup
+)
+
 
 plotIt = False
 TOL = 1e-4
@@ -80,11 +84,376 @@ class ForwardSimulationTestCyl2D(unittest.TestCase):
 
         self.runSimulation(src)
 
+    def test_simulation2DLazyLoad(self):
+        self.modelParameters.freqs = np.r_[0.5, 1.]
+
+        src = top_casing_src(self.modelParameters, self.meshGenerator)
+        simulation = casingSimulations.run.SimulationFDEM(
+            modelParameters=self.modelParameters,
+            meshGenerator=self.meshGenerator,
+            src=src,
+            directory=self.dir2D
+        )
+        fields = simulation.run()
+
+        # each source is stored contiguously
+        saved = np.load('/'.join([self.dir2D, 'fields.npy']), mmap_mode='r')
+        self.assertTrue(saved.flags.f_contiguous)
+
+        loaded = casingSimulations.utils.loadSimulationResults(
+            directory=self.dir2D, lazy=True
+        )
+        self.assertTrue(
+            isinstance(loaded._fields._fields['hSolution'], np.memmap)
+        )
+        self.assertTrue(set(loaded.load_timing.keys()) == set(
+            ['simulation', 'fields', 'populate', 'total']
+        ))
+
+        for src_sim, src_loaded in zip(
+            simulation.survey.srcList, loaded.survey.srcList
+        ):
+            self.assertTrue(
+                np.allclose(fields[src_sim, 'j'], loaded._fields[src_loaded, 'j'])
+            )
+
+    def test_simulation2DNumThreads(self):
+        src = top_casing_src(self.modelParameters, self.meshGenerator)
+        simulation = casingSimulations.run.SimulationFDEM(
+            modelParameters=self.modelParameters,
+            meshGenerator=self.meshGenerator,
+            src=src,
+            directory=self.dir2D,
+            num_threads=1
+        )
+        environ = os.environ.get('OMP_NUM_THREADS')
+        simulation.run()
+
+        # the limits are only in place during the run
+        self.assertTrue(os.environ.get('OMP_NUM_THREADS') == environ)
+
+        # the effective thread counts are saved with the simulation
+        loaded = casingSimulations.load_properties(
+            '/'.join([self.dir2D, simulation.filename])
+        )
+        self.assertTrue(loaded.num_threads == 1)
+        self.assertTrue(
+            loaded.threads['environment']['OMP_NUM_THREADS'] == '1'
+        )
+        for key, value in loaded.threads.items():
+            if key not in ['environment', 'cpu_count']:
+                self.assertTrue(value == 1)
+
+    def test_simulation2DChunkedFields(self):
+        self.modelParameters.freqs = np.r_[0.5, 1.]
+
+        src = top_casing_src(self.modelParameters, self.meshGenerator)
+        simulation = casingSimulations.run.SimulationFDEM(
+            modelParameters=self.modelParameters,
+            meshGenerator=self.meshGenerator,
+            src=src,
+            directory=self.dir2D,
+            fields_format='chunked',
+            fields_precision='single'
+        )
+        fields = simulation.run()
+        solution = simulation._solution(fields)
+
+        filename = '/'.join([self.dir2D, simulation.chunked_fields_filename])
+        self.assertTrue(os.path.isfile(filename))
+
+        # one chunk per frequency, each can be read on its own
+        labels = casingSimulations.utils.fields_chunk_labels(filename)
+        self.assertTrue(np.all(labels == np.r_[0.5, 1.]))
+
+        label, index, data = casingSimulations.utils.load_fields_chunk(
+            filename, 1
+        )
+        self.assertTrue(label == 1.)
+        self.assertTrue(data.dtype == np.complex64)
+        self.assertTrue(
+            np.allclose(data, solution[..., index], rtol=1e-5, atol=0.)
+        )
+
+        loaded = casingSimulations.utils.loadSimulationResults(
+            directory=self.dir2D
+        )
+        for src_sim, src_loaded in zip(
+            simulation.survey.srcList, loaded.survey.srcList
+        ):
+            j = fields[src_sim, 'j']
+            self.assertTrue(
+                np.allclose(
+                    j, loaded._fields[src_loaded, 'j'],
+                    rtol=1e-4, atol=1e-6*np.absolute(j).max()
+                )
+            )
+
+    def test_simulation2DOutputs(self):
+        self.modelParameters.freqs = np.r_[0.5, 1.]
+
+        src = top_casing_src(self.modelParameters, self.meshGenerator)
+        locations = np.array([[10., 0., 0.], [100., 0., -50.]])
+        simulation = casingSimulations.run.SimulationFDEM(
+            modelParameters=self.modelParameters,
+            meshGenerator=self.meshGenerator,
+            src=src,
+            directory=self.dir2D,
+            save_fields=False,
+            outputs=[
+                casingSimulations.outputs.CasingCurrents(),
+                casingSimulations.outputs.ThetaSlice(field='j'),
+                casingSimulations.outputs.DepthSlice(field='e', z=0.),
+                casingSimulations.outputs.Points(
+                    field='e', locations=locations
+                ),
+            ]
+        )
+        fields = simulation.run()
+
+        # the outputs are evaluated one frequency at a time and the fields
+        # are not kept
+        self.assertTrue(fields is None)
+
+        # only the outputs are saved
+        self.assertFalse(
+            os.path.isfile('/'.join([self.dir2D, simulation.fields_filename]))
+        )
+        outputs = casingSimulations.outputs.load_outputs(
+            '/'.join([self.dir2D, simulation.outputs_filename])
+        )
+        self.assertEqual(
+            sorted(outputs.keys()), sorted(simulation.output_results.keys())
+        )
+
+        # compare with the fields of a run that keeps them
+        fields = simulation.fields()
+
+        mesh = self.meshGenerator.mesh
+        for i, src_sim in enumerate(simulation.survey.srcList):
+            currents = casingSimulations.casing_currents(
+                fields[src_sim, 'j'], mesh, self.modelParameters
+            )
+            self.assertTrue(np.allclose(
+                outputs['casing_currents_z'], currents['z'][0]
+            ))
+            self.assertTrue(np.allclose(
+                outputs['casing_currents_currents'][:, i], currents['z'][1]
+            ))
+        self.assertEqual(outputs['theta_slice_values'].shape[1], 2)
+        # one value per point for each component of the field
+        self.assertEqual(outputs['points_values'].shape[1], 2)
+        self.assertEqual(outputs['points_values'].shape[0] % 2, 0)
+
+        # the outputs survive a round trip through the simulation parameters
+        loaded = casingSimulations.utils.load_properties(
+            '/'.join([self.dir2D, simulation.filename])
+        )
+        self.assertEqual(
+            [type(output) for output in loaded.outputs],
+            [type(output) for output in simulation.outputs]
+        )
+
+    def test_simulation2DFrequencyParallel(self):
+        self.modelParameters.freqs = np.r_[0.5, 1., 2.]
+
+        src = top_casing_src(self.modelParameters, self.meshGenerator)
+
+        fields = {}
+        for num_procs in [1, 2]:
+            simulation = casingSimulations.run.SimulationFDEM(
+                modelParameters=self.modelParameters,
+                meshGenerator=self.meshGenerator,
+                src=src,
+                directory=self.dir2D,
+                cache_factorizations=False,
+                num_procs=num_procs
+            )
+            fields[num_procs] = simulation.run()[:, 'h']
+
+        self.assertTrue(np.allclose(fields[1], fields[2]))
+
+        loadedFields = np.load('/'.join([self.dir2D, 'fields.npy']))
+        self.assertTrue(np.all(fields[2] == loadedFields))
+
     def tearDown(self):
         for d in [self.dir2D]:
             if os.path.isdir(d):
                 shutil.rmtree(d)
 
 
+class ForwardSimulationTestTDEM(unittest.TestCase):
+
+    directory = './simTDEM'
+
+    def setUp(self):
+        modelParameters, meshGenerator, src = casing_setup(
+            timeSteps=[(1e-4, 5), (1e-3, 5), (1e-4, 5)]
+        )
+
+        self.simulation = casingSimulations.run.SimulationTDEM(
+            modelParameters=modelParameters,
+            meshGenerator=meshGenerator,
+            src=src,
+            directory=self.directory
+        )
+
+    def test_factorization_reuse(self):
+        fields = self.simulation.run(save=False)
+
+        # one factorization per distinct time-step size
+        self.assertEqual(
+            self.simulation.factorization_stats,
+            {'factorizations': 2, 'reused': 13}
+        )
+
+        # compare with stepping through time in SimPEG
+        fields_simpeg = self.simulation.prob.fields(
+            self.simulation.physprops.model
+        )
+        self.assertTrue(
+            np.allclose(fields[:, 'jSolution'], fields_simpeg[:, 'jSolution'])
+        )
+
+    def test_stream_fields(self):
+        fields = self.simulation.run(save=False)
+        jSolution = fields[:, 'jSolution']
+
+        self.simulation.stream_fields = True
+        self.simulation.run()
+
+        fields_file = '/'.join([
+            self.simulation.directory, self.simulation.fields_filename
+        ])
+        streamed = np.load(fields_file, mmap_mode='r')
+        self.assertEqual(
+            streamed.shape,
+            (self.simulation.meshGenerator.mesh.nF, 1, 16)
+        )
+        self.assertTrue(
+            np.allclose(streamed.reshape(jSolution.shape), jSolution)
+        )
+
+        loaded = casingSimulations.utils.loadSimulationResults(
+            directory=self.simulation.directory, mmap_mode='r'
+        )
+        self.assertTrue(
+            np.allclose(loaded._fields[:, 'jSolution'], jSolution)
+        )
+
+    def test_frequency_transform(self):
+        stepped = self.simulation.run(save=False)[:, 'jSolution']
+
+        self.simulation.frequency_transform = True
+        result_hash = self.simulation.result_hash
+        self.simulation.transform_freqs_per_decade = 5
+        # the sampling of the frequencies changes the result
+        self.assertNotEqual(self.simulation.result_hash, result_hash)
+        transformed = self.simulation.run(save=False)[:, 'jSolution']
+
+        # same structure as the time-stepped fields, no time stepping
+        self.assertEqual(transformed.shape, stepped.shape)
+        self.assertTrue('factorization' in self.simulation.profile['phases'])
+        self.assertTrue('transform' in self.simulation.profile['phases'])
+        self.assertTrue(np.allclose(transformed[:, 0], stepped[:, 0]))
+
+        # backward Euler is only first order accurate in time, so the two
+        # agree roughly once the early-time transients have decayed
+        self.assertTrue(
+            np.linalg.norm(transformed[:, -1] - stepped[:, -1]) <
+            0.3 * np.linalg.norm(stepped[:, -1])
+        )
+
+    def test_checkpoint_resume(self):
+        self.simulation.checkpoint_steps = 5
+        checkpoint = '/'.join([
+            self.simulation.directory, self.simulation.checkpoint_filename
+        ])
+
+        # kill the run after the first checkpoint
+        prb = self.simulation.prob
+        getRHS = prb.getRHS
+
+        def getRHS_failing(tInd):
+            if tInd > 8:
+                raise RuntimeError('killed')
+            return getRHS(tInd)
+
+        prb.getRHS = getRHS_failing
+        with self.assertRaises(RuntimeError):
+            self.simulation.run(save=False)
+        del prb.getRHS
+
+        self.assertTrue(os.path.isfile(checkpoint))
+
+        fields = self.simulation.run(save=False, resume=True)
+        self.assertFalse(os.path.isfile(checkpoint))
+
+        # time steps 0 - 4 were loaded from the checkpoint
+        stats = self.simulation.factorization_stats
+        self.assertEqual(stats['factorizations'] + stats['reused'], 10)
+
+        fields_simpeg = prb.fields(self.simulation.physprops.model)
+        self.assertTrue(
+            np.allclose(fields[:, 'jSolution'], fields_simpeg[:, 'jSolution'])
+        )
+
+    def tearDown(self):
+        if os.path.isdir(self.directory):
+            shutil.rmtree(self.directory)
+
+
+class ForwardSimulationTestDC(unittest.TestCase):
+
+    directory = './simDC'
+
+    def setUp(self):
+        modelParameters = casing_in_wholespace()
+        meshGenerator = coarse_mesh(modelParameters)
+
+        # dipoles that share electrodes
+        electrodes = np.array([
+            [0., 0., -10.], [0., 0., -50.], [0., 0., -100.], [500., 0., 0.]
+        ])
+        pairs = [(0, 3), (1, 3), (2, 3), (0, 1), (1, 2), (0, 2)]
+        self.src_a = electrodes[[a for a, _ in pairs], :]
+        self.src_b = electrodes[[b for _, b in pairs], :]
+
+        self.modelParameters = modelParameters
+        self.meshGenerator = meshGenerator
+
+    def simulation(self, solve_poles):
+        return casingSimulations.run.SimulationDC(
+            modelParameters=self.modelParameters,
+            meshGenerator=self.meshGenerator,
+            src_a=self.src_a,
+            src_b=self.src_b,
+            solve_poles=solve_poles,
+            directory=self.directory
+        )
+
+    def test_solve_poles(self):
+        dipoles = self.simulation(solve_poles=False)
+        poles = self.simulation(solve_poles=True)
+
+        dipoles.run()
+        saved_dipoles = np.load('/'.join([self.directory, 'fieldsDC.npy']))
+        poles.run()
+        saved_poles = np.load('/'.join([self.directory, 'fieldsDC.npy']))
+
+        # one solve per unique electrode
+        self.assertEqual(poles.survey.nSrc, 4)
+        self.assertEqual(saved_dipoles.shape[1], 6)
+        self.assertEqual(saved_poles.shape[1], 4)
+
+        self.assertTrue(np.allclose(
+            poles.dipole_solution(), dipoles.dipole_solution()
+        ))
+
+    def tearDown(self):
+        if os.path.isdir(self.directory):
+            shutil.rmtree(self.directory)
+
+
 if __name__ == '__main__':
     unittest.main()
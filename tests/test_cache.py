@@ -0,0 +1,304 @@
+import unittest
+import numpy as np
+import scipy.sparse as sp
+import os
+import shutil
+
+import casingSimulations
+from casingSimulations.cache import (
+    LRUCache, ResultCache, MeshCache, OperatorCache, factorization_cache,
+    result_cache, mesh_cache, operator_cache, mesh_nbytes
+)
+
+from .utils import (
+    casing_in_wholespace, coarse_mesh, top_casing_src, casing_setup
+)
+
+
+class LRUCacheTest(unittest.TestCase):
+
+    def test_eviction(self):
+        cache = LRUCache(max_bytes=10)
+        cache.put('a', 'a', 4)
+        cache.put('b', 'b', 4)
+
+        # touch a so that b is the least recently used
+        self.assertEqual(cache.get('a'), 'a')
+        cache.put('c', 'c', 4)
+
+        self.assertTrue('a' in cache)
+        self.assertFalse('b' in cache)
+        self.assertTrue('c' in cache)
+        self.assertEqual(cache.nbytes, 8)
+
+    def test_too_large(self):
+        cache = LRUCache(max_bytes=10)
+        self.assertFalse(cache.put('a', 'a', 11))
+        self.assertEqual(len(cache), 0)
+        self.assertTrue(cache.get('a') is None)
+        self.assertEqual(cache.misses, 1)
+
+
+class FactorizationCacheTest(unittest.TestCase):
+
+    directory = './factorization_cache'
+
+    def setUp(self):
+        self.modelParameters = casing_in_wholespace(freqs=np.r_[0.5, 1.])
+        self.meshGenerator = coarse_mesh(self.modelParameters)
+
+    def simulation(self):
+        src = top_casing_src(self.modelParameters, self.meshGenerator)
+        return casingSimulations.run.SimulationFDEM(
+            modelParameters=self.modelParameters,
+            meshGenerator=self.meshGenerator,
+            src=src,
+            directory=self.directory,
+            cache_factorizations=True
+        )
+
+    def test_reuse(self):
+        factorization_cache.clear()
+
+        fields = self.simulation().run(save=False)
+        hits = factorization_cache.hits
+        self.assertEqual(len(factorization_cache), 2)
+
+        fields_reused = self.simulation().run(save=False)
+        self.assertEqual(factorization_cache.hits, hits + 2)
+
+        self.assertTrue(
+            np.allclose(fields[:, 'hSolution'], fields_reused[:, 'hSolution'])
+        )
+
+        factorization_cache.clear()
+        self.assertEqual(len(factorization_cache), 0)
+
+    def tearDown(self):
+        if os.path.isdir(self.directory):
+            shutil.rmtree(self.directory)
+
+
+class MeshCacheTest(unittest.TestCase):
+
+    directory = './mesh_cache'
+
+    def meshGenerator(self, sigma_back=1e-1):
+        return coarse_mesh(casing_in_wholespace(sigma_back=sigma_back))
+
+    def test_shared(self):
+        # a sigma sweep keeps the mesh, so the meshes are shared
+        meshGenerator = self.meshGenerator(sigma_back=1e-1)
+        other = self.meshGenerator(sigma_back=1e-2)
+        self.assertEqual(meshGenerator.mesh_hash, other.mesh_hash)
+        self.assertTrue(meshGenerator.mesh is other.mesh)
+        self.assertTrue(meshGenerator.mesh_hash in mesh_cache)
+
+        # operators computed once are available to all of the simulations
+        meshGenerator.mesh.aveF2CC
+        self.assertTrue(
+            getattr(other.mesh, '_aveF2CC', None) is not None
+        )
+
+        different = self.meshGenerator()
+        different.csz = 2.5
+        self.assertFalse(different.mesh is meshGenerator.mesh)
+
+    def test_eviction(self):
+        meshGenerator = self.meshGenerator()
+        mesh = meshGenerator._build_mesh()
+        # a new mesh holds its cell widths
+        self.assertTrue(mesh_nbytes(mesh) > 0)
+        cache = MeshCache(max_bytes=2 * mesh_nbytes(mesh))
+
+        mesh = cache.mesh(meshGenerator)
+        self.assertTrue(cache.mesh(meshGenerator) is mesh)
+        self.assertEqual(cache.hits, 1)
+
+        # the size of the mesh grows with the operators it computes
+        nbytes = cache.nbytes
+        mesh.faceDiv
+        self.assertTrue(cache.nbytes > nbytes)
+        cache.evict()
+        self.assertEqual(len(cache), 0)
+
+    def test_pinned(self):
+        # meshes over the budget are only shared while they are pinned
+        meshGenerator = self.meshGenerator()
+        cache = MeshCache(max_bytes=0.)
+        self.assertFalse(
+            cache.mesh(meshGenerator) is cache.mesh(meshGenerator)
+        )
+
+        pinned = cache.pin([meshGenerator])
+        self.assertTrue(meshGenerator.mesh_hash in cache)
+        self.assertTrue(
+            cache.mesh(meshGenerator) is cache.mesh(meshGenerator)
+        )
+
+        cache.unpin(pinned)
+        self.assertFalse(meshGenerator.mesh_hash in cache)
+
+    def test_persistence(self):
+        meshGenerator = self.meshGenerator()
+        cache = MeshCache(max_bytes=1e9, directory=self.directory)
+
+        mesh = cache.mesh(meshGenerator)
+        faceDiv = mesh.faceDiv
+        vol = mesh.vol
+        saved = cache.persist()
+        self.assertTrue('_faceDiv' in saved)
+        self.assertTrue('_vol' in saved)
+        self.assertEqual(cache.persist(), [])
+
+        # a new session loads the operators rather than computing them
+        cache = MeshCache(max_bytes=1e9, directory=self.directory)
+        mesh = cache.mesh(meshGenerator)
+        self.assertTrue(getattr(mesh, '_faceDiv', None) is not None)
+        self.assertTrue(abs(mesh.faceDiv - faceDiv).max() == 0)
+        self.assertTrue(np.all(mesh.vol == vol))
+
+    def tearDown(self):
+        if os.path.isdir(self.directory):
+            shutil.rmtree(self.directory)
+
+
+class OperatorCacheTest(unittest.TestCase):
+
+    directory = './operator_cache'
+
+    def test_store_restore(self):
+        class Problem(object):
+            pass
+
+        cache = OperatorCache(max_bytes=1e6)
+        prb = Problem()
+        prb.sigma, prb.mu = np.ones(10), np.ones(10)
+        prb._MeSigma = sp.eye(10).tocsr()
+        self.assertEqual(cache.store(prb, 'mesh'), ['_MeSigma'])
+
+        # only mu changed, so the sigma matrix is reused
+        other = Problem()
+        other.sigma, other.mu = np.ones(10), 2*np.ones(10)
+        self.assertEqual(cache.restore(other, 'mesh'), ['_MeSigma'])
+        self.assertTrue(other._MeSigma is prb._MeSigma)
+
+        other = Problem()
+        other.sigma, other.mu = 2*np.ones(10), np.ones(10)
+        self.assertEqual(cache.restore(other, 'mesh'), [])
+        self.assertEqual(cache.restore(prb, 'other mesh'), [])
+
+    def simulation(self, mur_casing, cache_operators=True):
+        modelParameters, meshGenerator, src = casing_setup(
+            freqs=np.r_[0.5], mur_casing=mur_casing
+        )
+        return casingSimulations.run.SimulationFDEM(
+            modelParameters=modelParameters,
+            meshGenerator=meshGenerator,
+            src=src,
+            directory=self.directory,
+            cache_factorizations=False,
+            cache_operators=cache_operators
+        )
+
+    def test_mu_sweep(self):
+        operator_cache.clear()
+        self.simulation(mur_casing=1.).run(save=False)
+        self.assertTrue(len(operator_cache) > 0)
+
+        # the h formulation assembles MfRho, which does not depend on mu
+        hits = operator_cache.hits
+        fields = self.simulation(mur_casing=100.).run(save=False)
+        self.assertTrue(operator_cache.hits > hits)
+
+        fields_assembled = self.simulation(
+            mur_casing=100., cache_operators=False
+        ).run(save=False)
+        self.assertTrue(
+            np.allclose(fields[:, 'hSolution'], fields_assembled[:, 'hSolution'])
+        )
+        operator_cache.clear()
+
+    def tearDown(self):
+        if os.path.isdir(self.directory):
+            shutil.rmtree(self.directory)
+
+
+class ResultCacheTest(unittest.TestCase):
+
+    directory = './result_cache'
+
+    def setUp(self):
+        if not os.path.isdir(self.directory):
+            os.mkdir(self.directory)
+
+    def test_eviction(self):
+        cache = ResultCache(directory=self.directory, max_bytes=2000)
+        a, b, c = [i*np.ones(100) for i in range(3)]
+
+        cache.put('a', a)
+        cache.put('b', b)
+        os.utime(cache.filename('a'), (0, 0))
+        os.utime(cache.filename('b'), (1, 1))
+
+        # touch a so that b is the least recently used
+        self.assertTrue(np.all(cache.get('a') == a))
+        cache.put('c', c)
+
+        self.assertTrue('a' in cache)
+        self.assertFalse('b' in cache)
+        self.assertTrue('c' in cache)
+        self.assertTrue(cache.get('b') is None)
+
+    def test_simulation(self):
+        modelParameters = casing_in_wholespace(freqs=np.r_[0.5])
+        meshGenerator = coarse_mesh(modelParameters)
+
+        def simulation(directory):
+            src = top_casing_src(modelParameters, meshGenerator)
+            return casingSimulations.run.SimulationFDEM(
+                modelParameters=modelParameters,
+                meshGenerator=meshGenerator,
+                src=src,
+                directory=directory,
+                use_result_cache=True,
+                cache_factorizations=False
+            )
+
+        cache_directory = result_cache.directory
+        result_cache.directory = os.path.sep.join([self.directory, 'cache'])
+        try:
+            sim = simulation(os.path.sep.join([self.directory, 'a']))
+            fields = sim.run()
+            self.assertTrue(sim.result_hash in result_cache)
+
+            # the same simulation in a different directory has the same hash
+            sim_cached = simulation(os.path.sep.join([self.directory, 'b']))
+            self.assertEqual(sim.result_hash, sim_cached.result_hash)
+            fields_cached = sim_cached.run()
+
+            self.assertTrue(
+                np.all(fields[:, 'h'] == fields_cached[:, 'h'])
+            )
+            self.assertTrue(
+                np.all(
+                    np.load(
+                        os.path.sep.join([sim_cached.directory, 'fields.npy'])
+                    ) == fields[:, 'hSolution']
+                )
+            )
+
+            # changing the model changes the hash
+            result_hash = sim.result_hash
+            modelParameters.sigma_back = 1e-2
+            self.assertNotEqual(sim.result_hash, result_hash)
+        finally:
+            result_cache.directory = cache_directory
+
+    def tearDown(self):
+        if os.path.isdir(self.directory):
+            shutil.rmtree(self.directory)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+import unittest
+import numpy as np
+import shutil
+
+import casingSimulations
+from casingSimulations.estimate import CostModel, estimate_summary
+
+from .utils import casing_setup
+
+
+class CostModelTest(unittest.TestCase):
+
+    def test_calibrate(self):
+        profiles = [
+            {
+                'system_size': n,
+                'phases': {
+                    'factorization': {
+                        'wall': 2 * 1e-6 * n**1.5, 'calls': 2,
+                        'rss_increase': 500. * n
+                    },
+                    'solve': {'wall': 1e-7 * n, 'calls': 1},
+                }
+            }
+            for n in [1e3, 1e4, 1e5]
+        ]
+        cost_model = CostModel().calibrate(profiles)
+
+        coefficient, exponent = cost_model.coefficients['factorization_time']
+        self.assertTrue(np.allclose([coefficient, exponent], [1e-6, 1.5]))
+        self.assertTrue(np.allclose(
+            cost_model.coefficients['factorization_memory'], [500., 1.]
+        ))
+        self.assertTrue(np.allclose(cost_model('solve_time', 1e6), 0.1))
+
+        # the memory of factorizations held at once is not added up
+        for profile in profiles:
+            profile['concurrent_factorizations'] = 2
+            profile['phases']['factorization']['rss_increase'] *= 2
+        cost_model = CostModel().calibrate(profiles)
+        self.assertTrue(np.allclose(
+            cost_model.coefficients['factorization_memory'], [500., 1.]
+        ))
+
+
+class SimulationEstimateTest(unittest.TestCase):
+
+    directory = './estimate'
+
+    def setUp(self):
+        self.modelParameters, self.meshGenerator, self.src = casing_setup(
+            freqs=np.r_[0.5, 1., 2.],
+            timeSteps=[(1e-4, 5), (1e-3, 5), (1e-4, 5)],
+        )
+
+    def test_estimateFDEM(self):
+        simulation = casingSimulations.run.SimulationFDEM(
+            modelParameters=self.modelParameters,
+            meshGenerator=self.meshGenerator,
+            src=self.src,
+            directory=self.directory
+        )
+        estimate = simulation.estimate()
+        mesh = self.meshGenerator.mesh
+
+        self.assertEqual(estimate['system_size'], mesh.nE)
+        self.assertEqual(estimate['n_factorizations'], 3)
+        self.assertEqual(estimate['n_sources'], 3)
+        self.assertTrue(estimate['factorization_time'] > 0)
+        self.assertTrue(len(estimate_summary(estimate)) > 0)
+
+        # the sparsity pattern bounds the assembled system
+        prb = simulation.prob
+        prb.model = simulation.physprops.model
+        A = prb.getA(0.5)
+        self.assertEqual(A.shape[0], estimate['system_size'])
+        self.assertTrue(A.nnz <= estimate['nnz'])
+
+    def test_estimateTDEM(self):
+        simulation = casingSimulations.run.SimulationTDEM(
+            modelParameters=self.modelParameters,
+            meshGenerator=self.meshGenerator,
+            src=self.src,
+            directory=self.directory
+        )
+        estimate = simulation.estimate()
+
+        self.assertEqual(
+            estimate['system_size'], self.meshGenerator.mesh.nF
+        )
+        self.assertEqual(estimate['n_factorizations'], 2)
+        self.assertEqual(estimate['n_solves'], 15)
+        self.assertEqual(estimate['n_times'], 16)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+import unittest
+import numpy as np
+import os
+import shutil
+
+import casingSimulations
+from casingSimulations.futures import (
+    SimulationExecutor, CancelledError, SubmissionError
+)
+
+from .utils import casing_in_wholespace, coarse_mesh, top_casing_src
+
+
+class SubmitTest(unittest.TestCase):
+
+    directory = './submit'
+
+    def setUp(self):
+        self.modelParameters = casing_in_wholespace(freqs=np.r_[0.5, 1.])
+        self.meshGenerator = coarse_mesh(self.modelParameters)
+        # each simulation makes its own directory, but not its parents
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+
+    def simulation(self, name):
+        src = top_casing_src(self.modelParameters, self.meshGenerator)
+        return casingSimulations.run.SimulationFDEM(
+            modelParameters=self.modelParameters,
+            meshGenerator=self.meshGenerator,
+            src=src,
+            directory='/'.join([self.directory, name])
+        )
+
+    def test_submit(self):
+        executor = SimulationExecutor(max_workers=2)
+        simulations = [self.simulation(name) for name in ['a', 'b', 'c']]
+        futures = [sim.submit(executor=executor) for sim in simulations]
+
+        # at most two run at once, the third waits
+        self.assertTrue(futures[2].state in ['pending', 'running'])
+        self.assertTrue(len(executor.running) <= 2)
+
+        for future in futures:
+            fields = future.result(timeout=600)
+            self.assertEqual(future.state, 'done')
+            self.assertEqual(future.progress()['fraction'], 1.)
+            self.assertEqual(future.progress()['solves'], 2)
+            self.assertEqual(future.profile['phases']['solve']['calls'], 2)
+            self.assertTrue(fields is future.simulation.fields())
+
+        # the same fields as a blocking run
+        sim = self.simulation('blocking')
+        sim.run()
+        self.assertTrue(np.allclose(
+            sim._solution(sim.fields()),
+            simulations[0]._solution(simulations[0].fields())
+        ))
+
+    def test_cancel(self):
+        executor = SimulationExecutor(max_workers=1)
+        running = self.simulation('a').submit(executor=executor)
+        pending = self.simulation('b').submit(executor=executor)
+
+        self.assertTrue(pending.cancel())
+        self.assertTrue(running.cancel())
+        self.assertTrue(pending.cancelled())
+        self.assertTrue(running.cancelled())
+        self.assertFalse(running.cancel())
+        self.assertRaises(CancelledError, running.result)
+
+    def test_failure(self):
+        executor = SimulationExecutor()
+        # run does not take this argument, so the run fails in the worker
+        future = self.simulation('a').submit(executor=executor, bogus=True)
+        self.assertRaises(SubmissionError, future.result, 600)
+        self.assertEqual(future.state, 'failed')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    unittest.main()
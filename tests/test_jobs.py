@@ -0,0 +1,133 @@
+import unittest
+import numpy as np
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+
+import casingSimulations
+from casingSimulations.jobs import JobQueue, DONE_MARKER, main
+
+from .utils import casing_setup
+
+
+class JobQueueTest(unittest.TestCase):
+
+    directory = './jobs'
+
+    def setUp(self):
+        modelParameters, meshGenerator, src = casing_setup(freqs=np.r_[0.5])
+
+        # two bundles of simulation parameters and one that fails
+        os.makedirs(self.directory)
+        for case in ['case0', 'case1']:
+            simulation = casingSimulations.run.SimulationFDEM(
+                modelParameters=modelParameters,
+                meshGenerator=meshGenerator,
+                src=src,
+                directory=os.path.sep.join([self.directory, case])
+            )
+            simulation.save()
+
+        broken = os.path.sep.join([self.directory, 'broken'])
+        os.makedirs(broken)
+        with open(os.path.sep.join([broken, 'simulation.py']), 'w') as f:
+            f.write("raise Exception('this simulation is broken')\n")
+
+        self.queue = JobQueue(
+            directory=os.path.sep.join([self.directory, '.casingQueue']),
+            workers=2,
+            max_retries=1,
+            poll_interval=0.1
+        )
+
+    def test_run(self):
+        self.assertEqual(len(self.queue.scan(self.directory)), 3)
+
+        # scanning again does not add the jobs twice
+        self.assertEqual(len(self.queue.scan(self.directory)), 0)
+
+        status = self.queue.run()
+        self.assertEqual(status['done'], 2)
+        self.assertEqual(status['failed'], 1)
+
+        for job in self.queue.jobs:
+            if job['kind'] == 'parameters':
+                self.assertTrue(os.path.isfile(
+                    os.path.sep.join([job['directory'], 'fields.npy'])
+                ))
+                self.assertTrue(self.queue.completed(job))
+            else:
+                self.assertFalse(self.queue.completed(job))
+                # the failed job was retried once
+                self.assertEqual(job['attempts'], 2)
+
+        # completed runs are skipped
+        self.queue.reset(statuses=['done'])
+        self.queue.run()
+        for job in self.queue.jobs:
+            if job['kind'] == 'parameters':
+                self.assertTrue(job['skipped'])
+                self.assertEqual(job['status'], 'done')
+
+    def test_partial_fields(self):
+        # a run that was killed after creating its fields file (e.g. a
+        # streamed run) is not complete
+        self.queue.scan(self.directory)
+        job = [
+            job for job in self.queue.jobs if job['kind'] == 'parameters'
+        ][0]
+        np.save(os.path.sep.join([job['directory'], 'fields.npy']), np.ones(3))
+        self.assertFalse(self.queue.completed(job))
+
+        with open(os.path.sep.join([job['directory'], DONE_MARKER]), 'w'):
+            pass
+        self.assertTrue(self.queue.completed(job))
+
+    def test_memory_cap(self):
+        # a cap far below the memory of a python process kills the jobs
+        self.queue.memory = 1e-3
+        self.queue.max_retries = 0
+        self.queue.scan(self.directory)
+        status = self.queue.run()
+        self.assertEqual(status['failed'], 3)
+        for job in self.queue.jobs:
+            self.assertFalse(self.queue.completed(job))
+
+    @unittest.skipIf(not hasattr(os, 'setsid'), "needs process sessions")
+    def test_recover(self):
+        # a job whose runner died while its process kept running
+        self.queue.scan(self.directory)
+        job = self.queue.jobs[0]
+        child = subprocess.Popen(
+            [sys.executable, '-c', 'import time; time.sleep(60)'],
+            preexec_fn=os.setsid
+        )
+        runner = subprocess.Popen([sys.executable, '-c', 'pass'])
+        runner.wait()
+        self.queue.update(
+            job, status='running', host=socket.gethostname(),
+            pid=child.pid, pgid=child.pid
+        )
+        with open(self.queue._job_file(job['id'], 'lock'), 'w') as f:
+            json.dump({'host': socket.gethostname(), 'pid': runner.pid}, f)
+
+        # the job's process is killed before the job is queued again
+        self.queue._recover()
+        self.assertEqual(child.wait(), -9)
+        job = [j for j in self.queue.jobs if j['id'] == job['id']][0]
+        self.assertEqual(job['status'], 'queued')
+
+    def test_cli(self):
+        main(['scan', self.directory])
+        main(['status', self.directory])
+        self.assertEqual(self.queue.status()['queued'], 3)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+import unittest
+import numpy as np
+import os
+import shutil
+import json
+
+import casingSimulations
+from casingSimulations.pipeline import Pipeline, PipelineError
+
+from .utils import casing_setup
+
+
+class PipelineTest(unittest.TestCase):
+
+    directory = './pipeline'
+
+    def setUp(self):
+        # three azimuthal cells put a cell center at the azimuth of the
+        # source wire, so that the wire runs along a single y-face
+        modelParameters, meshGenerator, src = casing_setup(
+            freqs=np.r_[0.5], mesh_kwargs=dict(hy=np.ones(3)/3.*2*np.pi)
+        )
+        self.simulation = casingSimulations.run.SimulationFDEM(
+            modelParameters=modelParameters,
+            meshGenerator=meshGenerator,
+            src=src,
+            directory=self.directory
+        )
+
+    def check(self, pipeline):
+        timing = pipeline.run()
+
+        self.assertEqual(
+            [stage['stage'] for stage in timing['stages']], ['3D', '2D', 'DC']
+        )
+        for stage in timing['stages']:
+            self.assertEqual(stage['status'], 'done')
+            self.assertTrue(os.path.isfile(stage['fields']))
+            self.assertTrue('phases' in stage['profile'])
+
+        with open(
+            os.path.sep.join([self.directory, pipeline.timing_filename])
+        ) as f:
+            self.assertEqual(len(json.load(f)['stages']), 3)
+
+    def test_serial(self):
+        pipeline = Pipeline.from_simulation(self.simulation)
+        self.check(pipeline)
+
+        # the 3D EM and DC stages share the mesh and physical properties
+        sim3D, sim2D, simDC = pipeline.simulations
+        self.assertTrue(sim3D.meshGenerator.mesh is simDC.meshGenerator.mesh)
+        self.assertTrue(sim3D.physprops is simDC.physprops)
+        self.assertFalse(sim3D.physprops is sim2D.physprops)
+        self.assertEqual(sim2D.meshGenerator.mesh.nCy, 1)
+
+    def test_parallel(self):
+        self.check(Pipeline.from_simulation(self.simulation, n_procs=3))
+
+    def test_failed_stage(self):
+        # an iterative solve that can not converge fails when it is run
+        failing = self.simulation.copy()
+        failing.solver = 'bicgstab'
+        failing.solver_opts = {'maxiter': 1, 'preconditioner': None}
+        failing.directory = os.path.sep.join([self.directory, 'failing'])
+        pipeline = Pipeline(
+            simulations=[self.simulation, failing], names=['good', 'failing'],
+            directory=self.directory
+        )
+        with self.assertRaises(PipelineError):
+            pipeline.run()
+
+        # the other stages still run and the report is saved
+        with open(
+            os.path.sep.join([self.directory, pipeline.timing_filename])
+        ) as f:
+            stages = json.load(f)['stages']
+        self.assertEqual(
+            [stage['status'] for stage in stages], ['done', 'failed']
+        )
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    unittest.main()
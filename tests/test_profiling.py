@@ -0,0 +1,71 @@
+import unittest
+import numpy as np
+import os
+import shutil
+import time
+
+import casingSimulations
+from casingSimulations.profiling import Profiler, load_profile
+
+from .utils import casing_setup
+
+
+class ProfilerTest(unittest.TestCase):
+
+    def test_phases(self):
+        profiler = Profiler()
+        for i in range(2):
+            with profiler.phase('sleep'):
+                time.sleep(0.01)
+        with profiler.phase('allocate'):
+            np.ones(int(1e6)).sum()
+
+        self.assertEqual(list(profiler.phases.keys()), ['sleep', 'allocate'])
+        self.assertEqual(profiler.phases['sleep']['calls'], 2)
+        self.assertTrue(profiler.phases['sleep']['wall'] >= 0.02)
+        self.assertTrue(profiler.phases['allocate']['cpu'] >= 0.)
+
+        profile = profiler.to_dict(nC=10)
+        self.assertEqual(profile['nC'], 10)
+        self.assertTrue(profile['total']['wall'] >= 0.02)
+
+
+class SimulationProfileTest(unittest.TestCase):
+
+    directory = './profiling'
+
+    def test_profile(self):
+        modelParameters, meshGenerator, src = casing_setup(
+            freqs=np.r_[0.5, 1.], mesh_kwargs=dict(csz=0.25)
+        )
+        simulation = casingSimulations.run.SimulationFDEM(
+            modelParameters=modelParameters,
+            meshGenerator=meshGenerator,
+            src=src,
+            directory=self.directory,
+            cache_factorizations=False
+        )
+        simulation.run()
+
+        profile = simulation.profile
+        for phase in [
+            'validation', 'mesh', 'physprops', 'sources', 'setup',
+            'assembly', 'factorization', 'solve', 'save'
+        ]:
+            self.assertTrue(phase in profile['phases'])
+        self.assertEqual(profile['phases']['factorization']['calls'], 2)
+        self.assertEqual(profile['nC'], meshGenerator.mesh.nC)
+
+        saved = load_profile(
+            '/'.join([self.directory, simulation.profile_filename])
+        )
+        self.assertEqual(
+            list(saved['phases'].keys()), list(profile['phases'].keys())
+        )
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+import unittest
+import numpy as np
+import shutil
+
+import casingSimulations
+from casingSimulations.reduced import ReducedOrderFDEM
+
+from .utils import casing_in_wholespace, coarse_mesh, top_casing_src
+
+
+class ReducedOrderTest(unittest.TestCase):
+
+    directory = './reduced'
+
+    def setUp(self):
+        self.modelParameters = casing_in_wholespace(freqs=np.r_[0.5, 1.])
+        self.meshGenerator = coarse_mesh(self.modelParameters)
+
+    def simulation(self, freqs):
+        modelParameters = self.modelParameters.copy()
+        modelParameters.freqs = freqs
+        src = top_casing_src(modelParameters, self.meshGenerator)
+        return casingSimulations.run.SimulationFDEM(
+            modelParameters=modelParameters,
+            meshGenerator=self.meshGenerator,
+            src=src,
+            directory=self.directory,
+            solver='superlu'
+        )
+
+    def test_sweep(self):
+        rom = ReducedOrderFDEM(
+            simulation=self.simulation(self.modelParameters.freqs),
+            freqs=np.logspace(-1, 2, 40),
+            tol=1e-6
+        ).build()
+
+        self.assertTrue(len(rom.solve_freqs) < 40)
+        self.assertTrue(rom.residual().max() <= 1e-6)
+
+        # compare with full solves at frequencies that were not solved
+        freqs = np.r_[0.3, 3., 30.]
+        full_fields = self.simulation(freqs).run(save=False)
+        full = full_fields[:, 'hSolution']
+        reduced = rom.fields(freqs)[:, 'hSolution']
+        self.assertTrue(
+            np.linalg.norm(reduced - full) < 1e-4 * np.linalg.norm(full)
+        )
+
+        # the casing currents are evaluated without the full fields
+        z, currents = rom.casing_currents(freqs)
+        self.assertEqual(currents.shape, (1, len(freqs), len(z)))
+        z_full, P = casingSimulations.physics.casing_current_operator(
+            self.meshGenerator.mesh, self.modelParameters
+        )['z']
+        currents_full = (P * full_fields[:, 'j']).T
+        self.assertTrue(np.allclose(z, z_full))
+        self.assertTrue(
+            np.linalg.norm(currents[0] - currents_full) <
+            1e-4 * np.linalg.norm(currents_full)
+        )
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    unittest.main()
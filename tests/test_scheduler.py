@@ -0,0 +1,125 @@
+import unittest
+import json
+import numpy as np
+import os
+import shutil
+
+import casingSimulations
+from casingSimulations.scheduler import Scheduler
+
+from .utils import casing_setup
+
+
+GB = 1024.**3
+
+
+class SchedulerTest(unittest.TestCase):
+
+    directory = './scheduler'
+
+    def setUp(self):
+        self.scheduler = Scheduler(
+            directory=os.path.sep.join([self.directory, '.casingQueue']),
+            total_memory=10.,
+            cores=4,
+            threads=1,
+        )
+
+    def job(self, name, memory, time=1.):
+        directory = os.path.sep.join([self.directory, name])
+        os.makedirs(directory)
+        job = self.scheduler.add(
+            os.path.sep.join([directory, 'simulationParameters.json'])
+        )
+        job['predicted_memory'] = memory * GB
+        job['predicted_time'] = time
+        return job
+
+    def test_packing(self):
+        big, medium, small, tiny = [
+            self.job(name, memory) for name, memory in
+            [('big', 7.), ('medium', 4.), ('small', 2.), ('tiny', 0.5)]
+        ]
+        pending = [tiny, small, medium, big]
+        self.scheduler._stale = False
+
+        # largest first, then fill in the memory that is left
+        selected = self.scheduler._select(pending, {})
+        self.assertEqual(
+            [job['id'] for job in selected], [big['id'], small['id'], tiny['id']]
+        )
+
+        # the medium job waits for the big one to finish
+        running = dict(
+            (job['id'], (job, None, None)) for job in selected
+        )
+        self.assertEqual(self.scheduler._select([medium], running), [])
+        running.pop(big['id'])
+        self.assertEqual(
+            self.scheduler._select([medium], running), [medium]
+        )
+
+    def test_cores(self):
+        pending = [self.job('job{}'.format(i), 0.1) for i in range(6)]
+        self.scheduler._stale = False
+        self.assertEqual(len(self.scheduler._select(pending, {})), 4)
+
+    def test_too_large(self):
+        job = self.job('huge', 20.)
+        self.scheduler._stale = False
+        self.assertEqual(self.scheduler._select([job], {}), [job])
+
+    def test_learn(self):
+        job = self.job('done', 1.)
+        profile = {
+            'simulation': 'SimulationFDEM',
+            'system_size': 1e4,
+            'total': {'wall': 10., 'cpu': 10., 'peak_rss': 2 * GB},
+            'phases': {
+                'factorization': {
+                    'wall': 4., 'cpu': 4., 'calls': 2, 'rss_increase': 1e9
+                },
+            },
+        }
+        with open(
+            os.path.sep.join([job['directory'], 'profile.json']), 'w'
+        ) as f:
+            json.dump(profile, f)
+        self.scheduler.update(job, status='done')
+
+        cost_model = self.scheduler.cost_models['SimulationFDEM']
+        self.assertAlmostEqual(cost_model('factorization_time', 1e4), 2.)
+
+        # a job that has been run before uses its own profile
+        job = self.scheduler.predict(job)
+        self.assertEqual(job['prediction'], 'profile')
+        self.assertEqual(job['predicted_memory'], 2 * GB)
+
+    def test_script_estimate(self):
+        # a bundle written by write_py has not run yet, so it has no
+        # simulationParameters.json
+        modelParameters, meshGenerator, src = casing_setup(freqs=np.r_[0.5])
+        simulation = casingSimulations.run.SimulationFDEM(
+            modelParameters=modelParameters,
+            meshGenerator=meshGenerator,
+            src=src,
+            directory=os.path.sep.join([self.directory, 'bundle'])
+        )
+        simulation.write_py()
+
+        job = self.scheduler.add(
+            os.path.sep.join([simulation.directory, 'simulation.py'])
+        )
+        job = self.scheduler.predict(job)
+        self.assertEqual(job['prediction'], 'estimate')
+        self.assertEqual(
+            job['estimate']['peak_memory'],
+            simulation.estimate()['peak_memory']
+        )
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+import unittest
+import numpy as np
+import shutil
+
+import casingSimulations
+from casingSimulations.physics import casing_currents, casing_current_operator
+from casingSimulations.sensitivity import (
+    casing_current_sensitivity, parameter_sensitivity
+)
+
+from .utils import casing_in_wholespace, coarse_mesh, top_casing_src
+
+
+class SensitivityTest(unittest.TestCase):
+
+    directory = './sensitivity'
+
+    def setUp(self):
+        self.modelParameters = casing_in_wholespace(freqs=np.r_[0.5, 1.])
+        self.meshGenerator = coarse_mesh(self.modelParameters)
+
+    def simulation(self, modelParameters):
+        src = top_casing_src(modelParameters, self.meshGenerator)
+        return casingSimulations.run.SimulationFDEM(
+            modelParameters=modelParameters,
+            meshGenerator=self.meshGenerator,
+            src=src,
+            directory=self.directory,
+            solver='superlu'
+        )
+
+    def test_operator(self):
+        sim = self.simulation(self.modelParameters)
+        fields = sim.run(save=False)
+        j = fields[:, 'j']
+        mesh = self.meshGenerator.mesh
+
+        operator = casing_current_operator(mesh, self.modelParameters)
+        # one column of j per frequency
+        for i in range(j.shape[1]):
+            currents = casing_currents(j[:, i], mesh, self.modelParameters)
+            for component in ['x', 'z']:
+                z, P = operator[component]
+                self.assertTrue(np.allclose(z, currents[component][0]))
+                self.assertTrue(
+                    np.allclose(P * j[:, i], currents[component][1])
+                )
+
+    def test_sigma_back(self):
+        sim = self.simulation(self.modelParameters)
+        blocks = list(casing_current_sensitivity(sim))
+        self.assertEqual(len(blocks), 2)
+        for block in blocks:
+            self.assertEqual(
+                block['sigma'].shape,
+                (1, len(block['z']), self.meshGenerator.mesh.nC)
+            )
+        dI_dsigma = parameter_sensitivity(sim, 'sigma_back')
+
+        # contracting the cell sensitivities gives the same result
+        step = 1e-3 * self.modelParameters.sigma_back
+        perturbed = self.modelParameters.copy()
+        perturbed.sigma_back += step
+        dm_dp = (
+            casingSimulations.model.PhysicalProperties(
+                self.meshGenerator, perturbed
+            ).model - sim.physprops.model
+        ) / step
+        for block in blocks:
+            self.assertTrue(np.allclose(
+                block['model'].dot(dm_dp), dI_dsigma[block['sources']]
+            ))
+
+        # central finite difference with two more runs
+        step = 1e-3 * self.modelParameters.sigma_back
+        currents = []
+        for sign in [1., -1.]:
+            modelParameters = self.modelParameters.copy()
+            modelParameters.sigma_back += sign * step
+            fields = self.simulation(modelParameters).run(save=False)
+            z, P = casing_current_operator(
+                self.meshGenerator.mesh, modelParameters
+            )['z']
+            currents.append((P * fields[:, 'j']).T)
+        finite_difference = (currents[0] - currents[1]) / (2 * step)
+
+        self.assertTrue(
+            np.linalg.norm(dI_dsigma - finite_difference) <
+            1e-3 * np.linalg.norm(finite_difference)
+        )
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,209 @@
+import unittest
+import numpy as np
+import scipy.sparse as sp
+import shutil
+import warnings
+
+import casingSimulations
+from casingSimulations.solvers import get_solver, available_solvers
+
+from .utils import casing_in_wholespace, coarse_mesh, top_casing_src
+
+
+def system(n=20):
+    """
+    complex, diagonally dominant system on an n x n grid, similar in
+    structure to a frequency domain operator
+    """
+    D = sp.diags([-np.ones(n-1), 2*np.ones(n), -np.ones(n-1)], [-1, 0, 1])
+    L = sp.kron(D, sp.identity(n)) + sp.kron(sp.identity(n), D)
+    return (L + 1j*sp.identity(n**2)).tocsr()
+
+
+class SolverTest(unittest.TestCase):
+
+    def setUp(self):
+        self.A = system()
+        self.b = np.random.rand(self.A.shape[0], 2)
+
+    def check(self, Solver, rtol=1e-6, **kwargs):
+        Ainv = Solver(self.A, **kwargs)
+        x = Ainv * self.b
+        self.assertTrue(x.shape == self.b.shape)
+        self.assertTrue(
+            np.linalg.norm(self.A * x - self.b) <
+            rtol * np.linalg.norm(self.b)
+        )
+
+        x0 = Ainv * self.b[:, 0]
+        self.assertTrue(x0.shape == self.b[:, 0].shape)
+        self.assertTrue(np.allclose(x0, x[:, 0]))
+        Ainv.clean()
+
+    def test_superlu(self):
+        for ordering in ['COLAMD', 'MMD_AT_PLUS_A', 'NATURAL']:
+            self.check(get_solver('superlu'), rtol=1e-10, ordering=ordering)
+
+    def test_iterative(self):
+        for name in ['bicgstab', 'gmres']:
+            for preconditioner in ['ilu', 'block_jacobi', 'jacobi']:
+                self.check(
+                    get_solver(name), rtol=1e-6, preconditioner=preconditioner,
+                    block_size=50
+                )
+
+    def test_not_converged(self):
+        Solver = get_solver('bicgstab')
+        Ainv = Solver(self.A, maxiter=1, preconditioner=None)
+        self.assertRaises(
+            casingSimulations.solvers.ConvergenceError, Ainv.__mul__, self.b
+        )
+        Ainv = Solver(
+            self.A, maxiter=1, preconditioner=None, raise_on_failure=False
+        )
+        with warnings.catch_warnings(record=True) as w:
+            warnings.simplefilter('always')
+            Ainv * self.b[:, 0]
+        self.assertTrue(len(w) > 0)
+
+    def test_perturbation(self):
+        # perturb the diagonal in a few rows
+        A0 = self.A
+        rows = np.r_[10, 11, 12, 50]
+        dA = sp.csr_matrix(
+            (2.*np.ones(len(rows)), (rows, rows)), shape=A0.shape
+        )
+        A = A0 + dA
+        A0inv = get_solver('superlu')(A0)
+
+        self.assertTrue(np.all(
+            casingSimulations.solvers.perturbation_rows(A, A0) == rows
+        ))
+
+        woodbury = casingSimulations.solvers.Woodbury(A, A0inv, A0)
+        self.assertEqual(woodbury.rank, len(rows))
+        gmres = casingSimulations.solvers.PerturbationGMRES(A, A0inv)
+
+        for Ainv in [woodbury, gmres]:
+            x = Ainv * self.b
+            self.assertTrue(x.shape == self.b.shape)
+            self.assertTrue(
+                np.linalg.norm(A * x - self.b) < 1e-8 * np.linalg.norm(self.b)
+            )
+            Ainv.clean()
+
+        # at most rank + 1 iterations with the factorization of A0
+        self.assertTrue(max(gmres.iterations) <= len(rows) + 1)
+
+        # a perturbation that changes no rows is solved with A0 alone
+        woodbury = casingSimulations.solvers.Woodbury(A0, A0inv, A0)
+        self.assertEqual(woodbury.rank, 0)
+        self.assertEqual(woodbury.nbytes, 0.)
+        x = woodbury * self.b
+        self.assertTrue(
+            np.linalg.norm(A0 * x - self.b) < 1e-8 * np.linalg.norm(self.b)
+        )
+        A0inv.clean()
+
+    def test_unknown(self):
+        self.assertTrue('superlu' in available_solvers())
+        self.assertRaises(KeyError, get_solver, 'not-a-solver')
+        self.assertRaises(
+            ValueError, get_solver('superlu'), self.A, ordering='not-an-ordering'
+        )
+
+
+class SimulationSolverTest(unittest.TestCase):
+
+    directory = './solvers'
+
+    def setUp(self):
+        self.modelParameters = casing_in_wholespace(freqs=np.r_[0.5])
+        self.meshGenerator = coarse_mesh(self.modelParameters, csz=0.25)
+
+    def test_superlu(self):
+        src = top_casing_src(self.modelParameters, self.meshGenerator)
+
+        fields = {}
+        for solver, solver_opts in [
+            ('superlu', {'ordering': 'COLAMD'}),
+            ('superlu', {'ordering': 'MMD_AT_PLUS_A'}),
+        ]:
+            simulation = casingSimulations.run.SimulationFDEM(
+                modelParameters=self.modelParameters,
+                meshGenerator=self.meshGenerator,
+                src=src,
+                directory=self.directory,
+                solver=solver,
+                solver_opts=solver_opts,
+                cache_factorizations=False
+            )
+            self.assertTrue(
+                simulation.prob.Solver is casingSimulations.solvers.SuperLU
+            )
+            fields[solver_opts['ordering']] = simulation.run(save=False)[
+                :, 'hSolution'
+            ]
+
+        self.assertTrue(np.allclose(fields['COLAMD'], fields['MMD_AT_PLUS_A']))
+
+    def test_flaw_perturbation(self):
+        modelParameters = casingSimulations.model.FlawedCasingInHalfspace(
+            src_a=np.r_[0., np.pi, 0.],
+            src_b=np.r_[1e3, np.pi, 0.],
+            freqs=np.r_[0.5, 1.],
+            flaw_r=np.r_[0., 1.],
+            flaw_z=np.r_[-200., -190.],
+            sigma_flaw=1e2,
+        )
+        meshGenerator = coarse_mesh(modelParameters)
+        src = top_casing_src(modelParameters, meshGenerator)
+        self.assertTrue(
+            type(modelParameters.baseline()) is
+            casingSimulations.model.CasingInHalfspace
+        )
+
+        fields = {}
+        for perturbation in [None, 'woodbury', 'iterative']:
+            kwargs = {}
+            if perturbation is not None:
+                kwargs['perturbation'] = perturbation
+            simulation = casingSimulations.run.SimulationFDEM(
+                modelParameters=modelParameters,
+                meshGenerator=meshGenerator,
+                src=src,
+                directory=self.directory,
+                solver='superlu',
+                cache_factorizations=True,
+                **kwargs
+            )
+            fields[perturbation] = simulation.run(save=False)[
+                :, 'hSolution'
+            ]
+            if perturbation is not None:
+                phases = simulation.profile['phases']
+                self.assertTrue('perturbation' in phases)
+
+                # the accuracy of the perturbation solve changes the result
+                result_hash = simulation.result_hash
+                simulation.perturbation_tol = 1e-4
+                self.assertNotEqual(simulation.result_hash, result_hash)
+
+        # the baseline is only factored once per frequency
+        self.assertEqual(
+            simulation.profile['phases'].get(
+                'factorization', {'calls': 0}
+            )['calls'], 0
+        )
+        for perturbation in ['woodbury', 'iterative']:
+            self.assertTrue(np.allclose(
+                fields[perturbation], fields[None], rtol=1e-6,
+                atol=1e-6 * np.abs(fields[None]).max()
+            ))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    unittest.main()
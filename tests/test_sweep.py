@@ -0,0 +1,64 @@
+import unittest
+import numpy as np
+import os
+import shutil
+import json
+
+import casingSimulations
+
+from .utils import casing_setup
+
+
+class ParameterSweepTest(unittest.TestCase):
+
+    directory = './sweep'
+
+    def setUp(self):
+        modelParameters, meshGenerator, src = casing_setup(freqs=np.r_[0.5])
+
+        self.simulation = casingSimulations.run.SimulationFDEM(
+            modelParameters=modelParameters,
+            meshGenerator=meshGenerator,
+            src=src,
+            directory=self.directory
+        )
+
+    def test_sweep(self):
+        sweep = casingSimulations.sweep.ParameterSweep(
+            simulation=self.simulation,
+            parameters={
+                'sigma_back': [1e-1, 1e-2],
+                'mur_casing': [1., 100.],
+            },
+            directory=self.directory,
+            n_procs=2
+        )
+
+        self.assertEqual(len(sweep.cases), 4)
+
+        summary = sweep.run()
+
+        self.assertEqual(len(summary), 4)
+        # only sigma and mu change, so all of the runs share a mesh
+        self.assertEqual(len(set(case['mesh'] for case in summary)), 1)
+
+        for case in summary:
+            self.assertEqual(case['status'], 'done')
+            self.assertTrue(os.path.isfile(case['fields']))
+
+        with open(
+            os.path.sep.join([self.directory, sweep.summary_filename])
+        ) as f:
+            self.assertEqual(len(json.load(f)), 4)
+
+        # the overrides are applied to each of the runs
+        fields = [np.load(case['fields']) for case in summary]
+        self.assertFalse(np.allclose(fields[0], fields[-1]))
+
+    def tearDown(self):
+        if os.path.isdir(self.directory):
+            shutil.rmtree(self.directory)
+
+
+if __name__ == '__main__':
+    unittest.main()
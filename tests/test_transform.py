@@ -0,0 +1,39 @@
+import unittest
+import numpy as np
+
+from casingSimulations.transform import (
+    transform_frequencies, step_off_operator, step_off_response
+)
+
+
+class TransformTest(unittest.TestCase):
+
+    def test_relaxation(self):
+        # F(w) = 1 / (1 + iw tau) has the step-off response exp(-t / tau)
+        tau = 1e-3
+        times = np.logspace(-5, -2, 20)
+        freqs = transform_frequencies(times, n_per_decade=10)
+        w = 2 * np.pi * freqs
+        F = 1. / (1. + 1j * w * tau)
+
+        response = step_off_response(freqs, F, times)
+        self.assertEqual(response.shape, times.shape)
+        self.assertTrue(
+            np.allclose(response, np.exp(-times / tau), atol=1e-3)
+        )
+
+        # the response is computed column by column
+        F2 = np.vstack([F, 2 * F]).T
+        response2 = step_off_response(freqs, F2, times)
+        self.assertEqual(response2.shape, (len(times), 2))
+        self.assertTrue(np.allclose(response2[:, 1], 2 * response))
+
+    def test_inputs(self):
+        self.assertRaises(ValueError, transform_frequencies, np.r_[0., 1.])
+        self.assertRaises(
+            ValueError, step_off_operator, np.r_[1., 2., 3.], np.r_[1.]
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,61 @@
+"""
+Shared setup for the tests: a casing in a whole space, excited by a source
+at the top of the casing, on a coarse cylindrical mesh.
+"""
+import numpy as np
+import casingSimulations
+
+
+def casing_in_wholespace(**kwargs):
+    """
+    CasingInWholespace model with the source electrodes at the top of the
+    casing and 1 km away. Any model parameter can be passed to override the
+    defaults.
+    """
+    kwargs.setdefault('src_a', np.r_[0., np.pi, 0.])
+    kwargs.setdefault('src_b', np.r_[1e3, np.pi, 0.])
+    kwargs.setdefault('sigma_back', 1e-1)
+    return casingSimulations.model.CasingInWholespace(**kwargs)
+
+
+def coarse_mesh(modelParameters, **kwargs):
+    """
+    Cylindrical mesh generator with few padding cells and coarse vertical
+    cells. Any mesh parameter can be passed to override the defaults.
+
+    :param casingSimulations.model.CasingInWholespace modelParameters: model
+    """
+    kwargs.setdefault('npadx', 8)
+    kwargs.setdefault('npadz', 19)
+    kwargs.setdefault('csz', 5.)
+    return casingSimulations.CasingMeshGenerator(
+        modelParameters=modelParameters, **kwargs
+    )
+
+
+def top_casing_src(modelParameters, meshGenerator):
+    """
+    Source at the top of the casing
+
+    :param casingSimulations.model.CasingInWholespace modelParameters: model
+    :param casingSimulations.CasingMeshGenerator meshGenerator: mesh
+    """
+    return casingSimulations.sources.TopCasingSrc(
+        modelParameters=modelParameters,
+        meshGenerator=meshGenerator,
+    )
+
+
+def casing_setup(mesh_kwargs=None, **kwargs):
+    """
+    Model, mesh generator and source used by most of the simulation tests
+
+    :param dict mesh_kwargs: mesh parameters that override the defaults of
+                             :code:`coarse_mesh`
+    :rtype: tuple
+    :return: modelParameters, meshGenerator, src
+    """
+    modelParameters = casing_in_wholespace(**kwargs)
+    meshGenerator = coarse_mesh(modelParameters, **(mesh_kwargs or {}))
+    src = top_casing_src(modelParameters, meshGenerator)
+    return modelParameters, meshGenerator, src